@@ -0,0 +1,91 @@
+import logging
+import os
+from difflib import SequenceMatcher
+from pathlib import Path
+from time import perf_counter
+
+os.chdir(Path(__file__).parent.parent)
+
+import utilities.utils as utils
+from main import SubtitleExtractor, setup_ocr
+from utilities.logger_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ch_vid = "test files/chinese_vid.mp4"
+ch_vid_srt = Path("test files/chinese_vid.srt")
+ch_vid_sub_area = (288, 958, 1632, 1044)
+thresholds = (0.0, 0.0005, 0.001, 0.002, 0.005, 0.01)
+
+
+def timecode_to_ms(timecode: str) -> float:
+    """
+    Convert a srt timecode to milliseconds.
+    """
+    hms, milliseconds = timecode.split(",")
+    hours, minutes, seconds = hms.split(":")
+    return (int(hours) * 3600 + int(minutes) * 60 + int(seconds)) * 1000 + int(milliseconds)
+
+
+def read_srt(srt_file: Path) -> list:
+    """
+    Read the lines of a srt file.
+    :return: The start and end in milliseconds and the text of each subtitle line.
+    """
+    lines = []
+    for block in srt_file.read_text(encoding="utf-8").strip().split("\n\n"):
+        _, timing, *text = block.split("\n")
+        start, end = timing.split(" --> ")
+        lines.append((timecode_to_ms(start), timecode_to_ms(end), "\n".join(text)))
+    return lines
+
+
+def compare_subtitles(lines: list, reference_lines: list) -> tuple:
+    """
+    Compare subtitle lines with the reference subtitle lines.
+    :return: The similarity of all the texts, the number of lines with equal texts in the same order and
+    the mean difference in milliseconds of the start and end times of the equal lines.
+    """
+    texts, reference_texts = [line[2] for line in lines], [line[2] for line in reference_lines]
+    text_similarity = SequenceMatcher(a="".join(texts), b="".join(reference_texts), autojunk=False).ratio()
+    timing_diffs = []
+    for block in SequenceMatcher(a=texts, b=reference_texts, autojunk=False).get_matching_blocks():
+        for i in range(block.size):
+            line, reference_line = lines[block.a + i], reference_lines[block.b + i]
+            timing_diffs.append(abs(line[0] - reference_line[0]) + abs(line[1] - reference_line[1]))
+    mean_timing_diff = sum(timing_diffs) / len(timing_diffs) / 2 if timing_diffs else 0.0
+    return text_similarity, len(timing_diffs), mean_timing_diff
+
+
+def main() -> None:
+    """
+    Extract the subtitle of the test video with different frame change thresholds and compare the number of ocr calls
+    and the accuracy of the generated subtitles against the reference subtitle.
+    """
+    reference_lines = read_srt(ch_vid_srt)
+    results = []
+    for threshold in thresholds:
+        utils.Config.frame_change_threshold = threshold  # Only changed in memory, the config file is not changed.
+        sub_ex = SubtitleExtractor()
+        start = perf_counter()
+        srt_file = sub_ex.run_extraction(ch_vid, ch_vid_sub_area)
+        duration = perf_counter() - start
+        lines = read_srt(srt_file) if srt_file else []
+        if srt_file:
+            srt_file.unlink()
+            srt_file.with_name(f"{srt_file.stem} timings.json").unlink(missing_ok=True)
+        frames, ocr_calls = sub_ex.text_extraction_counts["frames"], sub_ex.text_extraction_counts["ocr_calls"]
+        similarity, equal_lines, timing_diff = compare_subtitles(lines, reference_lines)
+        results.append(f"{threshold:<10} {frames:>7} {ocr_calls:>9} {1 - ocr_calls / frames:>7.1%} {duration:>8.1f}s "
+                       f"{similarity:>10.4f} {equal_lines:>4}/{len(reference_lines):<4} {timing_diff:>9.1f}ms "
+                       f"{lines == reference_lines}")
+    utils.Config.load_config()
+    header = (f"{'Threshold':<10} {'Frames':>7} {'OCR Calls':>9} {'Saved':>7} {'Time':>9} {'Similarity':>10} "
+              f"{'Equal Lines':>9} {'Timing':>11} Exact")
+    logger.info("Frame change threshold benchmark results:\n" + "\n".join([header, *results]))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    setup_ocr()
+    main()
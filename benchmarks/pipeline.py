@@ -0,0 +1,261 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+os.chdir(Path(__file__).parent.parent)
+
+import utilities.utils as utils
+from benchmarks.frame_change_threshold import compare_subtitles, read_srt
+from benchmarks.synthetic_video import render_video, video_spec
+from utilities.logger_setup import setup_logging
+from utilities.ocr_backends import ocr_backends
+
+logger = logging.getLogger(__name__)
+
+video_dir = Path("benchmarks/videos")
+results_dir = Path("benchmarks/results")
+# The ocr cache would return the texts of the previous cases, so it is disabled unless a case turns it on.
+# The lines of the ground truth subtitles are separated by line breaks.
+default_settings = {"ocr_cache_max_entries": 0, "keep_ocr_results": False, "line_break": True}
+# The synthetic videos and the settings of each case of a matrix.
+matrices = {
+    "quick": [
+        (video_spec("static 720p", duration=20), {}),
+        (video_spec("static 720p", duration=20), {"frame_extraction_frequency": 5, "frame_accurate_timing": True}),
+        (video_spec("noise 720p", duration=20, motion="noise", seed=1), {}),
+        (video_spec("static 720p", duration=20), {"ocr_backend": "fake"}),
+        (video_spec("noise 720p", duration=20, motion="noise", seed=1), {"ocr_backend": "fake"}),
+    ],
+    "full": [
+        (video_spec("static 720p", duration=60), {}),
+        (video_spec("static 720p", duration=60), {"frame_extraction_frequency": 5, "frame_accurate_timing": True}),
+        (video_spec("static 720p", duration=60), {"recognition_only": True}),
+        (video_spec("static 720p", duration=60), {"stream_subtitles": False}),
+        (video_spec("static 720p", duration=60), {"frame_change_threshold": 0.001, "text_edge_threshold": 0.0005}),
+        (video_spec("pan 720p", duration=60, motion="pan", seed=1), {}),
+        (video_spec("noise 720p", duration=60, motion="noise", seed=2), {}),
+        (video_spec("cuts 720p", duration=60, motion="cuts", seed=3), {}),
+        (video_spec("dense two lines 720p", duration=60, subtitle_density=0.95, min_sub_duration=0.5,
+                    max_sub_duration=2.0, two_line_ratio=0.5, font="duplex", seed=4), {}),
+        (video_spec("static 1080p", width=1920, height=1080, duration=60, font="triplex", seed=5), {}),
+        (video_spec("static 480p 30fps", width=854, height=480, fps=30.0, duration=60, seed=6), {}),
+        # The fake ocr backend leaves the time of everything around the ocr.
+        (video_spec("static 720p", duration=60), {"ocr_backend": "fake"}),
+        (video_spec("static 720p", duration=60), {"ocr_backend": "fake", "frame_extraction_frequency": 5,
+                                                  "frame_accurate_timing": True}),
+        (video_spec("noise 720p", duration=60, motion="noise", seed=2), {"ocr_backend": "fake"}),
+        (video_spec("static 1080p", width=1920, height=1080, duration=60, font="triplex", seed=5),
+         {"ocr_backend": "fake"}),
+    ],
+}
+
+
+def peak_rss_mb() -> tuple[float | None, float | None]:
+    """
+    The peak resident memory of the process and of its largest ended child process, e.g. a pool process.
+    :return: The peak memory in MB of the process and the child. None when it can not be measured on the system.
+    """
+    try:
+        import resource
+    except ImportError:  # Not available on Windows.
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # The size is in bytes on macOS and in KB on Linux.
+    return tuple(round(resource.getrusage(who).ru_maxrss / scale, 1)
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def area_iou(area1: tuple, area2: tuple) -> float:
+    """
+    The intersection over union of two areas.
+    """
+    width = min(area1[2], area2[2]) - max(area1[0], area2[0])
+    height = min(area1[3], area2[3]) - max(area1[1], area2[1])
+    intersection = max(width, 0) * max(height, 0)
+    union = sum((area[2] - area[0]) * (area[3] - area[1]) for area in (area1, area2)) - intersection
+    return intersection / union if union else 0.0
+
+
+def area_contains(area: tuple, inner_area: tuple) -> bool:
+    return area[0] <= inner_area[0] and area[1] <= inner_area[1] and area[2] >= inner_area[2] and \
+        area[3] >= inner_area[3]
+
+
+def run_case(case: dict) -> dict:
+    """
+    Detect the sub area of the video of a case and extract its subtitle, in a new process for the case so the memory
+    and ocr pools of the cases are separate.
+    :return: The throughput, counts, stage timings, memory and accuracy of the case.
+    """
+    from main import SubtitleDetector, SubtitleExtractor, setup_ocr
+    from utilities.frames_to_text import shutdown_ocr_pool, warm_ocr_pool
+    from utilities.video_to_frames import shutdown_frame_pool
+
+    video, settings = case["video"], default_settings | case["settings"]
+    result = {"name": case["name"], "video": video["spec"], "settings": settings}
+    with utils.Config.snapshot(settings):
+        if utils.Config.ocr_backend == "fake":  # The fake backend decodes the subtitle lines drawn in the video.
+            utils.Config.set_values({"ocr_opts": utils.Config.ocr_opts | {"canned_texts": video["ocr_texts"]}})
+        setup_ocr()
+        start = perf_counter()
+        warm_ocr_pool()  # The models are loaded once per pool, it is not part of the time of the extraction.
+        result["ocr_load_s"] = round(perf_counter() - start, 3)
+
+        start = perf_counter()
+        sub_area = SubtitleDetector(video["video"], True).get_sub_area()
+        result["detection"] = {"time_s": round(perf_counter() - start, 3), "sub_area": sub_area,
+                               "iou": round(area_iou(sub_area, video["sub_area"]), 4) if sub_area else 0.0,
+                               "contains_text": bool(sub_area) and area_contains(sub_area, video["text_area"])}
+
+        sub_ex = SubtitleExtractor()
+        start = perf_counter()
+        srt_file = sub_ex.run_extraction(video["video"], tuple(video["sub_area"]))
+        duration = perf_counter() - start
+        lines = read_srt(srt_file) if srt_file else []
+        reference_lines = read_srt(Path(video["srt"]))
+        similarity, equal_lines, timing_diff = compare_subtitles(lines, reference_lines)
+        frames = sub_ex.text_extraction_counts.get("frames", 0)
+        result["extraction"] = {"time_s": round(duration, 3), "frames": frames,
+                                "frames_per_s": round(frames / duration, 1) if duration else None,
+                                "ocr_calls": sub_ex.text_extraction_counts.get("ocr_calls", 0),
+                                "text_extraction_counts": sub_ex.text_extraction_counts,
+                                "text_similarity": round(similarity, 4), "equal_lines": equal_lines,
+                                "reference_lines": len(reference_lines), "mean_timing_diff_ms": round(timing_diff, 1),
+                                "stages": sub_ex.stage_timer.report()}
+        report_path = srt_file or Path(video["video"]).with_suffix(".srt")
+        for path in (srt_file, report_path.with_name(f"{report_path.stem} timings.json"),
+                     report_path.with_name(f"{report_path.stem} trace.json")):
+            if path and path.exists():
+                path.unlink()
+        shutdown_ocr_pool()  # The pools are stopped so their memory is in the peak of the child processes.
+        shutdown_frame_pool()
+    result["peak_rss_mb"], result["peak_child_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def commit_info() -> tuple[str, bool]:
+    """
+    The short hash of the commit of the benchmarked code and whether the code has uncommitted changes.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def case_line(result: dict) -> str:
+    if "error" in result:
+        return f"{result['name']:<48} Failed: {result['error']}"
+    extraction, detection = result["extraction"], result["detection"]
+    rss = f"{result['peak_rss_mb']:,.0f}/{result['peak_child_rss_mb']:,.0f}MB" if result["peak_rss_mb"] else "-"
+    return (f"{result['name']:<48} {extraction['frames']:>7} {extraction['time_s']:>8.1f}s "
+            f"{extraction['frames_per_s'] or 0:>9.1f} {extraction['ocr_calls']:>9} "
+            f"{extraction['text_similarity']:>10.4f} {extraction['equal_lines']:>4}/{extraction['reference_lines']:<4} "
+            f"{extraction['mean_timing_diff_ms']:>8.1f}ms {detection['time_s']:>7.1f}s {detection['iou']:>6.3f} "
+            f"{rss:>13}")
+
+
+def results_table(results: list[dict]) -> str:
+    header = (f"{'Case':<48} {'Frames':>7} {'Time':>9} {'Frames/s':>9} {'OCR Calls':>9} {'Similarity':>10} "
+              f"{'Equal Lines':>9} {'Timing':>10} {'Detect':>8} {'IoU':>6} {'Peak RSS':>13}")
+    return "\n".join([header, *map(case_line, results)])
+
+
+def run_matrix(matrix: str, name_filter: str = None, ocr_backend: str = None) -> Path:
+    """
+    Render the videos of the matrix and run each case in its own process.
+    :param ocr_backend: the ocr backend of every case instead of the backend of the case.
+    :return: The path of the saved results.
+    """
+    results_dir.mkdir(parents=True, exist_ok=True)
+    case_file, result_file = results_dir / "case.json", results_dir / "case result.json"
+    results = []
+    for video, settings in matrices[matrix]:
+        settings = settings | {"ocr_backend": ocr_backend} if ocr_backend else settings
+        name = f"{video['name']} {json.dumps(settings, sort_keys=True)}" if settings else video["name"]
+        if name_filter and name_filter not in name:
+            continue
+        case = {"name": name, "video": render_video(video, video_dir), "settings": settings}
+        case_file.write_text(json.dumps(case, ensure_ascii=False), encoding="utf-8")
+        result_file.unlink(missing_ok=True)
+        logger.info(f"Running benchmark case: {name}")
+        process = subprocess.run([sys.executable, "-m", "benchmarks.pipeline", "case", str(case_file),
+                                  str(result_file)])
+        if process.returncode == 0 and result_file.exists():
+            results.append(json.loads(result_file.read_text(encoding="utf-8")))
+        else:
+            results.append({"name": name, "error": f"exit code {process.returncode}"})
+    case_file.unlink(missing_ok=True)
+    result_file.unlink(missing_ok=True)
+
+    commit, dirty = commit_info()
+    run = {"matrix": matrix, "commit": commit, "dirty": dirty, "date": datetime.now().isoformat(timespec="seconds"),
+           "machine": {"system": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(),
+                       "python": platform.python_version()},
+           "cases": results}
+    save_path = results_dir / f"{datetime.now():%Y-%m-%d %H-%M-%S} {commit}{' dirty' if dirty else ''}.json"
+    save_path.write_text(json.dumps(run, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Pipeline benchmark results saved. Path: {save_path}\n{results_table(results)}")
+    return save_path
+
+
+def compare_runs(old_path: Path, new_path: Path) -> str:
+    """
+    Compare the frames per second, ocr calls and accuracy of the cases of two saved runs.
+    """
+    old_run, new_run = (json.loads(path.read_text(encoding="utf-8")) for path in (old_path, new_path))
+    old_cases = {case["name"]: case for case in old_run["cases"] if "error" not in case}
+    lines = [f"Old: {old_run['commit']} {old_run['date']}, New: {new_run['commit']} {new_run['date']}",
+             f"{'Case':<48} {'Old Frames/s':>12} {'New Frames/s':>12} {'Change':>8} {'OCR Calls':>15} "
+             f"{'Similarity':>17} {'Peak RSS':>15}"]
+    for case in new_run["cases"]:
+        if "error" in case or case["name"] not in old_cases:
+            continue
+        old, new = old_cases[case["name"]], case
+        old_fps, new_fps = old["extraction"]["frames_per_s"] or 0, new["extraction"]["frames_per_s"] or 0
+        change = f"{new_fps / old_fps - 1:>+8.1%}" if old_fps else f"{'-':>8}"
+        rss = f"{old['peak_rss_mb'] or 0:,.0f}->{new['peak_rss_mb'] or 0:,.0f}MB"
+        lines.append(f"{case['name']:<48} {old_fps:>12.1f} {new_fps:>12.1f} {change} "
+                     f"{old['extraction']['ocr_calls']:>7}->{new['extraction']['ocr_calls']:<7} "
+                     f"{old['extraction']['text_similarity']:.4f}->{new['extraction']['text_similarity']:.4f} "
+                     f"{rss:>15}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End to end throughput and accuracy benchmark of subtitle detection "
+                                                 "and extraction on synthetic videos.")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="run the cases of a matrix and save the results")
+    run_parser.add_argument("matrix", nargs="?", choices=matrices, default="quick")
+    run_parser.add_argument("-k", "--filter", help="only run the cases with this text in their name")
+    run_parser.add_argument("-b", "--ocr-backend", choices=ocr_backends, help="use this ocr backend in every case")
+    compare_parser = subparsers.add_parser("compare", help="compare the results of two runs")
+    compare_parser.add_argument("old", type=Path)
+    compare_parser.add_argument("new", type=Path)
+    case_parser = subparsers.add_parser("case")  # Used by run for each case.
+    case_parser.add_argument("case_file", type=Path)
+    case_parser.add_argument("result_file", type=Path)
+    args = parser.parse_args()
+
+    if args.command == "case":
+        result = run_case(json.loads(args.case_file.read_text(encoding="utf-8")))
+        args.result_file.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+    elif args.command == "compare":
+        logger.info(f"Pipeline benchmark comparison:\n{compare_runs(args.old, args.new)}")
+    else:
+        run_matrix(getattr(args, "matrix", "quick"), getattr(args, "filter", None), getattr(args, "ocr_backend", None))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    main()
@@ -0,0 +1,47 @@
+import logging
+import os
+from pathlib import Path
+from time import perf_counter
+
+os.chdir(Path(__file__).parent.parent)
+
+import utilities.utils as utils
+from benchmarks.frame_change_threshold import ch_vid, ch_vid_srt, ch_vid_sub_area, compare_subtitles, read_srt
+from main import SubtitleExtractor, setup_ocr
+from utilities.logger_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """
+    Extract the subtitle of the test video with and without recognition only and compare the throughput and
+    the generated subtitles against the subtitle with text detection and the reference subtitle.
+    """
+    reference_lines = read_srt(ch_vid_srt)
+    results, subtitles = [], {}
+    for recognition_only in (False, True):
+        utils.Config.recognition_only = recognition_only  # Only changed in memory, the config file is not changed.
+        sub_ex = SubtitleExtractor()
+        start = perf_counter()
+        srt_file = sub_ex.run_extraction(ch_vid, ch_vid_sub_area)
+        duration = perf_counter() - start
+        subtitles[recognition_only] = read_srt(srt_file) if srt_file else []
+        if srt_file:
+            srt_file.unlink()
+            srt_file.with_name(f"{srt_file.stem} timings.json").unlink(missing_ok=True)
+        frames = sub_ex.text_extraction_counts["frames"]
+        similarity, equal_lines, timing_diff = compare_subtitles(subtitles[recognition_only], reference_lines)
+        results.append(f"{str(recognition_only):<17} {frames:>7} {duration:>8.1f}s {frames / duration:>10.1f} "
+                       f"{similarity:>10.4f} {equal_lines:>4}/{len(reference_lines):<4} {timing_diff:>9.1f}ms "
+                       f"{subtitles[recognition_only] == subtitles[False]}")
+    utils.Config.load_config()
+    header = (f"{'Recognition Only':<17} {'Frames':>7} {'Time':>9} {'Frames/s':>10} {'Similarity':>10} "
+              f"{'Equal Lines':>9} {'Timing':>11} Same As Detection")
+    logger.info("Recognition only benchmark results:\n" + "\n".join([header, *results]))
+
+
+if __name__ == '__main__':
+    setup_logging()
+    setup_ocr()
+    main()
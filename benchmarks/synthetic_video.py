@@ -0,0 +1,279 @@
+import argparse
+import json
+import logging
+import random
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+
+from main import SubtitleExtractor
+from utilities.logger_setup import setup_logging
+from utilities.ocr_backends import FakeBackend, crop_text_box
+
+logger = logging.getLogger(__name__)
+
+hershey_fonts = {"simplex": cv.FONT_HERSHEY_SIMPLEX, "duplex": cv.FONT_HERSHEY_DUPLEX,
+                 "complex": cv.FONT_HERSHEY_COMPLEX, "triplex": cv.FONT_HERSHEY_TRIPLEX}
+motions = ("static", "pan", "noise", "cuts")
+english_words = ("the", "time", "people", "way", "water", "words", "number", "sound", "place", "years", "thing",
+                 "great", "where", "through", "before", "right", "because", "little", "house", "world", "night",
+                 "never", "light", "again", "mother", "father", "friend", "tomorrow", "morning", "listen", "quickly",
+                 "remember", "nothing", "together", "question", "answer", "under", "river", "mountain", "secret")
+chinese_characters = "的一是不了人我在有他这为之大来以个中上们到说国和地也子时道出而要于就下得可你年生自会那后能对着事"
+
+
+def video_spec(name: str, width: int = 1280, height: int = 720, fps: float = 25.0, duration: float = 60.0,
+               subtitle_density: float = 0.7, min_sub_duration: float = 1.0, max_sub_duration: float = 4.0,
+               language: str = "en", font: str = "simplex", font_path: str = None, motion: str = "static",
+               two_line_ratio: float = 0.0, seed: int = 0) -> dict:
+    """
+    The settings of a synthetic video. Each missing setting uses the default.
+    :param duration: length of the video in seconds.
+    :param subtitle_density: the part of the video time that has a subtitle on screen.
+    :param min_sub_duration: shortest time in seconds a subtitle is on screen.
+    :param max_sub_duration: longest time in seconds a subtitle is on screen.
+    :param language: en for english words or ch for chinese characters.
+    :param font: hershey font of opencv used when no font path is given.
+    :param font_path: truetype font file, drawn with pillow. Needed for the languages other than en.
+    :param motion: background of the video. static, pan for a moving background, noise for changing pixels in every
+    frame like compression noise, or cuts for a new scene every 2 seconds.
+    :param two_line_ratio: the part of the subtitles with two lines.
+    :param seed: seed of the random texts, timings and backgrounds.
+    """
+    if motion not in motions:
+        raise ValueError(f"Unknown motion: {motion}, choose from {motions}")
+    if not font_path and (language != "en" or font not in hershey_fonts):
+        raise ValueError(f"A font file is needed for language: {language}, font: {font}")
+    return {"name": name, "width": width, "height": height, "fps": fps, "duration": duration,
+            "subtitle_density": subtitle_density, "min_sub_duration": min_sub_duration,
+            "max_sub_duration": max_sub_duration, "language": language, "font": font, "font_path": font_path,
+            "motion": motion, "two_line_ratio": two_line_ratio, "seed": seed}
+
+
+def random_text(rng: random.Random, language: str) -> str:
+    if language == "ch":
+        return "".join(rng.choices(chinese_characters, k=rng.randint(6, 14)))
+    return " ".join(rng.choices(english_words, k=rng.randint(3, 7))).capitalize()
+
+
+def subtitle_schedule(spec: dict) -> list[tuple[int, int, str]]:
+    """
+    The subtitles of the video with random texts and timings.
+    The gaps between the subtitles are set so that the subtitles cover the subtitle density of the video time.
+    :return: The first frame, last frame and text of each subtitle.
+    """
+    rng, fps = random.Random(spec["seed"]), spec["fps"]
+    frame_total = int(spec["duration"] * fps)
+    mean_duration = (spec["min_sub_duration"] + spec["max_sub_duration"]) / 2
+    density = min(max(spec["subtitle_density"], 0.01), 1.0)
+    mean_gap = mean_duration * (1 - density) / density
+    subtitles, frame_no = [], int(rng.uniform(0, 2 * mean_gap) * fps)
+    while True:
+        sub_frames = max(int(rng.uniform(spec["min_sub_duration"], spec["max_sub_duration"]) * fps), 1)
+        if frame_no + sub_frames > frame_total:
+            break
+        lines = 2 if rng.random() < spec["two_line_ratio"] else 1
+        text = "\n".join(random_text(rng, spec["language"]) for _ in range(lines))
+        subtitles.append((frame_no, frame_no + sub_frames - 1, text))
+        # Subtitles are at least 2 frames apart, so the texts of back to back subtitles are never merged.
+        frame_no += sub_frames + max(int(rng.uniform(0, 2 * mean_gap) * fps), 2)
+    return subtitles
+
+
+def background_texture(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """
+    A textured background with blurred colour blocks and shapes with sharp edges, like the objects of a scene.
+    The background is darker than the subtitles.
+    """
+    blocks = rng.integers(20, 160, (height // 32 + 2, width // 32 + 2, 3), dtype=np.uint8)
+    texture = cv.resize(blocks, (width, height), interpolation=cv.INTER_CUBIC)
+    for _ in range(20):
+        color = tuple(int(c) for c in rng.integers(20, 180, 3))
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(height // 20, height // 4))
+        if rng.random() < 0.5:
+            cv.rectangle(texture, (x, y), (x + size, y + size // 2), color, -1)
+        else:
+            cv.circle(texture, (x, y), size // 2, color, -1)
+    return texture
+
+
+class BackgroundRenderer:
+    def __init__(self, spec: dict) -> None:
+        """
+        Renders the background of each frame of a synthetic video.
+        """
+        self.spec, self.width, self.height = spec, spec["width"], spec["height"]
+        rng = np.random.default_rng(spec["seed"])
+        texture_width = self.width * 2 if spec["motion"] == "pan" else self.width
+        self.textures = [background_texture(rng, texture_width, self.height)
+                         for _ in range(4 if spec["motion"] == "cuts" else 1)]
+        # A few noise frames are repeated, generating new noise for every frame is slower than encoding it.
+        self.noise = [rng.normal(0, 6, (self.height, self.width, 3)).astype(np.int16) for _ in range(8)] \
+            if spec["motion"] == "noise" else []
+        self.pan_speed = max(self.width // 400, 1)  # Pixels moved in each frame.
+
+    def frame(self, frame_no: int) -> np.ndarray:
+        motion = self.spec["motion"]
+        if motion == "pan":
+            x = frame_no * self.pan_speed % self.width
+            return self.textures[0][:, x:x + self.width].copy()
+        if motion == "cuts":
+            return self.textures[int(frame_no / (self.spec["fps"] * 2)) % len(self.textures)].copy()
+        if motion == "noise":
+            frame = self.textures[0] + self.noise[frame_no % len(self.noise)]
+            return np.clip(frame, 0, 255).astype(np.uint8)
+        return self.textures[0].copy()
+
+
+def fit_line(line: str, width: int, text_width) -> str:
+    """
+    Remove words or characters from the end of the line until it fits in the width.
+    """
+    while text_width(line) > width and len(line) > 1:
+        line = line.rsplit(" ", 1)[0] if " " in line else line[:-1]
+    return line
+
+
+def hershey_overlay(lines: list[str], spec: dict) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    Draw white subtitle lines with a black outline using a hershey font of opencv.
+    :return: The overlay image, the mask of the drawn pixels and the drawn lines.
+    """
+    width, height = spec["width"], spec["height"]
+    font, scale = hershey_fonts[spec["font"]], height / 720 * 1.2
+    thickness = max(round(height / 360), 1)
+    outline = thickness + max(thickness, 2)
+    max_width = int(width * 0.9)
+    lines = [fit_line(line, max_width, lambda text: cv.getTextSize(text, font, scale, outline)[0][0]) for line in lines]
+    overlay, mask = np.zeros((height, width, 3), np.uint8), np.zeros((height, width), np.uint8)
+    line_height = int(cv.getTextSize("Ag", font, scale, outline)[0][1] * 1.8)
+    baseline = int(height * 0.93) - line_height * (len(lines) - 1)
+    for i, line in enumerate(lines):
+        text_size = cv.getTextSize(line, font, scale, outline)[0]
+        origin = ((width - text_size[0]) // 2, baseline + i * line_height)
+        for image, outline_color, text_color in ((overlay, (0, 0, 0), (255, 255, 255)), (mask, 255, 255)):
+            cv.putText(image, line, origin, font, scale, outline_color, outline, cv.LINE_AA)
+            cv.putText(image, line, origin, font, scale, text_color, thickness, cv.LINE_AA)
+    return overlay, mask, lines
+
+
+def truetype_overlay(lines: list[str], spec: dict) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    Draw white subtitle lines with a black outline using a truetype font.
+    Pillow is only needed for videos with a font file.
+    :return: The overlay image, the mask of the drawn pixels and the drawn lines.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = spec["width"], spec["height"]
+    font = ImageFont.truetype(spec["font_path"], int(height * 0.055))
+    stroke = max(height // 360, 1)
+    max_width = int(width * 0.9)
+    lines = [fit_line(line, max_width, lambda text: font.getlength(text) + stroke * 2) for line in lines]
+    overlay, mask = Image.new("RGB", (width, height)), Image.new("L", (width, height))
+    line_height = int(font.size * 1.4)
+    baseline = int(height * 0.93) - line_height * (len(lines) - 1)
+    for i, line in enumerate(lines):
+        position = (width // 2, baseline + i * line_height)
+        ImageDraw.Draw(overlay).text(position, line, (255, 255, 255), font, "ms", stroke_width=stroke,
+                                     stroke_fill=(0, 0, 0))
+        ImageDraw.Draw(mask).text(position, line, 255, font, "ms", stroke_width=stroke, stroke_fill=255)
+    return np.array(overlay)[:, :, ::-1], np.array(mask), lines
+
+
+def canned_texts(overlay: np.ndarray, lines: list[str]) -> list:
+    """
+    The line signatures of the fake ocr backend of the drawn subtitle lines, so the backend can decode the lines.
+    :return: The signature and text of each line. Empty if the backend does not find each drawn line.
+    """
+    fake_backend = FakeBackend()
+    boxes = fake_backend.detect([overlay])[0]
+    if len(boxes) != len(lines):
+        return []
+    return [[fake_backend.line_signature(crop_text_box(overlay, box)), line] for box, line in zip(boxes, lines)]
+
+
+def render_video(spec: dict, video_dir: Path) -> dict:
+    """
+    Render a synthetic video with its ground truth subtitle. A video that was rendered with the same spec is reused.
+    The timings of the ground truth subtitle are the positions of the first and last frame of each subtitle,
+    which are the timings of a frame accurate extraction.
+    :return: The paths of the video, the ground truth subtitle and the canned texts of the fake ocr backend,
+    the area of all the subtitle texts and a sub area with padding around the texts.
+    """
+    video_dir.mkdir(parents=True, exist_ok=True)
+    video_path, srt_path = video_dir / f"{spec['name']}.mp4", video_dir / f"{spec['name']} ground truth.srt"
+    info_path, texts_path = video_dir / f"{spec['name']}.json", video_dir / f"{spec['name']} ocr texts.json"
+    if video_path.exists() and info_path.exists() and texts_path.exists():
+        info = json.loads(info_path.read_text(encoding="utf-8"))
+        if info["spec"] == spec:
+            return info
+
+    logger.info(f"Rendering synthetic video: {video_path.name}")
+    width, height, fps = spec["width"], spec["height"], spec["fps"]
+    background = BackgroundRenderer(spec)
+    draw_overlay = truetype_overlay if spec["font_path"] else hershey_overlay
+    schedule, subtitles, texts = subtitle_schedule(spec), [], []
+    text_area = [width, height, 0, 0]
+    writer = cv.VideoWriter(str(video_path), cv.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    overlays = iter(schedule)
+    current = next(overlays, None)
+    overlay = mask = None
+    for frame_no in range(int(spec["duration"] * fps)):
+        frame = background.frame(frame_no)
+        if current and frame_no > current[1]:
+            current, overlay = next(overlays, None), None
+        if current and frame_no >= current[0]:
+            if overlay is None:
+                overlay, mask, lines = draw_overlay(current[2].split("\n"), spec)
+                mask = mask > 0
+                subtitles.append((current[0], current[1], "\n".join(lines)))
+                texts.extend(canned_texts(overlay, lines))
+                ys, xs = np.nonzero(mask)
+                text_area = [min(text_area[0], int(xs.min())), min(text_area[1], int(ys.min())),
+                             max(text_area[2], int(xs.max()) + 1), max(text_area[3], int(ys.max()) + 1)]
+            frame[mask] = overlay[mask]
+        writer.write(frame)
+    writer.release()
+
+    srt_lines = [f"{i}\n{SubtitleExtractor.timecode(start * 1000 / fps)} --> "
+                 f"{SubtitleExtractor.timecode(end * 1000 / fps)}\n{text}\n\n"
+                 for i, (start, end, text) in enumerate(subtitles, 1)]
+    srt_path.write_text("".join(srt_lines), encoding="utf-8")
+    texts_path.write_text(json.dumps(texts, ensure_ascii=False), encoding="utf-8")
+    padding = height // 50
+    sub_area = [0, max(text_area[1] - padding, 0), width, min(text_area[3] + padding, height)] if subtitles else None
+    info = {"spec": spec, "video": str(video_path), "srt": str(srt_path), "ocr_texts": str(texts_path),
+            "subtitles": len(subtitles), "text_area": text_area if subtitles else None, "sub_area": sub_area}
+    info_path.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    return info
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render a synthetic subtitle video and its ground truth subtitle.")
+    parser.add_argument("name", help="name of the video")
+    parser.add_argument("-d", "--dir", type=Path, default=Path("benchmarks/videos"), help="directory of the video")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=25.0)
+    parser.add_argument("--duration", type=float, default=60.0, help="length in seconds")
+    parser.add_argument("--density", type=float, default=0.7, help="part of the time with a subtitle on screen")
+    parser.add_argument("--language", choices=("en", "ch"), default="en")
+    parser.add_argument("--font", default="simplex", help=f"hershey font: {', '.join(hershey_fonts)}")
+    parser.add_argument("--font-path", help="truetype font file, needed for ch")
+    parser.add_argument("--motion", choices=motions, default="static")
+    parser.add_argument("--two-line-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    spec = video_spec(args.name, args.width, args.height, args.fps, args.duration, args.density,
+                      language=args.language, font=args.font, font_path=args.font_path, motion=args.motion,
+                      two_line_ratio=args.two_line_ratio, seed=args.seed)
+    info = render_video(spec, args.dir)
+    logger.info(f"Video: {info['video']}, Subtitles: {info['subtitles']}, Sub area: {info['sub_area']}")
+
+
+if __name__ == '__main__':
+    setup_logging()
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import csv
+import glob
+import json
+import logging
+import re
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+import utilities.utils as utils
+from main import BatchExtractor, SubtitleDetector, setup_ocr
+from utilities.logger_setup import setup_logging
+from utilities.ocr_backends import ocr_backends
+
+logger = logging.getLogger(__name__)
+
+video_extensions = (".mp4", ".mkv", ".avi", ".mov", ".webm", ".flv", ".wmv", ".ts", ".m4v")
+
+
+def video_entry(video: str | Path, sub_area: tuple = None, start_frame: int = None, stop_frame: int = None,
+                language: str = None) -> dict:
+    """
+    The details of a video to be extracted, each missing detail uses the default of the program.
+    """
+    return {"video": str(video), "sub_area": sub_area, "start_frame": start_frame, "stop_frame": stop_frame,
+            "language": language}
+
+
+def find_videos(inputs: list[str], recursive: bool = False) -> list[dict]:
+    """
+    Find the videos of the video files, glob patterns and directories.
+    Only files with a video extension are taken from directories and glob patterns.
+    :param recursive: search the subdirectories of the directories too.
+    """
+    videos = {}
+    for path in inputs:
+        if Path(path).is_file():
+            files = [Path(path)]
+        else:
+            pattern = str(Path(path, "**" if recursive else "", "*")) if Path(path).is_dir() else path
+            files = [file for file in map(Path, sorted(glob.glob(pattern, recursive=True)))
+                     if file.is_file() and file.suffix.lower() in video_extensions]
+        if not files:
+            logger.warning(f"No video found for input: {path}")
+        for file in files:
+            videos.setdefault(file.resolve(), video_entry(file))
+    return list(videos.values())
+
+
+def parse_sub_area(value: str | list | None) -> tuple | None:
+    """
+    Parse a sub area given as a list or as text like "288,958,1632,1044" or "288 958 1632 1044".
+    """
+    if value in (None, ""):
+        return
+    values = re.split(r"[\s,]+", value.strip(" []()")) if isinstance(value, str) else value
+    if len(values) != 4:
+        raise ValueError(f"Sub area must have 4 values (x1, y1, x2, y2), got: {value}")
+    return tuple(int(v) for v in values)
+
+
+def parse_frame(value: str | int | None) -> int | None:
+    return None if value in (None, "") else int(value)
+
+
+def read_manifest(manifest: Path) -> list[dict]:
+    """
+    Read the videos of a JSON or CSV manifest. Relative video paths are relative to the manifest.
+    A JSON manifest is a list of objects, a CSV manifest has a header row. Only the video is required, the other
+    fields are sub_area, start_frame, stop_frame and language.
+    """
+    with open(manifest, newline="", encoding="utf-8") as manifest_file:
+        if manifest.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(manifest_file))
+        else:
+            rows = json.load(manifest_file)
+            rows = rows["videos"] if isinstance(rows, dict) else rows
+    videos = []
+    for row in rows:
+        row = {"video": row} if isinstance(row, str) else row
+        if not row.get("video"):
+            raise ValueError(f"Manifest entry without a video: {row}")
+        videos.append(video_entry(manifest.parent / row["video"], parse_sub_area(row.get("sub_area")),
+                                  parse_frame(row.get("start_frame")), parse_frame(row.get("stop_frame")),
+                                  row.get("language") or None))
+    return videos
+
+
+def video_settings(video: dict) -> dict:
+    """
+    The config values of the video that are used instead of the config values of the run.
+    """
+    return {"ocr_rec_language": video["language"]} if video["language"] else {}
+
+
+def detect_sub_area(video: dict, cancel_token: utils.CancelToken) -> None:
+    if cancel_token.cancelled:
+        return
+    with utils.Config.snapshot(video_settings(video)):
+        video["sub_area"] = SubtitleDetector(video["video"], utils.Config.use_search_area).get_sub_area()
+
+
+def detect_sub_areas(videos: list[dict], cancel_token: utils.CancelToken) -> None:
+    """
+    Detect the sub area of the videos without a sub area, as many videos at the same time as the concurrent videos.
+    Videos where no subtitle is detected use the default sub area.
+    """
+    videos = [video for video in videos if not video["sub_area"]]
+    if not videos:
+        return
+    logger.info(f"Detecting subtitle area of {len(videos)} video(s)...")
+    with ThreadPoolExecutor(max(utils.Config.concurrent_videos, 1), thread_name_prefix="Sub Detection") as executor:
+        # Each detection runs in a copy of the context, so it uses the snapshot of the run.
+        futures = [executor.submit(copy_context().run, detect_sub_area, video, cancel_token) for video in videos]
+        for video, future in zip(videos, futures):
+            try:
+                future.result()
+            except Exception as error:
+                logger.exception(f"An error occurred while detecting subtitles of {video['video']}! \nError: {error}")
+
+
+def move_to_output_dir(subtitle_path: Path, output_dir: Path) -> Path:
+    """
+    Move a subtitle and its timings and trace reports to the output directory.
+    A subtitle named like a subtitle already in the output directory, e.g. of a video with the same name in another
+    directory, gets a unique identifier appended to its name, like the subtitles saved beside the videos.
+    :return: The path of the moved subtitle.
+    """
+    if subtitle_path.parent.resolve() == output_dir.resolve():
+        return subtitle_path
+    new_path = output_dir / subtitle_path.name
+    for i in range(1, 20):  # max copies
+        if not new_path.exists():
+            break
+        new_path = output_dir / f"{subtitle_path.stem} ({i}){subtitle_path.suffix}"
+    else:
+        raise RuntimeError("Could not generate a unique save path!")
+    for report in ("timings", "trace"):
+        report_path = subtitle_path.with_name(f"{subtitle_path.stem} {report}.json")
+        if report_path.exists():
+            report_path.replace(new_path.with_name(f"{new_path.stem} {report}.json"))
+    return subtitle_path.replace(new_path)
+
+
+def extract_subtitles(videos: list[dict], output_dir: Path | None, cancel_token: utils.CancelToken) -> None:
+    """
+    Extract the subtitles of the videos and add the subtitle path and status of each video to its details.
+    """
+    batch_ex, queue_len = BatchExtractor(cancel_token), len(videos)
+    entries = {video["video"]: video for video in videos}
+
+    def video_done(video: str, subtitle_path: Path | None) -> None:
+        if subtitle_path and output_dir:
+            subtitle_path = move_to_output_dir(subtitle_path, output_dir)
+        entry = entries[video]
+        entry["subtitle"] = str(subtitle_path) if subtitle_path else None
+        entry["status"] = batch_ex.incomplete_videos.get(video, "done" if subtitle_path else "no subtitle")
+        done_count = sum("status" in entry for entry in videos)
+        logger.info(f"{done_count} of {queue_len} Video(s) Completed. {Path(video).name}: {entry['status']}\n")
+
+    batch_ex.run({video["video"]: (video["sub_area"], video["start_frame"], video["stop_frame"],
+                                   video_settings(video)) for video in videos}, video_done)
+
+
+def parse_args(args: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Extract hard coded subtitles from videos without the graphical interface.",
+        epilog="Exit codes: 0 all videos done, 1 a video failed, 2 invalid arguments, 130 stopped."
+    )
+    parser.add_argument("inputs", nargs="*", help="video files, glob patterns or directories of videos")
+    parser.add_argument("-m", "--manifest", type=Path,
+                        help="JSON or CSV file of videos with an optional sub_area, start_frame, stop_frame and "
+                             "language for each video")
+    parser.add_argument("-r", "--recursive", action="store_true", help="search the subdirectories of directories")
+    parser.add_argument("-o", "--output-dir", type=Path,
+                        help="directory of the subtitles, the subtitles are saved beside the videos by default")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of videos detected and extracted at the same time, the Concurrent Videos "
+                             "preference is used by default")
+    parser.add_argument("-l", "--language", help="OCR recognition language of the videos without a language")
+    parser.add_argument("--no-detect", action="store_true",
+                        help="use the default sub area for videos without a sub area instead of detecting it")
+    parser.add_argument("--trace", action="store_true",
+                        help="save a Chrome trace of each extraction beside its subtitle, for Perfetto")
+    parser.add_argument("--ocr-backend", choices=ocr_backends,
+                        help="OCR backend of the extractions, the OCR Backend preference is used by default")
+    parser.add_argument("-s", "--summary", type=Path, default=Path("run summary.json"),
+                        help="path of the JSON run summary (default: %(default)s)")
+    args = parser.parse_args(args)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    try:
+        args.videos = find_videos(args.inputs, args.recursive)
+        if args.manifest:
+            args.videos += read_manifest(args.manifest)
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        parser.error(f"Invalid manifest: {error}")
+    if not args.videos:
+        parser.error("No video found!")
+    return args
+
+
+def run(args: argparse.Namespace, cancel_token: utils.CancelToken) -> int:
+    """
+    Detect and extract the subtitles of the videos and write the run summary.
+    :return: the exit code of the run.
+    """
+    start, started = perf_counter(), datetime.now().isoformat(timespec="seconds")
+    if args.output_dir:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+    for video in args.videos:
+        video["language"] = video["language"] or args.language
+    settings = {"concurrent_videos": args.jobs} if args.jobs else {}
+    if args.trace:
+        settings["trace_extraction"] = True
+    if args.ocr_backend:
+        settings["ocr_backend"] = args.ocr_backend
+    with utils.Config.snapshot(settings):
+        setup_ocr()
+        if not args.no_detect:
+            detect_sub_areas(args.videos, cancel_token)
+        extract_subtitles(args.videos, args.output_dir, cancel_token)
+
+    statuses = [video.setdefault("status", "cancelled") for video in args.videos]
+    summary = {
+        "started": started,
+        "duration": str(timedelta(seconds=round(perf_counter() - start))),
+        "videos": args.videos,
+        "done": statuses.count("done") + statuses.count("no subtitle"),
+        "failed": statuses.count("failed"),
+        "cancelled": statuses.count("cancelled"),
+    }
+    args.summary.parent.mkdir(parents=True, exist_ok=True)
+    args.summary.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Run summary saved. Path: {args.summary}\n"
+                f"Done: {summary['done']}, Failed: {summary['failed']}, Cancelled: {summary['cancelled']}, "
+                f"Total time: {summary['duration']}")
+    if summary["cancelled"]:
+        return 130
+    return 1 if summary["failed"] else 0
+
+
+def main(args: list[str] = None) -> int:
+    setup_logging()
+    logger.debug("\n\nCLI program Started.")
+    args = parse_args(args)
+    cancel_token = utils.CancelToken()
+    # Ctrl+C stops the videos being extracted, the checkpoints of the videos are kept to be continued later.
+    signal.signal(signal.SIGINT, lambda *_: cancel_token.cancel())
+    exit_code = run(args, cancel_token)
+    logger.debug("CLI program Ended.\n\n")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,7 @@ import platform
 import sys
 import time
 import tkinter as tk
+from collections.abc import Callable
 from os import cpu_count
 from pathlib import Path
 from threading import Thread
@@ -14,8 +15,9 @@ import numpy as np
 from PIL import Image, ImageTk
 
 import utilities.utils as utils
-from main import SubtitleDetector, SubtitleExtractor, setup_ocr
+from main import BatchExtractor, SubtitleDetector, SubtitleExtractor, setup_ocr
 from utilities.logger_setup import setup_logging
+from utilities.ocr_backends import ocr_backends
 from utilities.win_notify import Notification, Sound
 
 logger = logging.getLogger(__name__)
@@ -334,7 +336,8 @@ class SubtitleExtractorGUI:
         """
         root_x, root_y = self.root.winfo_rootx(), self.root.winfo_rooty()
         win_x, win_y = root_x + 100, root_y + 50
-        self.preference_window = PreferencesUI(self.icon_file, win_x, win_y)
+        regenerate_command = self._run_sub_regeneration if self.video_queue else None
+        self.preference_window = PreferencesUI(self.icon_file, win_x, win_y, regenerate_command)
 
     def _get_rescale_factor(self) -> float:
         """
@@ -808,22 +811,27 @@ class SubtitleExtractorGUI:
         self.video_label.configure(text=f"{self.progress_bar['value']} of {queue_len} Video(s) Completed")
         logger.info(f"Subtitle Language: {utils.Config.ocr_rec_language}\n")
         self.thread_running = True
+
+        def video_done(video: str, subtitle_path: Path | None) -> None:
+            self.progress_bar['value'] += 1
+            self.video_label.configure(text=f"{self.progress_bar['value']} of {queue_len} Video(s) Completed")
+
+        videos = {}
+        for video, sub_info in self.video_queue.items():
+            sub_area, start_frame, stop_frame = sub_info[0], sub_info[1], sub_info[2]
+            start_frame = int(start_frame) if start_frame else start_frame
+            stop_frame = int(stop_frame) if stop_frame else stop_frame
+            videos[video] = sub_area, start_frame, stop_frame
         try:
             setup_ocr()
-            for video, sub_info in self.video_queue.items():
-                sub_area, start_frame, stop_frame = sub_info[0], sub_info[1], sub_info[2]
-                start_frame = int(start_frame) if start_frame else start_frame
-                stop_frame = int(stop_frame) if stop_frame else stop_frame
-                if utils.Process.interrupt_process:
-                    logger.warning("Process interrupted\n")
-                    self.thread_running = False
-                    self._stop_sub_extraction_process()
-                    return
-                self.sub_ex.run_extraction(video, sub_area, start_frame, stop_frame)
-                self.progress_bar['value'] += 1
-                self.video_label.configure(text=f"{self.progress_bar['value']} of {queue_len} Video(s) Completed")
+            BatchExtractor().run(videos, video_done)
         except Exception as error:
             logger.exception(f"\nAn error occurred while extracting subtitles! \nError: {error}")
+        if utils.Process.interrupt_process:
+            logger.warning("Process interrupted\n")
+            self.thread_running = False
+            self._stop_sub_extraction_process()
+            return
         self.thread_running = False
         self._stop_sub_extraction_process()
         self.send_notification("Subtitle Extraction Completed!")
@@ -859,6 +867,29 @@ class SubtitleExtractorGUI:
         else:
             logger.info("No video has been opened!")
 
+    def regenerate_subtitles(self) -> None:
+        """
+        Use the main module extraction class to generate the subtitles again from the kept ocr results.
+        """
+        self.thread_running = True
+        try:
+            for video in self.video_queue.keys():
+                self.sub_ex.regenerate_subtitle(video)
+        except Exception as error:
+            logger.exception(f"\nAn error occurred while regenerating subtitles! \nError: {error}")
+        self.thread_running = False
+        self._set_gui_state("normal", "regeneration")
+        logger.info("Done regenerating subtitle(s)!\n")
+
+    def _run_sub_regeneration(self) -> None:
+        """
+        Create a thread to generate the subtitles again.
+        """
+        logger.debug("Regenerate subtitles button clicked")
+        utils.Process.start_process()
+        self._set_gui_state("disabled", "regeneration")
+        Thread(target=self.regenerate_subtitles, daemon=True).start()
+
     def _set_gui_state(self, state: str, process_name: str = None) -> None:
         """
         Set state for widgets while process is running.
@@ -872,10 +903,10 @@ class SubtitleExtractorGUI:
             self.previous_button.configure(state=state)
             self.next_button.configure(state=state)
 
-        if process_name in ("detection", "opening"):
+        if process_name in ("detection", "opening", "regeneration"):
             self.run_button.configure(state=state)
 
-        if process_name in ("extraction", "opening"):
+        if process_name in ("extraction", "opening", "regeneration"):
             self.menubar.entryconfig(3, state=state)  # Detect button.
             self.menubar.entryconfig(4, state=state)  # Hide Non-SubArea button.
             self.menubar.entryconfig(6, state=state)  # Set Start Frame button.
@@ -902,9 +933,10 @@ class SubtitleExtractorGUI:
 
 
 class PreferencesUI(tk.Toplevel):
-    def __init__(self, icon_file: str, win_x: int, win_y: int) -> None:
+    def __init__(self, icon_file: str, win_x: int, win_y: int, regenerate_command: Callable = None) -> None:
         super().__init__()
         self.icon_file = icon_file
+        self.regenerate_command = regenerate_command  # Generates the subtitles again from kept ocr results.
         self.geometry(f"+{win_x}+{win_y}")  # Set window position.
         self.focus()
         self.grab_set()
@@ -1072,6 +1104,78 @@ class PreferencesUI(tk.Toplevel):
             width=self.entry_size
         ).grid(column=1, row=1)
 
+        ttk.Label(frame_extraction_frame, text="Frame Change Threshold:").grid(
+            column=0, row=2, pady=self.wgt_y_padding
+        )
+        self.frame_change_threshold = tk.DoubleVar(value=utils.Config.frame_change_threshold)
+        self.frame_change_threshold.trace_add("write", self._set_reset_button)
+        ttk.Spinbox(
+            frame_extraction_frame,
+            from_=0, to=0.05,
+            increment=0.001,
+            textvariable=self.frame_change_threshold,
+            state="readonly",
+            width=self.spinbox_size
+        ).grid(column=1, row=2)
+
+        ttk.Label(frame_extraction_frame, text="Text Edge Threshold:").grid(column=0, row=3)
+        self.text_edge_threshold = tk.DoubleVar(value=utils.Config.text_edge_threshold)
+        self.text_edge_threshold.trace_add("write", self._set_reset_button)
+        ttk.Spinbox(
+            frame_extraction_frame,
+            from_=0, to=0.01,
+            increment=0.0005,
+            textvariable=self.text_edge_threshold,
+            state="readonly",
+            width=self.spinbox_size
+        ).grid(column=1, row=3)
+
+        self.frame_accurate_timing = tk.BooleanVar(value=utils.Config.frame_accurate_timing)
+        self.frame_accurate_timing.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            frame_extraction_frame,
+            text='Frame Accurate Timing',
+            variable=self.frame_accurate_timing
+        ).grid(column=0, row=4, pady=self.wgt_y_padding)
+
+        self.save_frames = tk.BooleanVar(value=utils.Config.save_frames)
+        self.save_frames.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            frame_extraction_frame,
+            text='Save Frames (Debug)',
+            variable=self.save_frames
+        ).grid(column=1, row=4)
+
+        ttk.Label(frame_extraction_frame, text="Scratch Directory:").grid(column=0, row=5)
+        self.scratch_dir = tk.StringVar(value=utils.Config.scratch_dir)
+        self.scratch_dir.trace_add("write", self._set_reset_button)
+        ttk.Entry(
+            frame_extraction_frame,
+            textvariable=self.scratch_dir,
+            width=self.entry_size
+        ).grid(column=1, row=5)
+
+        ttk.Label(frame_extraction_frame, text="Concurrent Videos:").grid(
+            column=0, row=6, pady=self.wgt_y_padding
+        )
+        self.concurrent_videos = tk.IntVar(value=utils.Config.concurrent_videos)
+        self.concurrent_videos.trace_add("write", self._set_reset_button)
+        ttk.Spinbox(
+            frame_extraction_frame,
+            from_=1, to=8,
+            textvariable=self.concurrent_videos,
+            state="readonly",
+            width=self.spinbox_size
+        ).grid(column=1, row=6)
+
+        self.trace_extraction = tk.BooleanVar(value=utils.Config.trace_extraction)
+        self.trace_extraction.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            frame_extraction_frame,
+            text='Trace Extraction (Debug)',
+            variable=self.trace_extraction
+        ).grid(column=0, row=7, columnspan=2)
+
     def _text_extraction_tab(self) -> None:
         """
         Creates widgets in the Text extraction preferences tab frame.
@@ -1153,6 +1257,60 @@ class PreferencesUI(tk.Toplevel):
             variable=self.line_break
         ).grid(column=0, row=5)
 
+        self.recognition_only = tk.BooleanVar(value=utils.Config.recognition_only)
+        self.recognition_only.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            text_extraction_frame,
+            text='Recognition Only',
+            variable=self.recognition_only
+        ).grid(column=1, row=5)
+
+        ttk.Label(text_extraction_frame, text="Recognition Only Min Score:").grid(
+            column=0, row=6, pady=self.wgt_y_padding
+        )
+        self.recognition_only_min_score = tk.DoubleVar(value=utils.Config.recognition_only_min_score)
+        self.recognition_only_min_score.trace_add("write", self._set_reset_button)
+        ttk.Spinbox(
+            text_extraction_frame,
+            from_=0, to=1.0,
+            increment=0.01,
+            textvariable=self.recognition_only_min_score,
+            state="readonly",
+            width=self.spinbox_size
+        ).grid(column=1, row=6)
+
+        ttk.Label(text_extraction_frame, text="OCR Cache Directory:").grid(column=0, row=7)
+        self.ocr_cache_dir = tk.StringVar(value=utils.Config.ocr_cache_dir)
+        self.ocr_cache_dir.trace_add("write", self._set_reset_button)
+        ttk.Entry(
+            text_extraction_frame,
+            textvariable=self.ocr_cache_dir,
+            width=self.entry_size
+        ).grid(column=1, row=7)
+
+        ttk.Label(text_extraction_frame, text="OCR Cache Max Entries:").grid(column=0, row=8, pady=self.wgt_y_padding)
+        self.ocr_cache_max_entries = tk.IntVar(value=utils.Config.ocr_cache_max_entries)
+        self.ocr_cache_max_entries.trace_add("write", self._set_reset_button)
+        check_int = (self.register(self._check_integer), '%P')
+        ttk.Entry(
+            text_extraction_frame,
+            textvariable=self.ocr_cache_max_entries,
+            validate='key',
+            validatecommand=check_int,
+            width=self.entry_size
+        ).grid(column=1, row=8)
+
+        ttk.Label(text_extraction_frame, text="OCR Backend:").grid(column=0, row=9)
+        self.ocr_backend = tk.StringVar(value=utils.Config.ocr_backend)
+        self.ocr_backend.trace_add("write", self._set_reset_button)
+        ttk.Combobox(
+            text_extraction_frame,
+            textvariable=self.ocr_backend,
+            values=list(ocr_backends),
+            state="readonly",
+            width=self.combobox_size
+        ).grid(column=1, row=9)
+
     def _subtitle_generator_tab(self) -> None:
         """
         Creates widgets in the Subtitle generator preferences tab frame.
@@ -1222,6 +1380,29 @@ class PreferencesUI(tk.Toplevel):
             variable=self.use_gpu
         ).grid(column=0, row=4, pady=self.wgt_y_padding)
 
+        self.keep_ocr_results = tk.BooleanVar(value=utils.Config.keep_ocr_results)
+        self.keep_ocr_results.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            subtitle_generator_frame,
+            text='Keep OCR Results',
+            variable=self.keep_ocr_results
+        ).grid(column=1, row=4)
+
+        self.stream_subtitles = tk.BooleanVar(value=utils.Config.stream_subtitles)
+        self.stream_subtitles.trace_add("write", self._set_reset_button)
+        ttk.Checkbutton(
+            subtitle_generator_frame,
+            text='Stream Subtitles',
+            variable=self.stream_subtitles
+        ).grid(column=0, row=5, pady=(0, self.wgt_y_padding))
+
+        ttk.Button(
+            subtitle_generator_frame,
+            text="Save & Regenerate Subtitles",
+            command=self._regenerate_subtitles,
+            state="normal" if self.regenerate_command else "disabled"
+        ).grid(column=0, row=6, columnspan=2, pady=(0, self.wgt_y_padding))
+
     def _notifications_tab(self) -> None:
         """
         Choose notification tab depending on platform os.
@@ -1272,17 +1453,31 @@ class PreferencesUI(tk.Toplevel):
         default_values = (
             utils.Config.default_frame_extraction_frequency,
             utils.Config.default_frame_extraction_batch_size,
+            utils.Config.default_save_frames,
+            utils.Config.default_frame_change_threshold,
+            utils.Config.default_text_edge_threshold,
+            utils.Config.default_frame_accurate_timing,
+            utils.Config.default_scratch_dir,
+            utils.Config.default_concurrent_videos,
+            utils.Config.default_trace_extraction,
             utils.Config.default_text_extraction_batch_size,
             utils.Config.default_onnx_intra_threads,
             utils.Config.default_ocr_max_processes,
             utils.Config.default_ocr_rec_language,
             utils.Config.default_text_drop_score,
             utils.Config.default_line_break,
+            utils.Config.default_recognition_only,
+            utils.Config.default_recognition_only_min_score,
+            utils.Config.default_ocr_cache_dir,
+            utils.Config.default_ocr_cache_max_entries,
+            utils.Config.default_ocr_backend,
             utils.Config.default_text_similarity_threshold,
             utils.Config.default_min_consecutive_sub_dur_ms,
             utils.Config.default_max_consecutive_short_durs,
             utils.Config.default_min_sub_duration_ms,
             utils.Config.default_use_gpu,
+            utils.Config.default_keep_ocr_results,
+            utils.Config.default_stream_subtitles,
             utils.Config.default_split_start,
             utils.Config.default_split_stop,
             utils.Config.default_no_of_frames,
@@ -1297,17 +1492,31 @@ class PreferencesUI(tk.Toplevel):
             values = (
                 self.frame_extraction_frequency.get(),
                 self.frame_extraction_batch_size.get(),
+                self.save_frames.get(),
+                self.frame_change_threshold.get(),
+                self.text_edge_threshold.get(),
+                self.frame_accurate_timing.get(),
+                self.scratch_dir.get(),
+                self.concurrent_videos.get(),
+                self.trace_extraction.get(),
                 self.text_extraction_batch_size.get(),
                 self.onnx_intra_threads.get(),
                 self.ocr_max_processes.get(),
                 self.ocr_rec_language.get(),
                 self.text_drop_score.get(),
                 self.line_break.get(),
+                self.recognition_only.get(),
+                self.recognition_only_min_score.get(),
+                self.ocr_cache_dir.get(),
+                self.ocr_cache_max_entries.get(),
+                self.ocr_backend.get(),
                 self.text_similarity_threshold.get(),
                 self.min_consecutive_sub_dur_ms.get(),
                 self.max_consecutive_short_durs.get(),
                 self.min_sub_duration_ms.get(),
                 self.use_gpu.get(),
+                self.keep_ocr_results.get(),
+                self.stream_subtitles.get(),
                 self.split_start.get(),
                 self.split_stop.get(),
                 self.no_of_frames.get(),
@@ -1358,6 +1567,13 @@ class PreferencesUI(tk.Toplevel):
         # Frame extraction settings.
         self.frame_extraction_frequency.set(utils.Config.default_frame_extraction_frequency)
         self.frame_extraction_batch_size.set(utils.Config.default_frame_extraction_batch_size)
+        self.save_frames.set(utils.Config.default_save_frames)
+        self.frame_change_threshold.set(utils.Config.default_frame_change_threshold)
+        self.text_edge_threshold.set(utils.Config.default_text_edge_threshold)
+        self.frame_accurate_timing.set(utils.Config.default_frame_accurate_timing)
+        self.scratch_dir.set(utils.Config.default_scratch_dir)
+        self.concurrent_videos.set(utils.Config.default_concurrent_videos)
+        self.trace_extraction.set(utils.Config.default_trace_extraction)
         # Text extraction settings.
         self.text_extraction_batch_size.set(utils.Config.default_text_extraction_batch_size)
         self.onnx_intra_threads.set(utils.Config.default_onnx_intra_threads)
@@ -1365,12 +1581,19 @@ class PreferencesUI(tk.Toplevel):
         self.ocr_rec_language.set(utils.Config.default_ocr_rec_language)
         self.text_drop_score.set(utils.Config.default_text_drop_score)
         self.line_break.set(utils.Config.default_line_break)
+        self.recognition_only.set(utils.Config.default_recognition_only)
+        self.recognition_only_min_score.set(utils.Config.default_recognition_only_min_score)
+        self.ocr_cache_dir.set(utils.Config.default_ocr_cache_dir)
+        self.ocr_cache_max_entries.set(utils.Config.default_ocr_cache_max_entries)
+        self.ocr_backend.set(utils.Config.default_ocr_backend)
         # Subtitle generator settings.
         self.text_similarity_threshold.set(utils.Config.default_text_similarity_threshold)
         self.min_consecutive_sub_dur_ms.set(utils.Config.default_min_consecutive_sub_dur_ms)
         self.max_consecutive_short_durs.set(utils.Config.default_max_consecutive_short_durs)
         self.min_sub_duration_ms.set(utils.Config.default_min_sub_duration_ms)
         self.use_gpu.set(utils.Config.default_use_gpu)
+        self.keep_ocr_results.set(utils.Config.default_keep_ocr_results)
+        self.stream_subtitles.set(utils.Config.default_stream_subtitles)
         # Subtitle detection settings.
         self.split_start.set(utils.Config.default_split_start)
         self.split_stop.set(utils.Config.default_split_stop)
@@ -1392,6 +1615,13 @@ class PreferencesUI(tk.Toplevel):
                     # Frame extraction settings.
                     utils.Config.keys[0]: self.frame_extraction_frequency.get(),
                     utils.Config.keys[1]: self.frame_extraction_batch_size.get(),
+                    utils.Config.keys[21]: self.save_frames.get(),
+                    utils.Config.keys[22]: self.frame_change_threshold.get(),
+                    utils.Config.keys[23]: self.text_edge_threshold.get(),
+                    utils.Config.keys[24]: self.frame_accurate_timing.get(),
+                    utils.Config.keys[31]: self.scratch_dir.get(),
+                    utils.Config.keys[32]: self.concurrent_videos.get(),
+                    utils.Config.keys[33]: self.trace_extraction.get(),
                     # Text extraction settings.
                     utils.Config.keys[2]: self.text_extraction_batch_size.get(),
                     utils.Config.keys[3]: self.onnx_intra_threads.get(),
@@ -1399,12 +1629,19 @@ class PreferencesUI(tk.Toplevel):
                     utils.Config.keys[4]: self.ocr_rec_language.get(),
                     utils.Config.keys[18]: self.text_drop_score.get(),
                     utils.Config.keys[20]: self.line_break.get(),
+                    utils.Config.keys[25]: self.recognition_only.get(),
+                    utils.Config.keys[26]: self.recognition_only_min_score.get(),
+                    utils.Config.keys[27]: self.ocr_cache_dir.get(),
+                    utils.Config.keys[28]: self.ocr_cache_max_entries.get(),
+                    utils.Config.keys[34]: self.ocr_backend.get(),
                     # Subtitle generator settings.
                     utils.Config.keys[5]: self.text_similarity_threshold.get(),
                     utils.Config.keys[6]: self.min_consecutive_sub_dur_ms.get(),
                     utils.Config.keys[7]: self.max_consecutive_short_durs.get(),
                     utils.Config.keys[8]: self.min_sub_duration_ms.get(),
                     utils.Config.keys[19]: self.use_gpu.get(),
+                    utils.Config.keys[29]: self.keep_ocr_results.get(),
+                    utils.Config.keys[30]: self.stream_subtitles.get(),
                     # Subtitle detection settings.
                     utils.Config.keys[9]: self.split_start.get(),
                     utils.Config.keys[10]: self.split_stop.get(),
@@ -1421,6 +1658,13 @@ class PreferencesUI(tk.Toplevel):
             logger.warning("An error occurred value(s) not saved!")
         self.destroy()
 
+    def _regenerate_subtitles(self) -> None:
+        """
+        Save the settings and generate the subtitles of the opened videos again with them.
+        """
+        self._save_settings()
+        self.regenerate_command()
+
 
 if __name__ == '__main__':
     setup_logging()
@@ -1,16 +1,28 @@
+import hashlib
+import json
 import logging
 import shutil
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import suppress
+from contextvars import copy_context
 from datetime import timedelta
 from difflib import SequenceMatcher
 from itertools import pairwise
 from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
 
 import cv2 as cv
+import numpy as np
 
+import utilities.timings as timings
 import utilities.utils as utils
-from utilities.frames_to_text import extract_bboxes, frames_to_text, setup_ocr
+from utilities.frames_to_text import extract_bboxes, find_text_changes, frames_to_text, setup_ocr
 from utilities.logger_setup import setup_logging
-from utilities.video_to_frames import extract_frames, video_to_frames
+from utilities.results_store import ResultsStore
+from utilities.video_to_frames import (extract_frames, frame_ranges_to_frames, sampled_frame_total, split_frames,
+                                       video_to_frames)
 
 logger = logging.getLogger(__name__)
 
@@ -29,9 +41,10 @@ class SubtitleDetector:
         self.fps, self.frame_total, self.frame_width, self.frame_height = self.sub_ex.video_details(self.video_file)
         self.frame_output = self.sub_ex.vd_output_dir / "sub detect frames"  # Extracted video frame storage directory.
 
-    def _get_key_frames(self) -> None:
+    def _get_key_frames(self) -> list:
         """
         Extract frames from default subtitle area of video that should contain subtitles.
+        :return: The extracted frame positions and images.
         """
         # Decimal used to signify the relative position to choose start point to search for frames.
         split_start = utils.Config.split_start
@@ -62,8 +75,13 @@ class SubtitleDetector:
             search_area = self.sub_ex.default_sub_area(self.frame_width, self.frame_height)
         else:
             search_area = None
+        frame_output = self.frame_output if utils.Config.save_frames else None  # Frames are only saved for debugging.
+        key_frames = []
         for frames in frame_batches:
-            extract_frames(self.video_file, self.frame_output, search_area, frames[0], frames[1], int(self.fps))
+            key_frames.extend(
+                extract_frames(self.video_file, frame_output, search_area, frames[0], frames[1], int(self.fps))
+            )
+        return key_frames
 
     def _pad_sub_area(self, top_left: tuple, bottom_right: tuple) -> tuple:
         """
@@ -126,12 +144,11 @@ class SubtitleDetector:
             logger.error(f"Video file: {video_path.name} ...could not be found!\n")
             return
         self.sub_ex.empty_cache()  # Empty cache at the beginning of program run before it recreates itself.
-        if not self.frame_output.exists():
+        if utils.Config.save_frames and not self.frame_output.exists():
             self.frame_output.mkdir(parents=True)
 
         logger.info(f"Video name: {video_path.name}")
-        self._get_key_frames()
-        bboxes = extract_bboxes(self.frame_output)
+        bboxes = extract_bboxes(self._get_key_frames())
         new_sub_area = None
         if bboxes:
             top_left, bottom_right = self._get_max_boundaries(bboxes)
@@ -140,20 +157,213 @@ class SubtitleDetector:
             new_sub_area = top_left[0], top_left[1], bottom_right[0], bottom_right[1]
 
         logger.info(f"New sub area = {new_sub_area}\n")
-        self.sub_ex.empty_cache()
+        if not utils.Config.save_frames:  # Saved frames are kept for debugging.
+            self.sub_ex.empty_cache()
         return new_sub_area
 
 
+class SubtitleTimeline:
+    """
+    Subtitle texts with their start and end times in milliseconds, kept in parallel arrays in time order.
+    """
+    __slots__ = ("starts", "ends", "texts")
+
+    def __init__(self, starts: Iterable[float] = (), ends: Iterable[float] = (), texts: Iterable[str] = ()) -> None:
+        self.starts = np.asarray(starts, dtype=np.float64).reshape(-1)
+        self.ends = np.asarray(ends, dtype=np.float64).reshape(-1)
+        self.texts = list(texts)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def select(self, mask: np.ndarray) -> "SubtitleTimeline":
+        """
+        Get the subtitles where the mask is True.
+        """
+        return SubtitleTimeline(self.starts[mask], self.ends[mask], [text for text, keep in zip(self.texts, mask)
+                                                                     if keep])
+
+
+class SubtitleStream:
+    """
+    Processes extracted texts while they are being extracted and appends each subtitle to the subtitle file as soon
+    as the texts after it prove it has ended. Only the subtitles that are not decided yet are kept in memory.
+    The subtitles are the same as the subtitles SubtitleExtractor generates from all the texts at once.
+    Each step takes the subtitles decided by the step before it, with end set after the last subtitle.
+    """
+
+    def __init__(self, save_path: Path) -> None:
+        """
+        :param save_path: the subtitle file. The subtitles are appended to a part file beside it, which becomes the
+        subtitle file when the stream is finished, so a stopped extraction leaves no partial subtitle.
+        """
+        self.save_path, self.line_code = save_path, 0
+        self.part_path = save_path.with_name(f"{save_path.name}.part")
+        self.part_path.unlink(missing_ok=True)  # Left by a crashed extraction, its texts are added again.
+        self.similarity_threshold = utils.Config.text_similarity_threshold
+        self.min_consecutive_sub_dur = utils.Config.min_consecutive_sub_dur_ms
+        self.max_consecutive_short_durs = utils.Config.max_consecutive_short_durs
+        self.min_sub_duration = utils.Config.min_sub_duration_ms
+        # The run of equal texts and the latest text, which may be the last text.
+        self.equal_run = self.latest_text = None
+        # The subtitles of the pairs that are not processed yet. A pair is the last pair if no subtitle follows it.
+        self.similar_window, self.short_window = [], []
+        self.similar_run = None  # The start, text and duration of the run of similar texts.
+        self.short_run = []  # The subtitles of the run of short duration consecutive subs.
+
+    def merge_adjacent_equal_texts(self, subtitles: list[tuple], end: bool) -> list[tuple]:
+        merged = []
+        for subtitle in subtitles:
+            if self.latest_text:  # The latest text is not the last text.
+                if self.equal_run is None:
+                    self.equal_run = self.latest_text
+                elif self.equal_run[2] == self.latest_text[2]:
+                    self.equal_run = self.equal_run[0], self.latest_text[1], self.equal_run[2]
+                else:
+                    merged.append(self.equal_run)
+                    self.equal_run = self.latest_text
+            self.latest_text = subtitle
+        if end and self.equal_run:  # The last text is always kept on its own.
+            merged.extend([self.equal_run, self.latest_text])
+        return merged
+
+    def _merge_similar_pair(self, subtitle1: tuple, subtitle2: tuple, is_last_pair: bool) -> list[tuple]:
+        duration1, duration2 = subtitle1[1] - subtitle1[0], subtitle2[1] - subtitle2[0]
+        similarity = SubtitleExtractor.similarity(subtitle1[2], subtitle2[2])
+        if similarity >= self.similarity_threshold and not is_last_pair:
+            if self.similar_run is None:
+                self.similar_run = subtitle1[0], subtitle1[2], duration1
+            if duration2 > self.similar_run[2]:  # Change text and duration when longer duration is found.
+                self.similar_run = self.similar_run[0], subtitle2[2], duration2
+            return []
+        run_start, run_text, _ = self.similar_run or (subtitle1[0], subtitle1[2], None)
+        self.similar_run = None
+        return [(run_start, subtitle2[1] if is_last_pair else subtitle1[1], run_text)]
+
+    def merge_adjacent_similar_texts(self, subtitles: list[tuple], end: bool) -> list[tuple]:
+        merged, window = [], self.similar_window
+        for subtitle in subtitles:
+            window.append(subtitle)
+            if len(window) == 3:
+                merged.extend(self._merge_similar_pair(window[0], window[1], False))
+                window.pop(0)
+        if end and len(window) == 2:  # The last text is always merged into the texts before it.
+            merged.extend(self._merge_similar_pair(window[0], window[1], True))
+        return merged
+
+    def _remove_short_pair(self, subtitle1: tuple, subtitle2: tuple, is_last_pair: bool) -> list[tuple]:
+        if (subtitle1[1] - subtitle1[0] < self.min_consecutive_sub_dur
+                and subtitle2[1] - subtitle2[0] < self.min_consecutive_sub_dur and not is_last_pair):
+            self.short_run = self.short_run or [subtitle1]
+            self.short_run.append(subtitle2)
+            return []
+        if not self.short_run:
+            return [subtitle1]
+        # The first subtitle of the pair ends the run of short subtitles.
+        kept = self.short_run if len(self.short_run) < self.max_consecutive_short_durs else []
+        self.short_run = []
+        return kept
+
+    def remove_short_duration_consecutive_subs(self, subtitles: list[tuple], end: bool) -> list[tuple]:
+        kept, window = [], self.short_window
+        for subtitle in subtitles:
+            window.append(subtitle)
+            if len(window) == 3:
+                kept.extend(self._remove_short_pair(window[0], window[1], False))
+                window.pop(0)
+        if end and len(window) == 2:
+            kept.extend(self._remove_short_pair(window[0], window[1], True))
+        if end:
+            kept.extend(window[-1:])
+        return kept
+
+    def remove_short_duration_subs(self, subtitles: list[tuple]) -> list[tuple]:
+        return [subtitle for subtitle in subtitles if subtitle[1] - subtitle[0] > self.min_sub_duration]
+
+    def process(self, subtitles: list[tuple], end: bool = False) -> None:
+        with timings.stage("merge adjacent equal texts", len(subtitles)):
+            subtitles = self.merge_adjacent_equal_texts(subtitles, end)
+        with timings.stage("merge adjacent similar texts", len(subtitles)):
+            subtitles = self.merge_adjacent_similar_texts(subtitles, end)
+        with timings.stage("remove short duration consecutive subs", len(subtitles)):
+            subtitles = self.remove_short_duration_consecutive_subs(subtitles, end)
+        with timings.stage("remove short duration subs", len(subtitles)):
+            subtitles = self.remove_short_duration_subs(subtitles)
+        if not subtitles:
+            return
+        with timings.stage("srt write", len(subtitles)):
+            lines = []
+            for start, stop, text in subtitles:
+                self.line_code += 1
+                lines.append(f"{self.line_code}\n{SubtitleExtractor.timecode(start)} --> "
+                             f"{SubtitleExtractor.timecode(stop)}\n{text}\n\n")
+            with open(self.part_path, 'a', encoding="utf-8") as sub_file:
+                sub_file.writelines(lines)
+
+    def add_records(self, records: list[dict]) -> None:
+        """
+        Process the records of extracted texts. Records must be added in frame order.
+        """
+        self.process([(record["ms"], record["ms"], record["text"]) for record in records if record["text"]])
+
+    def finish(self) -> Path | None:
+        """
+        Decide the subtitles that were waiting for the end of the texts.
+        :return: The save path of the subtitle file if any subtitle was saved.
+        """
+        self.process([], end=True)
+        if not self.line_code:
+            return None
+        self.part_path.replace(self.save_path)
+        return self.save_path
+
+    def discard(self) -> None:
+        """
+        Delete the subtitles saved so far, when the texts of the video were not all extracted.
+        """
+        self.part_path.unlink(missing_ok=True)
+
+
 class SubtitleExtractor:
-    def __init__(self) -> None:
+    def __init__(self, cancel_token: utils.CancelToken = None) -> None:
         """
         Extracts hardcoded subtitles from video.
-        """
-        self.video_path, self.subtitle_texts = None, {}
-        self.divider = "--"  # Characters for separating time durations(ms) in key name.
-        self.vd_output_dir = Path(__file__).parent / "output"  # Create cache directory.
-        # Extracted video frame storage directory. Extracted text file storage directory.
-        self.frame_output, self.text_output = self.vd_output_dir / "frames", self.vd_output_dir / "extracted texts"
+        Each extractor has its own scratch directory and cancellation, so many extractors can run at the same time.
+        :param cancel_token: cancels the extractions of this extractor only. Stopping the process cancels all of them.
+        """
+        self.video_path, self.subtitle_timeline = None, SubtitleTimeline()
+        self.cancel_token = cancel_token or utils.CancelToken()
+        self.text_extraction_counts = {}  # The number of frames and ocr calls of the last text extraction.
+        self.job_name = f"job {uuid4().hex[:10]}"  # Name of the scratch directory of the extractor.
+        self.results_store = ResultsStore(self.text_output)
+        # Kept text extraction results of each video, for generating the subtitles again.
+        self.kept_results_dir = Path(__file__).parent / "ocr results"
+        # Text extraction results and state of each video being extracted, for continuing a stopped extraction.
+        self.checkpoint_dir = Path(__file__).parent / "checkpoints"
+        # The name is the video file id when not set, the checkpoint files are named after it and the settings hash.
+        self.checkpoint_hash, self.checkpoint_name = None, None
+        self.completed = False  # Whether the texts of all the frames of the last extraction were extracted.
+        self.progress = 0.0  # The part of the frames of the running extraction whose texts are extracted.
+        self.stage_timer = timings.StageTimer()  # The durations of the stages of the last extraction.
+
+    @property
+    def vd_output_dir(self) -> Path:
+        """
+        The scratch directory of the extractor, inside the configured scratch directory.
+        """
+        return Path(__file__).parent / utils.Config.scratch_dir / self.job_name
+
+    @property
+    def frame_output(self) -> Path:
+        return self.vd_output_dir / "frames"  # Extracted video frame storage directory.
+
+    @property
+    def text_output(self) -> Path:
+        return self.vd_output_dir / "extracted texts.jsonl"  # Extracted texts storage file.
 
     @staticmethod
     def video_details(video_path: str) -> tuple:
@@ -188,113 +398,71 @@ class SubtitleExtractor:
 
     def empty_cache(self) -> None:
         """
-        Delete all cache files and dictionary content produced during subtitle extraction.
+        Delete all cache files and subtitle timeline content produced during subtitle extraction.
         """
         if self.vd_output_dir.exists():
             logger.debug("Emptying cache...")
             shutil.rmtree(self.vd_output_dir)
-        if self.subtitle_texts:
-            logger.debug("Clearing subtitle texts cache...")
-            self.subtitle_texts = {}
+            with suppress(OSError):  # The scratch directory is removed when no other extractor is using it.
+                self.vd_output_dir.parent.rmdir()
+        if len(self.subtitle_timeline):
+            logger.debug("Clearing subtitle timeline cache...")
+            self.subtitle_timeline = SubtitleTimeline()
 
     def merge_adjacent_equal_texts(self) -> None:
         """
         Merge texts that are beside each other and are the exact same.
-        Use divider for duration in text name.
+        The last text is always kept on its own. A timeline with less than 2 texts becomes empty.
         """
         logger.debug("Merging adjacent equal texts")
-        new_subtitle_dict, starting_key, no_of_keys = {}, None, len(self.subtitle_texts)
-        for index, (key1, key2) in enumerate(pairwise(self.subtitle_texts.items()), start=2):
-            key1_name, key1_text, key2_name, key2_text = key1[0], key1[1], key2[0], key2[1]
-            # print(index, no_of_keys, key1_name, key1_text, key2_name, key2_text)
-            if key1_text == key2_text and index != no_of_keys:
-                if not starting_key:
-                    starting_key = key1_name
-            else:
-                # print("Text not equal\n")
-                if not starting_key:  # This condition is used when the key doesn't match the previous or next key.
-                    starting_key = key1_name
-                duration = f"{starting_key}{self.divider}{key1_name}"
-                new_subtitle_dict[duration] = key1_text
-                if index == no_of_keys:  # The last key is always added to end of dictionary to avoid being skipped.
-                    # print("No of keys reached!")
-                    duration = f"{key2_name}{self.divider}{key2_name}"
-                    new_subtitle_dict[duration] = key2_text
-                starting_key = None
-        self.subtitle_texts = new_subtitle_dict
+        timeline, no_of_texts = self.subtitle_timeline, len(self.subtitle_timeline)
+        if no_of_texts < 2:
+            self.subtitle_timeline = SubtitleTimeline()
+            return
+        texts = np.array(timeline.texts[:-1], dtype=object)
+        # Each run of equal texts before the last text ends where the next text is different.
+        run_ends = np.flatnonzero(np.append(texts[:-1] != texts[1:], True))
+        run_starts = np.append(0, run_ends[:-1] + 1)
+        starts = np.append(timeline.starts[run_starts], timeline.starts[-1])
+        ends = np.append(timeline.ends[run_ends], timeline.ends[-1])
+        self.subtitle_timeline = SubtitleTimeline(starts, ends, [*texts[run_ends], timeline.texts[-1]])
 
     @staticmethod
     def similarity(text1: str, text2: str) -> float:
         return SequenceMatcher(a=text1, b=text2).quick_ratio()
 
-    def similar_text_name_gen(self, start_name: str, end_name: str) -> str:
-        """
-        Takes 2 name durations and creates a new name.
-        """
-        start_name, end_name = start_name.split(self.divider)[0], end_name.split(self.divider)[1]
-        new_name = f"{start_name}{self.divider}{end_name}"
-        return new_name
-
-    def name_to_duration(self, name: str) -> float:
-        """
-        Takes a name with two numbers and subtracts to get the duration in milliseconds.
-        :param name: Name numbers should be separated by divider.
-        :return: Duration
-        """
-        name_timecode = name.split(self.divider)
-        duration = float(name_timecode[1]) - float(name_timecode[0])
-        return duration
-
     def merge_adjacent_similar_texts(self) -> None:
         """
         Merge texts that are not the same but beside each other and similar.
         The text that has the longest duration becomes the text for all similar texts.
+        The last text is always merged into the texts before it. A timeline with less than 2 texts becomes empty.
         """
         logger.debug("Merging adjacent similar texts")
         similarity_threshold = utils.Config.text_similarity_threshold  # Cut off point to determine similarity.
-        new_subtitle_dict, no_of_keys = {}, len(self.subtitle_texts)
-        starting_key = starting_key_txt = starting_key_dur = None
-        for index, (key1, key2) in enumerate(pairwise(self.subtitle_texts.items()), start=2):
-            key1_name, key1_txt, key1_dur = key1[0], key1[1], self.name_to_duration(key1[0])
-            key2_name, key2_txt, key2_dur = key2[0], key2[1], self.name_to_duration(key2[0])
-            similarity = self.similarity(key1_txt, key2_txt)
-            # print(f"Index: {index}, No of Keys: {no_of_keys}\n"
-            #       f"Key 1 Name: {key1_name}, Duration: {key1_dur}, Text: {key1_txt}\n"
-            #       f"Key 2 Name: {key2_name}, Duration: {key2_dur}, Text: {key2_txt}\n"
-            #       f"Key 1 & 2 Similarity: {similarity}")
-            if similarity >= similarity_threshold and index != no_of_keys:
-                if not starting_key:
-                    starting_key, starting_key_txt, starting_key_dur = key1_name, key1_txt, key1_dur
-
-                if key2_dur > starting_key_dur:  # Change text and duration when longer duration is found.
-                    # print(f"--- Longer duration found: {key2_dur} ---")
-                    starting_key_txt, starting_key_dur = key2_txt, key2_dur
+        timeline, no_of_texts = self.subtitle_timeline, len(self.subtitle_timeline)
+        texts, durations = timeline.texts, timeline.durations.tolist()
+        run_start = run_text = run_duration = None
+        starts, ends, new_texts = [], [], []
+        for i in range(no_of_texts - 1):
+            is_last_pair = i == no_of_texts - 2
+            if self.similarity(texts[i], texts[i + 1]) >= similarity_threshold and not is_last_pair:
+                if run_start is None:
+                    run_start, run_text, run_duration = i, texts[i], durations[i]
+                if durations[i + 1] > run_duration:  # Change text and duration when longer duration is found.
+                    run_text, run_duration = texts[i + 1], durations[i + 1]
             else:
-                if not starting_key:  # This condition is used when the key doesn't match the previous or next key.
-                    starting_key, starting_key_txt = key1_name, key1_txt
-
-                if index == no_of_keys:
-                    # print("No of keys reached!")
-                    ending_key = key2_name  # This doesn't work well when the last key's text is not similar.
-                else:
-                    ending_key = key1_name
-
-                new_key_name = self.similar_text_name_gen(starting_key, ending_key)
-                # print(f"New key name: {new_key_name} \nNew key text: {starting_key_txt}\n")
-                new_subtitle_dict[new_key_name] = starting_key_txt
-                starting_key = starting_key_txt = starting_key_dur = None
-        self.subtitle_texts = new_subtitle_dict
-
-    def delete_keys(self, keys: set) -> None:
-        """
-        Delete all key durations in the set if they exist.
-        """
-        for key in keys:
-            del self.subtitle_texts[key]
+                if run_start is None:  # This condition is used when the text doesn't match the previous or next text.
+                    run_start, run_text = i, texts[i]
+                run_end = i + 1 if is_last_pair else i  # This doesn't work well when the last text is not similar.
+                starts.append(timeline.starts[run_start])
+                ends.append(timeline.ends[run_end])
+                new_texts.append(run_text)
+                run_start = run_text = run_duration = None
+        self.subtitle_timeline = SubtitleTimeline(starts, ends, new_texts)
 
     def remove_short_duration_consecutive_subs(self) -> None:
         """
-        Deletes keys that contain subtitles that have durations that are shorter than the given minimum duration
+        Deletes subtitles that have durations that are shorter than the given minimum duration
         in the given number of consecutive texts.
         """
         logger.debug("Removing short duration consecutive subs")
@@ -303,45 +471,38 @@ class SubtitleExtractor:
         # Maximum allowed number of short durations in a row.
         max_consecutive_short_durs = utils.Config.max_consecutive_short_durs
 
-        keys_for_deletion, short_dur_keys, no_of_keys = set(), set(), len(self.subtitle_texts)
-        for index, (dur_1, dur_2) in enumerate(pairwise(self.subtitle_texts), start=2):
-            key1_dur, key2_dur = self.name_to_duration(dur_1), self.name_to_duration(dur_2)
-            # print(f"Index: {index}, No of Keys: {no_of_keys}\n"
-            #       f"Key 1 Name: {dur_1}, Duration: {key1_dur}\n"
-            #       f"Key 2 Name: {dur_2}, Duration: {key2_dur}")
-            if key1_dur < min_consecutive_sub_dur and key2_dur < min_consecutive_sub_dur and index != no_of_keys:
-                short_dur_keys.add(dur_1)
-                short_dur_keys.add(dur_2)
-            else:
-                if len(short_dur_keys) >= max_consecutive_short_durs:
-                    # print(f"Short durations found for deletion! Keys: ({len(short_dur_keys)}) = {short_dur_keys}\n")
-                    keys_for_deletion.update(short_dur_keys)
-                short_dur_keys = set()
-        self.delete_keys(keys_for_deletion)
+        timeline = self.subtitle_timeline
+        if len(timeline) < 2:
+            return
+        is_short = timeline.durations < min_consecutive_sub_dur
+        # Pairs of short subtitles in a row, the last pair is never counted.
+        short_pairs = np.append(is_short[:-2] & is_short[1:-1], False).astype(np.int8)
+        changes = np.flatnonzero(np.diff(np.append(0, short_pairs)))
+        keep = np.ones(len(timeline), dtype=bool)
+        for first_pair, end_pair in zip(changes[::2], changes[1::2]):
+            # The subtitles of a run of short pairs are the first subtitle of each pair and the second of the last pair.
+            if end_pair - first_pair + 1 >= max_consecutive_short_durs:
+                keep[first_pair:end_pair + 1] = False
+        self.subtitle_timeline = timeline.select(keep)
 
     def remove_short_duration_subs(self) -> None:
         """
-        Deletes keys that contain subtitles that have durations that are shorter than the minimum duration.
+        Deletes subtitles that have durations that are shorter than or equal to the minimum duration.
         """
         logger.debug("Removing short duration subs")
         # Minimum allowed time in milliseconds.
         min_sub_duration = utils.Config.min_sub_duration_ms
-        short_dur_keys = set()
-        for ms_duration in self.subtitle_texts:
-            duration = self.name_to_duration(ms_duration)
-            if duration <= min_sub_duration:
-                short_dur_keys.add(ms_duration)
-        self.delete_keys(short_dur_keys)
+        self.subtitle_timeline = self.subtitle_timeline.select(self.subtitle_timeline.durations > min_sub_duration)
 
     def process_extracted_texts(self) -> None:
         """
-        Process extracted texts in dictionary.
+        Process extracted texts in the subtitle timeline.
         """
         logger.debug("Processing extracted texts...")
-        self.merge_adjacent_equal_texts()
-        self.merge_adjacent_similar_texts()
-        self.remove_short_duration_consecutive_subs()
-        self.remove_short_duration_subs()
+        for step in (self.merge_adjacent_equal_texts, self.merge_adjacent_similar_texts,
+                     self.remove_short_duration_consecutive_subs, self.remove_short_duration_subs):
+            with timings.stage(step.__name__.replace("_", " "), len(self.subtitle_timeline)):
+                step()
 
     @staticmethod
     def timecode(frame_no_in_milliseconds: float) -> str:
@@ -358,89 +519,311 @@ class SubtitleExtractor:
 
     def generate_subtitle(self) -> list:
         """
-        Use processed text files in dictionary to create subtitle file.
+        Use processed texts in the subtitle timeline to create subtitle file.
         """
         # Cancel if process has been cancelled by gui.
-        if utils.Process.interrupt_process:
+        if self.cancel_token.cancelled:
             logger.warning("Subtitle generation process interrupted!")
             return []
 
         logger.info("Generating subtitle...")
         subtitles = []
-        for line_code, (ms_dur, txt) in enumerate(self.subtitle_texts.items(), start=1):
-            key_name = ms_dur.split(self.divider)
-            frame_start, frame_end = self.timecode(float(key_name[0])), self.timecode(float(key_name[1]))
-            subtitle_line = f"{line_code}\n{frame_start} --> {frame_end}\n{txt}\n\n"
-            subtitles.append(subtitle_line)
+        timeline = self.subtitle_timeline
+        with timings.stage("generate subtitle", len(timeline)):
+            for line_code, (start, end, txt) in enumerate(zip(timeline.starts, timeline.ends, timeline.texts), 1):
+                frame_start, frame_end = self.timecode(start), self.timecode(end)
+                subtitle_line = f"{line_code}\n{frame_start} --> {frame_end}\n{txt}\n\n"
+                subtitles.append(subtitle_line)
         logger.info("Subtitle generated!")
         return subtitles
 
-    def load_extracted_texts(self) -> None:
+    def load_extracted_texts(self, texts: dict[float, str] = None) -> None:
         """
-        Load extracted texts files into dictionary. The name of the file which represents the duration in milliseconds
-        will be the key and text of the file will be the value.
-        The files will be sorted before being added to the dict, this prevents the need for sorting again.
+        Load extracted texts from the results store into the subtitle timeline. The frame position in milliseconds
+        will be the start and end of the text.
+        The texts are sorted by the results store, this prevents the need for sorting again.
+        :param texts: texts by frame position to load instead of the results store.
         """
         logger.debug("Loading extracted tests...")
-        for file in sorted(self.text_output.iterdir(), key=lambda name: float(name.stem)):
-            if file_text := file.read_text(encoding="utf-8"):
-                self.subtitle_texts[file.stem] = file_text
+        if texts is None:
+            start = perf_counter()
+            texts = self.results_store.texts()
+            timings.record("results load", perf_counter() - start, len(texts))
+        texts = {frame_position: text for frame_position, text in texts.items() if text}
+        self.subtitle_timeline = SubtitleTimeline(list(texts), list(texts), texts.values())
 
-    def gen_sub_file_name(self) -> Path:
+    def gen_sub_file_name(self, label: str = None) -> Path:
         """
         If the file name doesn't exist, return it directly.
         If the file name already exists, append a unique identifier to the file name.
+        :param label: text added to the file name after the video name.
         :return: new file name with path.
         """
-        new_file_path = self.video_path.with_suffix(".srt")
+        name = f"{self.video_path.stem} [{label}]" if label else self.video_path.stem
+        new_file_path = self.video_path.with_name(f"{name}.srt")
         if not new_file_path.exists():
             return new_file_path
 
         for i in range(1, 20):  # max copies
-            new_file_path = self.video_path.with_name(f"{self.video_path.stem} ({i}).srt")
+            new_file_path = self.video_path.with_name(f"{name} ({i}).srt")
             if not new_file_path.exists():
                 return new_file_path
         raise RuntimeError("Could not generate a unique save path!")
 
-    def save_subtitle(self, lines: list) -> Path | None:
+    def save_subtitle(self, lines: list, label: str = None) -> Path | None:
         """
         Save generated subtitle file in the same location as video file.
         :param lines: subtitle lines to be written to file.
+        :param label: text added to the file name after the video name.
         :return: The save path of generated subtitle.
         """
         if not lines:
             logger.info(f"No lines in subtitles generated. Name: {self.video_path.name}")
             return
-        save_path = self.gen_sub_file_name()
-        with open(save_path, 'w', encoding="utf-8") as new_sub:
+        save_path = self.gen_sub_file_name(label)
+        with timings.stage("srt write", len(lines)), open(save_path, 'w', encoding="utf-8") as new_sub:
             new_sub.writelines(lines)
         logger.info(f"Subtitle file saved. Path: {save_path}")
         return save_path
 
-    def get_frames_and_texts(self, sub_area: tuple, start_frame: int | None, stop_frame: int | None) -> None:
+    def text_change_ranges(self, fps: float, start_frame: int, stop_frame: int) -> list:
+        """
+        Find the extracted frames that have a different text from the next extracted frame.
+        :return: The first and end frame of the frames between each pair of extracted frames with different texts,
+        and the texts of the two extracted frames.
+        """
+        every = utils.Config.frame_extraction_frequency
+        texts = {round(frame_position * fps / 1000): text
+                 for frame_position, text in self.results_store.texts().items()}
+        # The stop frame is included without a text, so the frames after the last extracted frame are searched.
+        frame_nos, change_ranges = [*range(start_frame + -start_frame % every, stop_frame, every), stop_frame], []
+        for frame_no1, frame_no2 in pairwise(frame_nos):
+            text1, text2 = texts.get(frame_no1, ""), texts.get(frame_no2, "")
+            if text1 != text2 and frame_no2 - frame_no1 > 1:
+                change_ranges.append((frame_no1 + 1, frame_no2, text1, text2))
+        return change_ranges
+
+    def refine_text_changes(self, sub_area: tuple, start_frame: int, stop_frame: int) -> None:
+        """
+        Extract texts from the frames that were skipped between extracted frames with different texts, to find the
+        exact frames where the texts change. This gives subtitle timings of a frame extraction frequency of 1.
+        """
+        fps = self.video_details(str(self.video_path))[0]
+        change_ranges = self.text_change_ranges(fps, start_frame, stop_frame)
+        range_texts = {(start, end): (text1, text2) for start, end, text1, text2 in change_ranges}
+        frames = frame_ranges_to_frames(str(self.video_path), sub_area, list(range_texts), self.cancel_token)
+        frames = utils.prefetch(frames, utils.Config.ocr_max_processes, "Frame Range Extraction", "Text Change Search",
+                                lambda item: len(item[1]))
+        text_changes = ((*range_texts[frame_range], range_frames) for frame_range, range_frames in frames)
+        ocr_calls = find_text_changes(text_changes, self.results_store, len(change_ranges), self.cancel_token)
+        self.text_extraction_counts["text_changes"] = len(change_ranges)
+        self.text_extraction_counts["ocr_calls"] += ocr_calls
+
+    @staticmethod
+    def refines_text_changes() -> bool:
+        return utils.Config.frame_accurate_timing and utils.Config.frame_extraction_frequency > 1
+
+    def get_frames_and_texts(self, sub_area: tuple, start_frame: int, stop_frame: int,
+                             subtitle_stream: SubtitleStream = None, resume_frame: int = None) -> bool:
         """
         Get the frames and the images from the video by calling external functions.
-        """
+        The frames are handed to the text extraction in memory, they are only saved to disk for debugging.
+        Frames are extracted in a separate thread, so text extraction starts on the first frames while later frames
+        are being extracted. The checkpoint is moved past each frame batch once all its texts are in the results store.
+        :param subtitle_stream: the extracted texts are added to it in frame order while they are extracted.
+        :param resume_frame: frame where the extraction continues, the texts of the frames before it are extracted.
+        :return: True if the texts of all the frames were extracted.
+        """
+        frame_output = self.frame_output if utils.Config.save_frames else None
+        every = utils.Config.frame_extraction_frequency
+        resume_frame = start_frame if resume_frame is None else resume_frame
+        frame_total = sampled_frame_total(resume_frame, stop_frame, every)
+        frame_batches = split_frames(resume_frame, stop_frame, self.video_details(str(self.video_path))[1])
+
+        def batch_done(records: list[dict], frame_batches_done: int) -> None:
+            if subtitle_stream:
+                subtitle_stream.add_records(records)
+            if frame_batches_done:
+                done_frame = frame_batches[frame_batches_done - 1][1]
+                self.save_checkpoint(done_frame)
+                self.progress = (done_frame - start_frame) / max(stop_frame - start_frame, 1)
+
         try:
-            video_to_frames(str(self.video_path), self.frame_output, sub_area, start_frame, stop_frame)
-            frames_to_text(self.frame_output, self.text_output)
+            frames = video_to_frames(str(self.video_path), frame_output, sub_area, resume_frame, stop_frame,
+                                     self.cancel_token)
+            frames = utils.prefetch(frames, utils.Config.ocr_max_processes, "Frame Extraction", "Text Extraction")
+            self.text_extraction_counts = frames_to_text(frames, self.results_store, frame_total, batch_done,
+                                                         self.cancel_token)
+            if self.refines_text_changes():
+                self.refine_text_changes(sub_area, start_frame, stop_frame)
+            return not self.cancel_token.cancelled
         except Exception as error:
             logger.exception(f"An error occurred during frame & text extraction! \nError: {error}")
-        assert len(list(self.frame_output.iterdir())) == len(list(self.text_output.iterdir()))
+            return False
+
+    def video_file_id(self) -> str:
+        """
+        The name of the files kept for the video. Videos with the same name in different directories have different
+        names.
+        """
+        path_hash = hashlib.sha1(str(self.video_path.resolve()).encode()).hexdigest()[:10]
+        return f"{self.video_path.stem} {path_hash}"
+
+    def extraction_settings_hash(self, sub_area: tuple, start_frame: int, stop_frame: int) -> str:
+        """
+        Hash of the video file and the settings that change the extracted texts.
+        A checkpoint is only continued by an extraction with the same hash.
+        """
+        video_stat = self.video_path.stat()
+        config_keys = ("frame_extraction_frequency", "frame_extraction_batch_size", "frame_change_threshold",
+                       "text_edge_threshold", "frame_accurate_timing", "ocr_rec_language", "text_drop_score",
+                       "line_break", "recognition_only", "recognition_only_min_score", "ocr_backend")
+        settings = [str(self.video_path.resolve()), video_stat.st_size, video_stat.st_mtime_ns, sub_area, start_frame,
+                    stop_frame, [getattr(utils.Config, key) for key in config_keys], utils.Config.ocr_opts]
+        return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+    def checkpoint_files(self) -> tuple[Path, Path]:
+        """
+        The state file and the text extraction results file of the checkpoint of the video and the settings of the
+        extraction. Extractions of the same video with different settings, e.g. by the server and the command line,
+        have different checkpoints and run at the same time without changing each other's checkpoint.
+        """
+        name = f"{self.checkpoint_name or self.video_file_id()} {self.checkpoint_hash[:10]}"
+        return self.checkpoint_dir / f"{name}.json", self.checkpoint_dir / f"{name}.jsonl"
+
+    def resume_checkpoint(self, settings_hash: str, start_frame: int, fps: float) -> int:
+        """
+        Write the text extraction results to the checkpoint of the video and the settings. A stopped extraction of
+        the video with the same settings is continued, otherwise a new checkpoint is started. The checkpoints of
+        other settings are kept, to be continued by an extraction with their settings.
+        :param fps: the frame rate of the video, for the frame numbers of the records.
+        :return: The frame where the extraction continues.
+        """
+        self.checkpoint_hash = settings_hash
+        state_file, results_file = self.checkpoint_files()
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.results_store = ResultsStore(results_file)
+        state = json.loads(state_file.read_text(encoding="utf-8")) if state_file.exists() else {}
+        if state.get("settings_hash") != settings_hash:
+            results_file.unlink(missing_ok=True)
+            self.save_checkpoint(start_frame)
+            return start_frame
+        # A text batch can end after the checkpoint, the records of the frames from the checkpoint on are removed
+        # because they are extracted again. A cut off last record is removed too.
+        done_frame = state["done_frame"]
+        records = [record for record in self.results_store.load() if round(record["ms"] * fps / 1000) < done_frame]
+        self.results_store.write(records)
+        logger.info(f"Continuing stopped extraction from checkpoint. Frame No: {done_frame}")
+        return done_frame
+
+    def save_checkpoint(self, done_frame: int) -> None:
+        """
+        Save the frame where the extraction continues if it is stopped.
+        The texts of the frames before it are in the results store.
+        """
+        state_file = self.checkpoint_files()[0]
+        temp_file = state_file.with_suffix(".tmp")
+        temp_file.write_text(json.dumps({"settings_hash": self.checkpoint_hash, "done_frame": done_frame}),
+                             encoding="utf-8")
+        temp_file.replace(state_file)
+
+    def remove_checkpoint(self) -> None:
+        for checkpoint_file in self.checkpoint_files():
+            checkpoint_file.unlink(missing_ok=True)
+
+    def kept_results_file(self) -> Path:
+        """
+        The file of the kept text extraction results of the video.
+        """
+        return self.kept_results_dir / f"{self.video_file_id()}.jsonl"
+
+    def keep_results(self) -> None:
+        """
+        Copy the text extraction results of the video out of the cache, so the subtitle can be generated again.
+        """
+        if self.results_store.path.exists():
+            self.kept_results_dir.mkdir(parents=True, exist_ok=True)
+            # The results are replaced at once, so extractions of the video at the same time never mix their results.
+            kept_file = self.kept_results_file()
+            temp_file = kept_file.with_name(f"{kept_file.name}.{self.job_name}.tmp")
+            shutil.copyfile(self.results_store.path, temp_file)
+            temp_file.replace(kept_file)
+            logger.debug(f"Text extraction results kept. Path: {kept_file}")
+
+    def regenerate_subtitle(self, video_path: str, settings: list[dict] = None) -> list[Path]:
+        """
+        Generate the subtitle of a video again from its kept text extraction results, without extracting the texts.
+        :param video_path: path of a video that was extracted with keep ocr results enabled.
+        :param settings: subtitle generator config values of each subtitle to generate. The subtitles are saved
+        side by side, with the values in their names. Without settings a subtitle is generated with the config.
+        :return: The save paths of the generated subtitles.
+        """
+        self.video_path = Path(video_path)
+        results_file = self.kept_results_file()
+        if not results_file.exists():
+            logger.error(f"No kept text extraction results for video: {self.video_path.name}\n")
+            return []
+        texts, save_paths = ResultsStore(results_file).texts(), []
+        for values in settings or [{}]:
+            with utils.Config.snapshot(values):  # The config in memory and the config file are not changed.
+                self.load_extracted_texts(texts)
+                self.process_extracted_texts()
+                label = ", ".join(f"{key}={value}" for key, value in values.items())
+                if save_path := self.save_subtitle(self.generate_subtitle(), label):
+                    save_paths.append(save_path)
+        self.subtitle_timeline = SubtitleTimeline()
+        return save_paths
+
+    def save_timings_report(self, save_path: Path, total_time: float) -> None:
+        """
+        Save the stage timings of the last extraction as json beside its output and summarise them in the log.
+        The trace of a traced extraction is saved beside them.
+        :param save_path: the subtitle or results file of the extraction.
+        :param total_time: the duration of the extraction in seconds.
+        """
+        frames = self.text_extraction_counts.get("frames", 0)
+        report = {"video": str(self.video_path), "completed": self.completed, "total_time_s": round(total_time, 3),
+                  "frames": frames, "frames_per_s": round(frames / total_time, 1) if total_time else None,
+                  "text_extraction_counts": self.text_extraction_counts, "stages": self.stage_timer.report()}
+        report_path = save_path.with_name(f"{save_path.stem} timings.json")
+        report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"Stage timings saved. Path: {report_path}\n{self.stage_timer.summary()}")
+        if self.stage_timer.tracing:
+            trace_path = save_path.with_name(f"{save_path.stem} trace.json")
+            trace_path.write_text(json.dumps(self.stage_timer.trace(), separators=(",", ":")), encoding="utf-8")
+            logger.info(f"Extraction trace saved. Path: {trace_path}")
 
     def run_extraction(self, video_path: str, sub_area: tuple = None, start_frame: int = None,
-                       stop_frame: int = None) -> Path | None:
+                       stop_frame: int = None, settings: dict = None) -> Path | None:
         """
         Run through the steps of extracting texts from subtitle area in video to create subtitle.
+        The extraction uses a snapshot of the config taken when it starts, config changes made while it runs are
+        used by the next extraction.
+        :param settings: config values used by this extraction instead of the config values.
         """
-        self.video_path = Path(video_path)
+        with utils.Config.snapshot(settings):
+            self.stage_timer = timings.StageTimer(utils.Config.trace_extraction)
+            with timings.use_timer(self.stage_timer):
+                return self._run_extraction(video_path, sub_area, start_frame, stop_frame)
+
+    def _start_extraction(self, video_path: str, sub_area: tuple | None, start_frame: int | None,
+                          stop_frame: int | None, checkpoint_name: str = None) -> tuple | None:
+        """
+        Prepare the scratch directory and the checkpoint of an extraction.
+        :param checkpoint_name: name of the checkpoint files, the video file id by default.
+        :return: The sub area, start frame, stop frame and resume frame of the extraction. None if there is no video.
+        """
+        self.video_path, self.completed, self.progress = Path(video_path), False, 0.0
+        self.text_extraction_counts = {}
+        self.checkpoint_name = checkpoint_name
         if not self.video_path.exists() or not self.video_path.is_file():
             logger.error(f"Video file: {self.video_path.name} ...could not be found!\n")
             return
         self.empty_cache()  # Empty cache at the beginning of program run before it recreates itself.
         # If the directories do not exist, create the directories.
-        self.frame_output.mkdir(parents=True)
-        self.text_output.mkdir(parents=True)
+        if utils.Config.save_frames:
+            self.frame_output.mkdir(parents=True)
+        self.vd_output_dir.mkdir(parents=True, exist_ok=True)
 
         fps, frame_total, frame_width, frame_height = self.video_details(video_path)
         sub_area = sub_area or self.default_sub_area(frame_width, frame_height)
@@ -450,21 +833,150 @@ class SubtitleExtractor:
                     f"Resolution: {frame_width} X {frame_height}\n"
                     f"Subtitle Area: {sub_area}\n"
                     f"Start Frame No: {start_frame}, Stop Frame No: {stop_frame}")
-        start = cv.getTickCount()
 
-        self.get_frames_and_texts(sub_area, start_frame, stop_frame)
-        self.load_extracted_texts()
-        self.process_extracted_texts()
-        subtitles = self.generate_subtitle()
-        save_path = self.save_subtitle(subtitles)
+        start_frame, stop_frame = start_frame or 0, stop_frame or frame_total
+        settings_hash = self.extraction_settings_hash(sub_area, start_frame, stop_frame)
+        resume_frame = self.resume_checkpoint(settings_hash, start_frame, fps)
+        self.progress = (resume_frame - start_frame) / max(stop_frame - start_frame, 1)
+        return sub_area, start_frame, stop_frame, resume_frame
+
+    def _end_extraction(self) -> None:
+        """
+        Remove the checkpoint of a completed extraction and the scratch directory.
+        """
+        if self.completed:  # A stopped extraction keeps its checkpoint, to be continued by the next extraction.
+            self.remove_checkpoint()
+        self.results_store = ResultsStore(self.text_output)
+        if not utils.Config.save_frames:  # Saved frames are kept for debugging.
+            self.empty_cache()
+
+    def _run_extraction(self, video_path: str, sub_area: tuple | None, start_frame: int | None,
+                        stop_frame: int | None) -> Path | None:
+        start = cv.getTickCount()
+        if not (extraction := self._start_extraction(video_path, sub_area, start_frame, stop_frame)):
+            return
+        sub_area, start_frame, stop_frame, resume_frame = extraction
+        # The subtitles are saved while the texts are extracted, unless the texts are changed by a later search.
+        subtitle_stream = None
+        if utils.Config.stream_subtitles and not self.refines_text_changes():
+            subtitle_stream = SubtitleStream(self.gen_sub_file_name())
+            logger.info(f"Subtitle lines are saved while texts are extracted. Path: {subtitle_stream.part_path}")
+            load_start = perf_counter()
+            records = self.results_store.load()  # The texts extracted before the checkpoint.
+            timings.record("results load", perf_counter() - load_start, len(records))
+            subtitle_stream.add_records(records)
+        self.completed = self.get_frames_and_texts(sub_area, start_frame, stop_frame, subtitle_stream, resume_frame)
+        if utils.Config.keep_ocr_results:
+            self.keep_results()
+        save_path = None
+        if not self.completed:  # The extraction continues from its checkpoint next time, no partial subtitle is saved.
+            if subtitle_stream:
+                subtitle_stream.discard()
+            logger.info(f"Subtitle not saved, the texts of all the frames were not extracted. "
+                        f"Name: {self.video_path.name}")
+        elif subtitle_stream:
+            if save_path := subtitle_stream.finish():
+                logger.info(f"Subtitle file saved. Path: {save_path}")
+            else:
+                logger.info(f"No lines in subtitles generated. Name: {self.video_path.name}")
+        else:
+            self.load_extracted_texts()
+            self.process_extracted_texts()
+            subtitles = self.generate_subtitle()
+            save_path = self.save_subtitle(subtitles)
+        self._end_extraction()
 
         end = cv.getTickCount()
         total_time = (end - start) / cv.getTickFrequency()
+        # The report is beside the subtitle, or named after the video when no subtitle was saved.
+        self.save_timings_report(save_path or self.video_path.with_suffix(".srt"), total_time)
         total_time = timedelta(seconds=round(total_time))
         logger.info(f"Subtitle Extraction Done! Total time: {total_time}\n")
-        self.empty_cache()
         return save_path
 
+    def run_text_extraction(self, video_path: str, results_path: Path, sub_area: tuple = None,
+                            start_frame: int = None, stop_frame: int = None, settings: dict = None) -> bool:
+        """
+        Extract the texts of the video without generating the subtitle, e.g. for a shard of a video.
+        The text extraction results are saved in the results path once the texts of all the frames are extracted.
+        :param settings: config values used by this extraction instead of the config values.
+        :return: True if the texts of all the frames were extracted.
+        """
+        with utils.Config.snapshot(settings):
+            self.stage_timer = timings.StageTimer(utils.Config.trace_extraction)
+            with timings.use_timer(self.stage_timer):
+                return self._run_text_extraction(video_path, Path(results_path), sub_area, start_frame, stop_frame)
+
+    def _run_text_extraction(self, video_path: str, results_path: Path, sub_area: tuple | None,
+                             start_frame: int | None, stop_frame: int | None) -> bool:
+        start = perf_counter()
+        # The checkpoint is named after the results path, so parts of a video can be extracted at the same time.
+        results_hash = hashlib.sha1(str(results_path.resolve()).encode()).hexdigest()[:10]
+        checkpoint_name = f"{Path(video_path).stem} {results_hash}"
+        if not (extraction := self._start_extraction(video_path, sub_area, start_frame, stop_frame, checkpoint_name)):
+            return False
+        sub_area, start_frame, stop_frame, resume_frame = extraction
+        self.completed = self.get_frames_and_texts(sub_area, start_frame, stop_frame, resume_frame=resume_frame)
+        if self.completed:
+            ResultsStore(results_path).write(self.results_store.load())
+            logger.info(f"Text extraction results saved. Path: {results_path}\n")
+        self._end_extraction()
+        self.save_timings_report(results_path, perf_counter() - start)
+        return self.completed
+
+
+class BatchExtractor:
+    def __init__(self, cancel_token: utils.CancelToken = None) -> None:
+        """
+        Extracts the subtitles of a queue of videos.
+        Several videos are extracted at the same time and their frame and text batches are worked on by the same
+        shared process pools, so the cores left idle at the start and end of one video are used by the next video.
+        :param cancel_token: cancels every video of the batch. Stopping the process cancels it too.
+        """
+        self.cancel_token = cancel_token or utils.CancelToken()
+        # The reason, failed or cancelled, of each video of the last batch whose texts were not all extracted.
+        self.incomplete_videos = {}
+
+    def _extract(self, video_path: str, sub_area: tuple | None, start_frame: int | None, stop_frame: int | None,
+                 settings: dict = None) -> Path | None:
+        if self.cancel_token.cancelled:  # Videos that have not started are skipped when the batch is cancelled.
+            self.incomplete_videos[video_path] = "cancelled"
+            return
+        sub_ex = SubtitleExtractor(self.cancel_token)
+        subtitle_path = sub_ex.run_extraction(video_path, sub_area, start_frame, stop_frame, settings)
+        if not sub_ex.completed:
+            self.incomplete_videos[video_path] = "cancelled" if self.cancel_token.cancelled else "failed"
+        return subtitle_path
+
+    def run(self, videos: dict[str, tuple],
+            on_video_done: Callable[[str, Path | None], None] = None) -> dict[str, Path | None]:
+        """
+        Extract the subtitles of the videos, the videos are started in the order of the queue.
+        Every video uses a snapshot of the config taken when the batch starts.
+        :param videos: the sub area, start frame, stop frame and optionally the config values used instead of the
+        config values of the batch, of each video path.
+        :param on_video_done: called with the video path and subtitle path of each video as soon as it is done.
+        :return: the subtitle path of each video, None when no subtitle was saved.
+        """
+        subtitle_paths, self.incomplete_videos = {}, {}
+        with utils.Config.snapshot():
+            concurrent_videos = max(utils.Config.concurrent_videos, 1)
+            logger.info(f"Extracting {len(videos)} video(s), {concurrent_videos} at the same time.\n")
+            with ThreadPoolExecutor(concurrent_videos, thread_name_prefix="Video Extraction") as executor:
+                # Each video runs in a copy of the context, so it uses the snapshot of the batch.
+                futures = {executor.submit(copy_context().run, self._extract, video, *sub_info): video
+                           for video, sub_info in videos.items()}
+                for future in as_completed(futures):
+                    video = futures[future]
+                    try:
+                        subtitle_paths[video] = future.result()
+                    except Exception as error:
+                        logger.exception(f"An error occurred while extracting subtitles of {video}! \nError: {error}")
+                        subtitle_paths[video], self.incomplete_videos[video] = None, "failed"
+                    if on_video_done:
+                        on_video_done(video, subtitle_paths[video])
+        return subtitle_paths
+
 
 if __name__ == '__main__':
     setup_logging()
@@ -0,0 +1,268 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from uuid import uuid4
+
+import utilities.utils as utils
+from cli import parse_frame, parse_sub_area
+from main import SubtitleDetector, SubtitleExtractor, setup_ocr
+from utilities.frames_to_text import shutdown_ocr_pool, warm_ocr_pool
+from utilities.logger_setup import setup_logging
+from utilities.video_to_frames import shutdown_frame_pool
+
+logger = logging.getLogger(__name__)
+
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class Job:
+    def __init__(self, request: dict) -> None:
+        """
+        A subtitle extraction job submitted to the job server.
+        :param request: the video and optionally the sub_area, start_frame, stop_frame, language and detect of the job.
+        """
+        if not isinstance(request, dict) or not request.get("video"):
+            raise ValueError("The job must have a video!")
+        self.video = str(request["video"])
+        if not Path(self.video).is_file():
+            raise ValueError(f"Video file: {self.video} ...could not be found!")
+        self.sub_area = parse_sub_area(request.get("sub_area"))
+        self.start_frame = parse_frame(request.get("start_frame"))
+        self.stop_frame = parse_frame(request.get("stop_frame"))
+        self.language, self.detect = request.get("language") or None, bool(request.get("detect"))
+        self.job_id, self.status, self.cancel_token = uuid4().hex[:10], "queued", utils.CancelToken()
+        self.sub_ex, self.subtitle, self.error = None, None, None
+        self.submitted, self.started, self.finished = now(), None, None
+
+    @property
+    def settings(self) -> dict:
+        """
+        The config values of the job that are used instead of the config values of the server.
+        """
+        return {"ocr_rec_language": self.language} if self.language else {}
+
+    def to_dict(self) -> dict:
+        progress = 1.0 if self.status == "done" else self.sub_ex.progress if self.sub_ex else 0.0
+        return {"id": self.job_id, "status": self.status, "video": self.video, "sub_area": self.sub_area,
+                "start_frame": self.start_frame, "stop_frame": self.stop_frame, "language": self.language,
+                "progress": round(progress, 3), "subtitle": self.subtitle, "error": self.error,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished}
+
+
+class JobServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, max_queued: int = 16, workers: int = None) -> None:
+        """
+        A local http server that runs subtitle extraction jobs. The ocr engines stay loaded between jobs, so jobs
+        do not wait for the ocr models to load.
+        :param port: port of the server, 0 uses a free port.
+        :param max_queued: the maximum number of jobs waiting to run, more jobs are refused until a job starts.
+        :param workers: the number of jobs running at the same time, the concurrent videos by default.
+        """
+        self.jobs: dict[str, Job] = {}
+        self.jobs_lock = Lock()
+        self.queue: Queue[Job] = Queue(max_queued)
+        self.workers = [Thread(target=self._work, name=f"Job Worker {i}", daemon=True)
+                        for i in range(workers or max(utils.Config.concurrent_videos, 1))]
+        self.stopping = Event()
+        self.httpd = ThreadingHTTPServer((host, port), JobRequestHandler)
+        self.httpd.job_server = self
+        self.http_thread = Thread(target=self.httpd.serve_forever, name="Job Server", daemon=True)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.httpd.server_address[:2]
+
+    def start(self, warm: bool = True) -> None:
+        """
+        Start the workers and the http server.
+        :param warm: load the ocr engines before the server accepts jobs.
+        """
+        setup_ocr()
+        if warm:
+            warm_ocr_pool()
+        for worker in self.workers:
+            worker.start()
+        self.http_thread.start()
+        logger.info(f"Job server started. Address: http://{self.address[0]}:{self.address[1]}")
+
+    def wait(self) -> None:
+        """
+        Wait until the server is stopped or the program is interrupted.
+        """
+        try:
+            while self.http_thread.is_alive():
+                self.http_thread.join(1)
+        except KeyboardInterrupt:
+            logger.info("Job server interrupted!")
+
+    def stop(self) -> None:
+        """
+        Stop the http server, cancel the jobs and stop the worker processes. Stopped jobs keep their checkpoints.
+        """
+        self.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.jobs_lock:
+            for job in self.jobs.values():
+                job.cancel_token.cancel()
+        for worker in self.workers:
+            worker.join()
+        shutdown_ocr_pool()
+        shutdown_frame_pool()
+        logger.info("Job server stopped.")
+
+    def submit(self, request: dict) -> Job:
+        """
+        Queue a new job.
+        :raises ValueError: when the request is not a valid job.
+        :raises queue.Full: when the queue has the maximum number of jobs.
+        """
+        job = Job(request)
+        self.queue.put_nowait(job)
+        with self.jobs_lock:
+            self.jobs[job.job_id] = job
+        logger.info(f"Job {job.job_id} queued. Video: {job.video}")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def all(self) -> list[Job]:
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancel a job. A queued job is cancelled straight away and a running job stops after its current batches.
+        """
+        if job := self.get(job_id):
+            job.cancel_token.cancel()
+            if job.status == "queued":
+                job.status, job.finished = "cancelled", now()
+        return job
+
+    def _work(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.get(timeout=0.2)
+            except Empty:
+                continue
+            if job.cancel_token.cancelled:
+                job.status, job.finished = "cancelled", job.finished or now()
+                continue
+            self._run_job(job)
+
+    @staticmethod
+    def _run_job(job: Job) -> None:
+        job.status, job.started = "running", now()
+        try:
+            with utils.Config.snapshot(job.settings):
+                if job.detect and not job.sub_area:
+                    job.sub_area = SubtitleDetector(job.video, utils.Config.use_search_area).get_sub_area()
+                job.sub_ex = SubtitleExtractor(job.cancel_token)
+                subtitle_path = job.sub_ex.run_extraction(job.video, job.sub_area, job.start_frame, job.stop_frame)
+            job.subtitle = str(subtitle_path) if subtitle_path else None
+            if job.sub_ex.completed:
+                job.status = "done"
+            else:
+                job.status = "cancelled" if job.cancel_token.cancelled else "failed"
+                job.error = None if job.status == "cancelled" else "The texts of the video could not be extracted."
+        except Exception as error:
+            logger.exception(f"An error occurred while running job {job.job_id}! \nError: {error}")
+            job.status, job.error = "failed", str(error)
+        job.finished = now()
+        logger.info(f"Job {job.job_id} {job.status}. Video: {job.video}")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    The json api of the job server.
+    GET /health, GET /jobs, GET /jobs/<id>, POST /jobs, DELETE /jobs/<id>
+    """
+    server_version = "VidSubX"
+
+    @property
+    def job_server(self) -> JobServer:
+        return self.server.job_server
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+    def send_json(self, status: HTTPStatus, body: dict | list) -> None:
+        content = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_error_json(self, status: HTTPStatus, message: str) -> None:
+        self.send_json(status, {"error": message})
+
+    def job_id(self) -> str | None:
+        parts = self.path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/health":
+            statuses = [job.status for job in self.job_server.all()]
+            self.send_json(HTTPStatus.OK, {"status": "ok", "queued": statuses.count("queued"),
+                                           "running": statuses.count("running")})
+        elif self.path.rstrip("/") == "/jobs":
+            self.send_json(HTTPStatus.OK, [job.to_dict() for job in self.job_server.all()])
+        elif job := self.job_server.get(self.job_id()):
+            self.send_json(HTTPStatus.OK, job.to_dict())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"Not found: {self.path}")
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/jobs":
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"Not found: {self.path}")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job = self.job_server.submit(request)
+        except (ValueError, TypeError) as error:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(error))
+        except Full:
+            self.send_error_json(HTTPStatus.SERVICE_UNAVAILABLE, "The job queue is full!")
+        else:
+            self.send_json(HTTPStatus.CREATED, job.to_dict())
+
+    def do_DELETE(self) -> None:
+        if job := self.job_server.cancel(self.job_id()):
+            self.send_json(HTTPStatus.OK, job.to_dict())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"Not found: {self.path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run subtitle extraction jobs sent to a local http server.")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the server (default: %(default)s)")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="port of the server (default: %(default)s)")
+    parser.add_argument("-q", "--max-queued", type=int, default=16,
+                        help="maximum number of jobs waiting to run (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="number of jobs running at the same time, the Concurrent Videos preference is used by "
+                             "default")
+    args = parser.parse_args()
+    setup_logging()
+    logger.debug("\n\nJob server program Started.")
+    job_server = JobServer(args.host, args.port, args.max_queued, args.jobs)
+    job_server.start()
+    job_server.wait()
+    job_server.stop()
+    logger.debug("Job server program Ended.\n\n")
+
+
+if __name__ == '__main__':
+    main()
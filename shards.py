@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Thread
+
+import utilities.utils as utils
+from main import SubtitleExtractor, setup_ocr
+from utilities.logger_setup import setup_logging
+from utilities.results_store import ResultsStore
+
+logger = logging.getLogger(__name__)
+
+# The config values that change the extracted texts or the generated subtitle. The shards and the merge use the values
+# saved in the plan, so the subtitle does not depend on the config of the computers that run them.
+plan_settings_keys = ("frame_extraction_frequency", "frame_extraction_batch_size", "frame_change_threshold",
+                      "text_edge_threshold", "frame_accurate_timing", "ocr_rec_language", "text_drop_score",
+                      "line_break", "recognition_only", "recognition_only_min_score", "ocr_backend",
+                      "text_similarity_threshold", "min_consecutive_sub_dur_ms", "max_consecutive_short_durs",
+                      "min_sub_duration_ms")
+# A running shard touches its claim file every heartbeat. A claim that was not touched for the claim timeout is of a
+# computer that crashed or lost the shared storage, and the shard is claimed again.
+claim_heartbeat_s = 60
+claim_timeout_s = 600
+
+
+def shard_results_path(plan_file: Path, index: int) -> Path:
+    return plan_file.with_name(f"shard {index}.jsonl")  # The text extraction results of a done shard.
+
+
+def shard_claim_path(plan_file: Path, index: int) -> Path:
+    return plan_file.with_name(f"shard {index}.claim")  # The computer running a shard.
+
+
+def split_shards(start_frame: int, stop_frame: int, shard_count: int, batch_size: int) -> list[dict]:
+    """
+    Split the frames between the start and stop frame into shards with about the same number of frame batches.
+    The shards start at the start of a frame batch of the whole range, so the shards extract the same frame batches
+    and texts as an extraction of the whole range.
+    """
+    batch_count = -(-(stop_frame - start_frame) // batch_size)
+    starts = sorted({start_frame + batch_count * i // shard_count * batch_size for i in range(shard_count)})
+    return [{"index": index, "start_frame": start, "stop_frame": stop}
+            for index, (start, stop) in enumerate(zip(starts, starts[1:] + [stop_frame]))]
+
+
+def create_plan(video_path: str, shard_count: int, shard_dir: Path = None, sub_area: tuple = None,
+                start_frame: int = None, stop_frame: int = None) -> Path:
+    """
+    Save the shard plan of a video with the config values of the plan.
+    The video path is saved relative to the plan when possible, so computers that mount the shared storage at
+    different paths can still find the video.
+    :param shard_dir: directory of the plan and the shard results, beside the video by default.
+    :return: The plan file.
+    """
+    video_path = Path(video_path).resolve()
+    if not video_path.is_file():
+        raise FileNotFoundError(f"Video file: {video_path} ...could not be found!")
+    plan_file = (shard_dir or video_path.with_name(f"{video_path.stem} shards")) / "plan.json"
+    if plan_file.exists():
+        raise FileExistsError(f"Shard plan already exists: {plan_file}")
+    frame_total = SubtitleExtractor.video_details(str(video_path))[1]
+    start_frame, stop_frame = start_frame or 0, stop_frame or frame_total
+    shards = split_shards(start_frame, stop_frame, shard_count, utils.Config.frame_extraction_batch_size)
+    try:
+        video = os.path.relpath(video_path, plan_file.parent.resolve())
+    except ValueError:  # The video and the plan are on different drives.
+        video = str(video_path)
+    plan = {"video": video, "sub_area": sub_area, "start_frame": start_frame, "stop_frame": stop_frame,
+            "settings": {key: getattr(utils.Config, key) for key in plan_settings_keys}, "shards": shards}
+    plan_file.parent.mkdir(parents=True, exist_ok=True)
+    plan_file.write_text(json.dumps(plan, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Shard plan saved with {len(shards)} shard(s). Path: {plan_file}")
+    return plan_file
+
+
+def load_plan(plan_file: Path) -> dict:
+    """
+    Load a shard plan, the video path of the plan is resolved against the plan directory.
+    """
+    plan = json.loads(plan_file.read_text(encoding="utf-8"))
+    plan["video"] = os.path.normpath(plan_file.parent / plan["video"])
+    return plan
+
+
+def claim_shard(plan_file: Path, plan: dict, timeout_s: float = claim_timeout_s) -> int | None:
+    """
+    Claim the next shard that is not done or claimed. A claim file is created only if it does not exist, so two
+    computers never claim the same shard. A stale claim, not touched for the timeout, is removed and claimed again.
+    Two computers that remove the same stale claim at once can both run the shard, they save the same results.
+    :param timeout_s: the seconds after the last heartbeat of a claim that it is stale.
+    :return: The index of the claimed shard. None if no shard is left.
+    """
+    for shard in plan["shards"]:
+        index = shard["index"]
+        claim_path = shard_claim_path(plan_file, index)
+        if shard_results_path(plan_file, index).exists():
+            continue
+        try:
+            if time.time() - claim_path.stat().st_mtime > timeout_s:
+                logger.warning(f"Claiming stale shard {index} again. Claim: {claim_path.read_text(encoding='utf-8')}")
+                claim_path.unlink(missing_ok=True)
+        except FileNotFoundError:  # The shard is not claimed, or its claim was removed by another computer.
+            pass
+        try:
+            with open(claim_path, "x", encoding="utf-8") as claim_file:
+                claim_file.write(f"{socket.gethostname()} {os.getpid()} {datetime.now().isoformat(timespec='seconds')}")
+            return index
+        except FileExistsError:
+            continue
+
+
+def keep_claim(claim_path: Path, stop: Event) -> None:
+    """
+    Touch the claim file of a running shard every heartbeat until it is stopped, so the claim is not stale.
+    """
+    while not stop.wait(claim_heartbeat_s):
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:  # The shard is run without a claim, or the claim was removed.
+            return
+        except OSError as error:  # e.g. the shared storage is not reachable, the next heartbeat tries again.
+            logger.warning(f"Claim of running shard could not be touched. Path: {claim_path}, Error: {error}")
+
+
+def run_shard(plan_file: Path, index: int) -> bool:
+    """
+    Extract the texts of a shard and save them beside the plan. The claim of the shard is touched while it runs, and
+    the claim of a stopped shard is removed, so the shard can be claimed again.
+    :return: True if the texts of all the frames of the shard were extracted.
+    """
+    plan = load_plan(plan_file)
+    shard = plan["shards"][index]
+    logger.info(f"Running shard {index} of {len(plan['shards'])}. "
+                f"Frames: {shard['start_frame']} to {shard['stop_frame']}")
+    sub_area, completed = tuple(plan["sub_area"]) if plan["sub_area"] else None, False
+    stop_heartbeat = Event()
+    Thread(target=keep_claim, args=(shard_claim_path(plan_file, index), stop_heartbeat), daemon=True).start()
+    try:
+        completed = SubtitleExtractor().run_text_extraction(plan["video"], shard_results_path(plan_file, index),
+                                                            sub_area, shard["start_frame"], shard["stop_frame"],
+                                                            plan["settings"])
+    finally:
+        stop_heartbeat.set()
+        if not completed:
+            shard_claim_path(plan_file, index).unlink(missing_ok=True)
+    return completed
+
+
+def run_shards(plan_file: Path) -> bool:
+    """
+    Claim and run shards of the plan until no shard is left.
+    :return: False if a shard was stopped before all its texts were extracted.
+    """
+    done_shards = []
+    while (index := claim_shard(plan_file, load_plan(plan_file))) is not None:
+        if not run_shard(plan_file, index):
+            logger.error(f"Shard {index} was stopped. Shards done by this computer: {done_shards}")
+            return False
+        done_shards.append(index)
+    logger.info(f"No shard left. Shards done by this computer: {done_shards}")
+    return True
+
+
+def merge_shards(plan_file: Path) -> Path | None:
+    """
+    Join the texts of all the shards in frame order and generate the subtitle of the whole video once, so subtitles
+    that cross the end of a shard are merged like in an extraction of the whole video.
+    Frame accurate timing only searches the frames inside each shard.
+    :return: The save path of the subtitle. None if a shard is not done or no subtitle was generated.
+    """
+    plan = load_plan(plan_file)
+    if missing := [shard["index"] for shard in plan["shards"]
+                   if not shard_results_path(plan_file, shard["index"]).exists()]:
+        logger.error(f"The shards are not done: {missing}")
+        return
+    records = [record for shard in plan["shards"]
+               for record in ResultsStore(shard_results_path(plan_file, shard["index"])).load()]
+    texts = {record["ms"]: record["text"] for record in sorted(records, key=lambda record: record["ms"])}
+    with utils.Config.snapshot(plan["settings"]):
+        sub_ex = SubtitleExtractor()
+        sub_ex.video_path = Path(plan["video"])
+        sub_ex.load_extracted_texts(texts)
+        sub_ex.process_extracted_texts()
+        return sub_ex.save_subtitle(sub_ex.generate_subtitle())
+
+
+def main(args: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Extract the subtitle of a long video on several computers with shared storage.",
+        epilog="Create a plan, start 'run' on every computer and 'merge' when all the shards are done."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="split a video into shards")
+    plan_parser.add_argument("video", help="path of the video on the shared storage")
+    plan_parser.add_argument("-n", "--shards", type=int, required=True, help="number of shards")
+    plan_parser.add_argument("-d", "--dir", type=Path, help="directory of the plan and the shard results")
+    plan_parser.add_argument("--sub-area", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"))
+    plan_parser.add_argument("--start-frame", type=int)
+    plan_parser.add_argument("--stop-frame", type=int)
+    run_parser = commands.add_parser("run", help="run shards of a plan until no shard is left")
+    run_parser.add_argument("plan", type=Path, help="path of the plan")
+    run_parser.add_argument("-s", "--shard", type=int, help="run only this shard, even if it is claimed")
+    merge_parser = commands.add_parser("merge", help="generate the subtitle from the done shards")
+    merge_parser.add_argument("plan", type=Path, help="path of the plan")
+    args = parser.parse_args(args)
+    if args.command == "plan" and args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    setup_logging()
+    if args.command == "plan":
+        sub_area = tuple(args.sub_area) if args.sub_area else None
+        create_plan(args.video, args.shards, args.dir, sub_area, args.start_frame, args.stop_frame)
+        return 0
+    if args.command == "run":
+        setup_ocr()
+        completed = run_shard(args.plan, args.shard) if args.shard is not None else run_shards(args.plan)
+        return 0 if completed else 1
+    return 0 if merge_shards(args.plan) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
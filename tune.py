@@ -0,0 +1,243 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import utilities.utils as utils
+from main import SubtitleDetector, SubtitleExtractor, setup_ocr
+from utilities.frames_to_text import warm_ocr_pool
+from utilities.logger_setup import setup_logging
+from utilities.video_to_frames import warm_frame_pool
+
+logger = logging.getLogger(__name__)
+
+# The tuned config values, in the order they are tuned. The values that change the throughput the most are first.
+tuned_keys = ("ocr_max_processes", "onnx_intra_threads", "text_extraction_batch_size", "frame_extraction_batch_size")
+# The config values of every trial. Cached texts would make the trials after the first one faster.
+trial_settings = {"ocr_cache_max_entries": 0, "keep_ocr_results": False, "save_frames": False,
+                  "trace_extraction": False}
+
+
+def tuning_candidates(values: dict, cpus: int, sample_frames: int) -> dict[str, list[int]]:
+    """
+    The values that are tried for each tuned config value, in increasing order. The current value is always a
+    candidate.
+    :param values: the current config values.
+    :param cpus: the number of cpu cores.
+    :param sample_frames: the number of frames of the sample video.
+    """
+    counts = [count for count in (1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64) if count <= cpus] + [cpus]
+    # A frame batch that has all the frames of the sample leaves the other frame extraction processes idle.
+    frame_batch_sizes = [size for size in (25, 50, 100, 250, 500, 1000) if size <= max(sample_frames // 2, 25)]
+    candidates = {"ocr_max_processes": counts, "onnx_intra_threads": counts,
+                  "text_extraction_batch_size": [10, 25, 50, 100, 200, 400],
+                  "frame_extraction_batch_size": frame_batch_sizes}
+    return {key: sorted(set(candidates[key]) | {values[key]}) for key in tuned_keys}
+
+
+def trial_key(values: dict) -> tuple:
+    """
+    The config values of a trial, with the onnx intra threads of each ocr process. Trials that only differ in the
+    total intra threads that are split into the same threads per process are the same trial.
+    """
+    values = values | {"onnx_intra_threads": max(values["onnx_intra_threads"] // values["ocr_max_processes"], 1)}
+    return tuple(values[key] for key in tuned_keys)
+
+
+class Tuner:
+    def __init__(self, measure: Callable[[dict], dict], candidates: dict[str, list], max_trials: int,
+                 min_gain: float = 0.03) -> None:
+        """
+        Search for the tuned config values with the highest throughput, one value at a time. Each value is moved
+        towards the candidates that are faster, until no neighbouring candidate is faster, and the values are tuned
+        again until none of them changes. This takes far fewer trials than trying every combination.
+        :param measure: runs a trial with the tuned config values and returns its frames per second and details.
+        :param candidates: the values that are tried for each tuned config value, in increasing order.
+        :param max_trials: the most trials that are run.
+        :param min_gain: the part a trial must be faster than the best trial to be used, so the noise of the
+        measurements does not change the values.
+        """
+        self.measure, self.candidates = measure, candidates
+        self.max_trials, self.min_gain = max_trials, min_gain
+        self.trials = {}  # The result of each trial by its trial key.
+
+    def frames_per_s(self, values: dict) -> float | None:
+        """
+        The frames per second of the config values, measured once for each trial key.
+        :return: None when the trial is not measured because all the trials were used.
+        """
+        key = trial_key(values)
+        if key not in self.trials:
+            if len(self.trials) >= self.max_trials:
+                return None
+            logger.info(f"Trial {len(self.trials) + 1} of at most {self.max_trials}: {values}")
+            self.trials[key] = {"values": dict(values)} | self.measure(values)
+            logger.info(f"Trial {len(self.trials)} Frames/s: {self.trials[key]['frames_per_s']:,.1f}\n")
+        return self.trials[key]["frames_per_s"]
+
+    def climb(self, key: str, values: dict, frames_per_s: float) -> tuple[dict, float]:
+        """
+        Move a config value to the faster candidates next to it, first to the larger candidates and if they are not
+        faster to the smaller candidates.
+        :return: The config values and frames per second after the move.
+        """
+        candidates = self.candidates[key]
+        for step in (1, -1):
+            index, moved = candidates.index(values[key]), False
+            while 0 <= index + step < len(candidates):
+                trial_values = values | {key: candidates[index + step]}
+                if trial_key(trial_values) == trial_key(values):  # e.g. fewer intra threads than ocr processes.
+                    index += step
+                    continue
+                trial_frames_per_s = self.frames_per_s(trial_values)
+                if trial_frames_per_s is None or trial_frames_per_s <= frames_per_s * (1 + self.min_gain):
+                    break
+                values, frames_per_s, index, moved = trial_values, trial_frames_per_s, index + step, True
+            if moved:
+                break
+        return values, frames_per_s
+
+    def tune(self, values: dict) -> tuple[dict, float]:
+        """
+        :param values: the tuned config values to start from.
+        :return: The fastest tuned config values and their frames per second.
+        """
+        best_values = {key: values[key] for key in tuned_keys}
+        best_frames_per_s = self.frames_per_s(best_values)
+        changed = True
+        while changed and len(self.trials) < self.max_trials:
+            changed = False
+            for key in tuned_keys:
+                new_values, new_frames_per_s = self.climb(key, best_values, best_frames_per_s)
+                if new_values != best_values:
+                    best_values, best_frames_per_s, changed = new_values, new_frames_per_s, True
+        return best_values, best_frames_per_s
+
+
+def measure_extraction(video_path: str, sub_area: tuple, start_frame: int, stop_frame: int,
+                       repeats: int) -> Callable[[dict], dict]:
+    """
+    A measure of the frames per second of the text extraction of a part of a video.
+    The ocr engines are loaded and the frame extraction processes are started before the extraction starts, so every
+    trial, including the first one, is measured without them.
+    :param repeats: the number of times each trial is run, the median frames per second is used.
+    """
+
+    def measure(values: dict) -> dict:
+        runs = []
+        with TemporaryDirectory() as results_dir, utils.Config.snapshot(trial_settings | values):
+            try:
+                warm_ocr_pool()
+                warm_frame_pool()
+                for _ in range(repeats):
+                    sub_ex, start = SubtitleExtractor(), perf_counter()
+                    sub_ex.run_text_extraction(video_path, Path(results_dir, "results.jsonl"), sub_area,
+                                               start_frame, stop_frame)
+                    duration = perf_counter() - start
+                    frames = sub_ex.text_extraction_counts.get("frames", 0)
+                    runs.append({"frames": frames, "time_s": round(duration, 3),
+                                 "frames_per_s": round(frames / duration, 1)})
+            except Exception as error:  # e.g. too many processes for the memory of the computer.
+                logger.exception(f"An error occurred while running the trial! \nError: {error}")
+                return {"frames_per_s": 0.0, "runs": runs, "error": str(error)}
+        return {"frames_per_s": statistics.median(run["frames_per_s"] for run in runs), "runs": runs}
+
+    return measure
+
+
+def trials_table(trials: list[dict]) -> str:
+    header = f"{'Trial':>5} " + " ".join(f"{key:>27}" for key in tuned_keys) + f" {'Frames/s':>9}"
+    lines = [f"{i:>5} " + " ".join(f"{trial['values'][key]:>27}" for key in tuned_keys) +
+             f" {trial['frames_per_s']:>9.1f}" + (" Failed" if "error" in trial else "")
+             for i, trial in enumerate(trials, 1)]
+    return "\n".join([header, *lines])
+
+
+def run_tuning(video_path: str, sub_area: tuple | None, start: float, seconds: float, max_trials: int, repeats: int,
+               report_path: Path, save: bool) -> dict:
+    """
+    Tune the config values on a sample of a video and save the fastest values to the config file.
+    :param start: the position of the sample relative to the length of the video.
+    :param seconds: the length of the sample.
+    :return: The tuning report.
+    """
+    fps, frame_total, frame_width, frame_height = SubtitleExtractor.video_details(video_path)
+    start_frame = int(frame_total * start)
+    stop_frame = min(start_frame + int(fps * seconds), frame_total)
+    if not sub_area:
+        sub_area = SubtitleDetector(video_path, utils.Config.use_search_area).get_sub_area()
+    sub_area = sub_area or SubtitleExtractor.default_sub_area(frame_width, frame_height)
+    values, cpus = utils.Config.get_values(), os.cpu_count() or 1
+    candidates = tuning_candidates(values, cpus, stop_frame - start_frame)
+    logger.info(f"Tuning {', '.join(tuned_keys)} on frames {start_frame} to {stop_frame} of {video_path}. "
+                f"Sub area: {sub_area}, CPU cores: {cpus}, Max trials: {max_trials}")
+
+    measure = measure_extraction(video_path, sub_area, start_frame, stop_frame, repeats)
+    # An untimed run reads the sample into the disk cache, so the first trial is measured like the others.
+    logger.info("Warm-up run of the config values, it is not a trial.")
+    measure({key: values[key] for key in tuned_keys})
+    tuner = Tuner(measure, candidates, max_trials)
+    best_values, best_frames_per_s = tuner.tune(values)
+    trials = list(tuner.trials.values())
+    baseline = trials[0]  # The first trial has the values of the config.
+    speedup = round(best_frames_per_s / baseline["frames_per_s"], 3) if baseline["frames_per_s"] else None
+    report = {"date": datetime.now().isoformat(timespec="seconds"), "video": str(video_path), "sub_area": sub_area,
+              "start_frame": start_frame, "stop_frame": stop_frame,
+              "machine": {"system": platform.platform(), "processor": platform.processor(), "cpus": cpus,
+                          "use_gpu": utils.Config.use_gpu},
+              "candidates": candidates, "baseline": baseline,
+              "best": {"values": best_values, "frames_per_s": best_frames_per_s}, "speedup": speedup,
+              "trials": trials, "saved": save and best_frames_per_s > 0}
+    if report["saved"]:
+        utils.Config.set_config(**best_values)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Tuning report saved. Path: {report_path}\n{trials_table(trials)}\n"
+                f"Best values: {best_values}, Frames/s: {baseline['frames_per_s']:,.1f} -> {best_frames_per_s:,.1f}"
+                f"{'' if report['saved'] else ' (not saved to the config file)'}")
+    return report
+
+
+def main(args: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Find the fastest OCR processes, Onnx intra threads and text and frame extraction batch sizes "
+                    "for this computer on a sample of a video and save them to the config file."
+    )
+    parser.add_argument("video", help="video with subtitles like the videos that will be extracted")
+    parser.add_argument("--sub-area", type=int, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="sub area of the video, it is detected by default")
+    parser.add_argument("--start", type=float, default=0.25,
+                        help="position of the sample relative to the length of the video (default: %(default)s)")
+    parser.add_argument("--seconds", type=float, default=60.0,
+                        help="length of the sample in seconds (default: %(default)s)")
+    parser.add_argument("-n", "--max-trials", type=int, default=20,
+                        help="most combinations that are tried (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="times each combination is run, the median is used (default: %(default)s)")
+    parser.add_argument("-r", "--report", type=Path, default=Path("tune report.json"),
+                        help="path of the JSON report of the trials (default: %(default)s)")
+    parser.add_argument("--dry-run", action="store_true", help="do not save the fastest values to the config file")
+    args = parser.parse_args(args)
+    if not Path(args.video).is_file():
+        parser.error(f"Video file: {args.video} ...could not be found!")
+    if not 0 <= args.start < 1 or args.seconds <= 0 or args.max_trials < 1 or args.repeats < 1:
+        parser.error("--start must be from 0 to 1 and --seconds, --max-trials and --repeats must be positive")
+
+    setup_logging()
+    setup_ocr()
+    sub_area = tuple(args.sub_area) if args.sub_area else None
+    report = run_tuning(args.video, sub_area, args.start, args.seconds, args.max_trials, args.repeats, args.report,
+                        not args.dry_run)
+    return 0 if report["best"]["frames_per_s"] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
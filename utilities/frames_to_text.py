@@ -1,11 +1,22 @@
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Any
 
+import cv2 as cv
+import numpy as np
 import onnxruntime as ort
-from paddleocr import PaddleOCR
 
+import utilities.timings as timings
 import utilities.utils as utils
+from utilities.ocr_backends import OCRBackend, create_ocr_backend
+from utilities.ocr_cache import OCRCache
+from utilities.results_store import ResultsStore
 
 logger = logging.getLogger(__name__)
 
@@ -27,71 +38,448 @@ def setup_ocr_device() -> None:
 
 def download_models() -> None:
     """
-    Download models if dir does not exist.
+    Download the models of the paddle ocr backend if dir does not exist.
     """
-    if not utils.Config.model_dir.exists():
+    if utils.Config.ocr_backend == "paddle" and not utils.Config.model_dir.exists():
+        from paddleocr import PaddleOCR
+
         logger.info("Checking for requested models...")
         _ = PaddleOCR(lang=utils.Config.ocr_rec_language, **utils.Config.ocr_opts)
         logger.info("")
 
 
-def extract_bboxes(files: Path) -> list:
+def text_boxes(ocr_engine: OCRBackend, images: list[np.ndarray]) -> list:
+    """
+    Returns the bounding boxes of the texts detected in the images.
+    """
+    return [line[0] for lines in ocr_engine.ocr(images) for line in lines]
+
+
+def extract_bboxes(frames: list[tuple[float, np.ndarray]]) -> list:
     """
     Returns the bounding boxes of detected texted in images.
-    :param files: Directory with images for detection.
+    The images are split between the processes of the text extraction pool, so no new ocr engine is loaded.
+    :param frames: Frame positions and images for detection.
+    """
+    images = [image for _, image in frames]
+    chunk_size = max(-(-len(images) // utils.Config.ocr_max_processes), 1)
+    with ocr_pool() as executor:
+        futures = [executor.submit(ocr_worker_task, text_boxes, images[i:i + chunk_size])
+                   for i in range(0, len(images), chunk_size)]
+        return [box for future in futures for box in future.result()[0]]
+
+
+_ocr_engine: OCRBackend | None = None  # The ocr engine of a text extraction process.
+_ocr_cache: OCRCache | None = None  # The ocr cache of a text extraction process.
+# The text extraction pools by their ocr settings, with the number of jobs using each pool.
+_ocr_pools: dict[str, list] = {}
+_ocr_pools_lock = Lock()
+# The config values used by text extraction processes. Jobs with the same values share a pool.
+ocr_pool_keys = ("text_extraction_batch_size", "onnx_intra_threads", "ocr_max_processes", "ocr_rec_language",
+                 "text_drop_score", "use_gpu", "recognition_only", "recognition_only_min_score", "ocr_cache_dir",
+                 "ocr_cache_max_entries", "ocr_backend", "ocr_opts")
+
+
+def init_ocr_worker(config: dict) -> None:
+    """
+    Load the config and the ocr engine of a new text extraction process.
+    """
+    global _ocr_engine, _ocr_cache
+    utils.Config.set_values(config)
+    setup_ocr_device()
+    _ocr_engine = create_ocr_backend()
+    _ocr_cache = create_ocr_cache()
+
+
+def ocr_worker_task(function: Callable, *args, trace: bool = False) -> tuple[Any, int, dict]:
+    """
+    Call a text extraction function with the ocr engine of the text extraction process.
+    :param trace: keep the spans of the stages timed by the function.
+    :return: The result of the function, the number of images it found in the ocr cache and the timings of the
+    stages it timed.
+    """
+    cache_hits = _ocr_cache.hits if _ocr_cache else 0
+    result, task_timings = timings.timed_task(function, _ocr_engine, *args, trace=trace)
+    return result, (_ocr_cache.hits if _ocr_cache else 0) - cache_hits, task_timings
+
+
+def create_ocr_cache() -> OCRCache | None:
+    """
+    Open the ocr cache with the settings that change the extracted text lines. The cache is disabled when
+    its max entries is 0.
+    """
+    if not utils.Config.ocr_cache_max_entries:
+        return None
+    ignored_opts = ("show_log", "onnx_providers")
+    settings = {"backend": utils.Config.ocr_backend, "lang": utils.Config.ocr_rec_language,
+                "drop_score": utils.Config.text_drop_score,
+                "recognition_only": utils.Config.recognition_only,
+                "recognition_only_min_score": utils.Config.recognition_only_min_score,
+                "ocr_opts": {key: value for key, value in utils.Config.ocr_opts.items() if key not in ignored_opts}}
+    # A relative cache directory is inside the program directory, wherever the program is started from.
+    return OCRCache(Path(__file__).parent.parent / utils.Config.ocr_cache_dir, settings)
+
+
+def evict_ocr_cache() -> None:
+    """
+    Remove the least recently used entries of the ocr cache above its max entries.
+    """
+    if ocr_cache := create_ocr_cache():
+        if evicted := ocr_cache.evict(utils.Config.ocr_cache_max_entries):
+            logger.debug(f"OCR cache entries evicted: {evicted:,}")
+        ocr_cache.close()
+
+
+@contextmanager
+def ocr_pool() -> Iterator[ProcessPoolExecutor]:
+    """
+    Use the process pool for text extraction with the ocr settings of the job. Each process loads its own ocr engine
+    once, when it starts. Jobs with the same ocr settings share a pool, and the pool is reused for every video.
+    Pools of other ocr settings are stopped once no job is using them.
+    The onnx intra threads are split between the processes, so the processes do not use more threads than the cores.
+    """
+    config = utils.Config.get_values()
+    pool_key = json.dumps({key: config[key] for key in ocr_pool_keys}, sort_keys=True)
+    with _ocr_pools_lock:
+        for key in [key for key, (_, users) in _ocr_pools.items() if key != pool_key and not users]:
+            _ocr_pools.pop(key)[0].shutdown()
+        if pool_key not in _ocr_pools:
+            max_processes = utils.Config.ocr_max_processes
+            intra_threads = max(utils.Config.onnx_intra_threads // max_processes, 1)
+            logger.debug(f"Starting OCR pool, Processes: {max_processes}, "
+                         f"Onnx intra threads per process: {intra_threads}")
+            executor = ProcessPoolExecutor(max_processes, initializer=init_ocr_worker,
+                                           initargs=(config | {"onnx_intra_threads": intra_threads},))
+            _ocr_pools[pool_key] = [executor, 0]
+        _ocr_pools[pool_key][1] += 1
+    try:
+        yield _ocr_pools[pool_key][0]
+    finally:
+        with _ocr_pools_lock:
+            _ocr_pools[pool_key][1] -= 1
+
+
+def shutdown_ocr_pool() -> None:
+    """
+    Stop the processes of the text extraction pools.
+    """
+    with _ocr_pools_lock:
+        while _ocr_pools:
+            _ocr_pools.popitem()[1][0].shutdown()
+
+
+def ocr_worker_ready(ocr_engine: OCRBackend) -> bool:
+    return ocr_engine is not None
+
+
+def warm_ocr_pool() -> None:
+    """
+    Start the text extraction processes for the ocr settings of the config and wait for their ocr engines to load,
+    so the next job with the same settings does not wait for the ocr models.
+    """
+    with ocr_pool() as executor:
+        futures = [executor.submit(ocr_worker_task, ocr_worker_ready) for _ in range(utils.Config.ocr_max_processes)]
+        logger.info(f"OCR engines loaded: {sum(future.result()[0] for future in futures)}")
+
+
+def split_text_lines(image: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """
+    Split an image into lines of text using the projection profile of its strong edges.
+    Rows with strong edges that are close together belong to the same line of text.
+    Very short lines are dropped as stray marks.
+    :return: The boxes of the lines of text from top to bottom.
     """
-    ocr_engine = PaddleOCR(use_gpu=utils.Config.use_gpu, drop_score=utils.Config.text_drop_score,
-                           lang=utils.Config.ocr_rec_language, **utils.Config.ocr_opts)
-    boxes = []
-    for file in files.iterdir():
-        result = ocr_engine.ocr(str(file))
-        if result := result[0]:
-            for line in result:
-                box = line[0]
-                boxes.append(box)
-    return boxes
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    edges = cv.morphologyEx(gray, cv.MORPH_GRADIENT, np.ones((3, 3), np.uint8)) > 100
+    height, width = edges.shape
+    text_rows = np.flatnonzero(np.count_nonzero(edges, axis=1) > width * 0.005)
+    if not text_rows.size:
+        return []
+    breaks = np.flatnonzero(np.diff(text_rows) > 2)
+    rows = list(zip(text_rows[np.r_[0, breaks + 1]], text_rows[np.r_[breaks, -1]] + 1))
+    max_line_height = max(y2 - y1 for y1, y2 in rows)
+    lines = []
+    for y1, y2 in rows:
+        if y2 - y1 < max_line_height * 0.3:
+            continue
+        columns = np.flatnonzero(edges[y1:y2].any(axis=0))
+        padding = (y2 - y1) // 4
+        lines.append((int(max(columns[0] - padding, 0)), int(max(y1 - padding, 0)),
+                      int(min(columns[-1] + 1 + padding, width)), int(min(y2 + padding, height))))
+    return lines
 
 
-def extract_text(ocr_engine, text_output: Path, files: list, line_sep: str) -> None:
+def recognise_text_lines(ocr_engine, images: list[np.ndarray], min_score: float) -> list[list]:
     """
-    Extract text from a frame using ocr.
+    Recognise the text lines of many images using ocr without text detection.
+    The images are split into lines of text and the lines of all the images are recognised together.
+    Images with no lines or with a line below the min score are detected and recognised again.
     :param ocr_engine: OCR Engine.
-    :param text_output: directory for extracted texts.
-    :param files: files with text for extraction.
+    :param images: images with text for extraction.
+    :param min_score: the lowest score of a recognised line before text detection is used.
+    :return: The box and the text and score of the text lines in each image.
+    """
+    with timings.stage("ocr line split", len(images)):
+        image_lines = [split_text_lines(image) for image in images]
+    crops = [image[y1:y2, x1:x2] for image, lines in zip(images, image_lines) for x1, y1, x2, y2 in lines]
+    rec_results = []
+    if crops:
+        with timings.stage("ocr rec", len(crops)):
+            rec_results = ocr_engine.recognise(crops)
+
+    results, rec_results = [], iter(rec_results)
+    for lines in image_lines:
+        results.append([([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], next(rec_results)) for x1, y1, x2, y2 in lines])
+    fallback = [i for i, lines in enumerate(results) if not lines or min(line[1][1] for line in lines) < min_score]
+    for i, lines in zip(fallback, ocr_engine.ocr([images[i] for i in fallback])):
+        results[i] = lines
+    return [[line for line in lines if line[1][1] >= ocr_engine.drop_score] for lines in results]
+
+
+def ocr_images(ocr_engine, images: list[np.ndarray]) -> list[list]:
+    """
+    Extract the text lines of many images using the ocr cache of the process, if it is enabled, and ocr.
+    Only the images that are not in the cache are given to the ocr engine, and their text lines are cached.
+    :param ocr_engine: OCR Engine.
+    :param images: images with text for extraction.
+    :return: The box and the text and score of the text lines in each image.
+    """
+    if _ocr_cache is None:
+        return run_ocr(ocr_engine, images)
+    with timings.stage("ocr cache lookup", len(images)):
+        keys = [_ocr_cache.image_key(image) for image in images]
+        results = _ocr_cache.get(keys)
+    missing = {key: image for key, image in zip(keys, images) if key not in results}
+    if missing:
+        missing_results = dict(zip(missing, run_ocr(ocr_engine, list(missing.values()))))
+        with timings.stage("ocr cache write", len(missing)):
+            _ocr_cache.put(missing_results)
+        results |= missing_results
+    _ocr_cache.hits, _ocr_cache.misses = _ocr_cache.hits + len(keys) - len(missing), _ocr_cache.misses + len(missing)
+    return [results[key] for key in keys]
+
+
+def run_ocr(ocr_engine, images: list[np.ndarray]) -> list[list]:
+    """
+    Extract the text lines of many images using ocr, with or without text detection.
+    :param ocr_engine: OCR Engine.
+    :param images: images with text for extraction.
+    :return: The box and the text and score of the text lines in each image.
+    """
+    if utils.Config.recognition_only:
+        return recognise_text_lines(ocr_engine, images, utils.Config.recognition_only_min_score)
+    return ocr_engine.ocr(images)
+
+
+def lines_to_text(lines: list, line_sep: str) -> str:
+    """
+    Join the texts of the text lines of an image.
+    """
+    return line_sep.join(line[1][0] for line in lines)
+
+
+def extract_text(ocr_engine, frames: list[tuple[float, np.ndarray | None]], line_sep: str) -> tuple[int, list]:
+    """
+    Extract text from frames using ocr.
+    Frames without an image have no text. Frames that share the image of another frame are unchanged and
+    reuse its text. Only frames with text have a record.
+    :param ocr_engine: OCR Engine.
+    :param frames: frame positions and images with text for extraction.
     :param line_sep: line seperator for the text.
+    :return: The number of images the texts were extracted from and the records of the frames with text.
     """
-    for file in files:
-        result = ocr_engine.ocr(str(file))
-        text = line_sep.join([line[1][0] for line in result[0]] if result[0] else "")
-        with open(f"{text_output}/{file.stem}.txt", 'w', encoding="utf-8") as text_file:
-            text_file.write(text)
+    images = list({id(image): image for _, image in frames if image is not None}.values())
+    image_lines = {id(image): lines for image, lines in zip(images, ocr_images(ocr_engine, images))}
+    records = []
+    for frame_position, image in frames:
+        if image is not None and (lines := image_lines[id(image)]):
+            records.append({"ms": frame_position, "text": lines_to_text(lines, line_sep), "lines": lines})
+    return len(images), records
 
 
-def frames_to_text(frame_output: Path, text_output: Path) -> None:
+def frames_to_text(frames: Iterable[list[tuple[float, np.ndarray | None]]], results_store: ResultsStore,
+                   frame_total: int, on_batch: Callable[[list[dict], int], None] = None,
+                   cancel_token: utils.CancelToken = None) -> dict:
     """
     Extracts the texts from frames using multiprocessing.
-    :param frame_output: directory of the frames
-    :param text_output: directory for extracted texts
+    Frame batches are taken as they become available. The number of batches waiting for extraction is limited,
+    so frames are released from memory soon after their texts are extracted.
+    Each text extraction batch has up to the batch size of different images, frames without text or with
+    the image of another frame do not count towards the batch size.
+    The records of a batch are released in frame order, once the batch and the batches before it are done.
+    When cancelled, no more batches are submitted and the submitted batches are finished.
+    :param frames: batches of frame positions and images in frame order
+    :param results_store: store of the extracted texts, the records of each batch are written together
+    :param frame_total: the expected number of frames, used for the progress
+    :param on_batch: called with the records of each batch after they are written to the store, and the number of
+    frame batches whose frames are all released
+    :param cancel_token: cancellation of the job
+    :return: The number of frames, frames without text and ocr calls.
     """
-    batch_size = utils.Config.text_extraction_batch_size  # Size of files given to each processor.
+    batch_size = utils.Config.text_extraction_batch_size  # Number of images given to each processor.
+    max_processes = utils.Config.ocr_max_processes
     prefix, device = "Text Extraction", "GPU" if utils.Config.use_gpu and ort.get_device() == "GPU" else "CPU"
-    if utils.Process.interrupt_process:  # Cancel if process has been cancelled by gui.
+    counts = {"frames": 0, "empty_frames": 0, "ocr_calls": 0, "ocr_cache_hits": 0}
+    cancel_token = cancel_token or utils.CancelToken()
+    if cancel_token.cancelled:  # Cancel if process has been cancelled by gui.
         logger.warning(f"{prefix} process interrupted!")
-        return
-
-    sess_opt = ort.SessionOptions()
-    sess_opt.intra_op_num_threads = utils.Config.onnx_intra_threads
-    ocr_config = {"use_gpu": utils.Config.use_gpu, "drop_score": utils.Config.text_drop_score,
-                  "lang": utils.Config.ocr_rec_language, "onnx_sess_options": sess_opt} | utils.Config.ocr_opts
-    ocr_engine = PaddleOCR(**ocr_config)
-    line_sep = "\n" if utils.Config.line_break else " "
-    files = list(frame_output.iterdir())
-    file_batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
-    no_batches = len(file_batches)
-    logger.info(f"Starting Multiprocess {prefix} from frames on {device}, Batches: {no_batches}.")
-    with ThreadPoolExecutor(utils.Config.ocr_max_processes) as executor:
-        futures = [executor.submit(extract_text, ocr_engine, text_output, files, line_sep) for files in file_batches]
-        for i, f in enumerate(as_completed(futures)):  # as each  process completes
-            f.result()  # Prevents silent bugs. Exceptions raised will be displayed.
-            utils.print_progress(i, no_batches - 1, prefix)
-    logger.info(f"{prefix} done!")
+        return counts
+
+    line_sep, trace = "\n" if utils.Config.line_break else " ", timings.tracing()
+    logger.info(f"Starting Multiprocess {prefix} from frames on {device}, Frames: {frame_total:,}.")
+    start = perf_counter()
+
+    def batch_done(future: Future) -> None:
+        nonlocal next_batch, released_frame_batches
+        batch_number, frame_count = futures.pop(future)
+        (images, records), cache_hits, task_timings = future.result()  # Exceptions raised will be displayed.
+        timings.merge(task_timings)
+        finished[batch_number] = records
+        while next_batch in finished:  # Release the records of the finished batches that are next in order.
+            records = finished.pop(next_batch)
+            with timings.stage("results write", len(records)):
+                results_store.append(records)
+            released_frame_batches = frame_batch_ends.pop(next_batch, released_frame_batches)
+            if on_batch:
+                on_batch(records, released_frame_batches)
+            next_batch += 1
+        counts["frames"] += frame_count
+        counts["ocr_calls"] += images - cache_hits
+        counts["ocr_cache_hits"] += cache_hits
+        utils.print_progress(counts["frames"], frame_total, prefix)
+
+    def submitted_batches() -> int:
+        return next_batch + len(finished) + len(futures)  # Submitted batches are released, finished or running.
+
+    def submit_batch() -> None:
+        future = executor.submit(ocr_worker_task, extract_text, text_batch, line_sep, trace=trace)
+        futures[future] = submitted_batches(), len(text_batch)
+
+    futures = {}  # The batch number and the number of frames of each submitted batch.
+    finished, next_batch = {}, 0  # The records of the finished batches waiting for the batches before them.
+    # The number of frame batches that end in each batch and the batches before it.
+    frame_batch_ends, frame_batch_count, released_frame_batches = {}, 0, 0
+    text_batch, batch_images, previous_image = [], 0, None
+    with ocr_pool() as executor:
+        for frame_batch in frames:
+            if cancel_token.cancelled:
+                logger.warning(f"{prefix} process interrupted!")
+                break
+            for frame_position, image in frame_batch:
+                counts["empty_frames"] += image is None
+                if image is not None and image is not previous_image:
+                    if batch_images == batch_size:  # The batch is full when a new image is found.
+                        submit_batch()
+                        text_batch, batch_images = [], 0
+                    batch_images, previous_image = batch_images + 1, image
+                text_batch.append((frame_position, image))
+            frame_batch_count += 1
+            frame_batch_ends[submitted_batches()] = frame_batch_count  # The open batch has the last frame of the batch.
+            while len(futures) >= max_processes * 2:  # Limit the frames waiting for extraction.
+                with timings.stage("text batch wait"):
+                    done = wait(futures, return_when=FIRST_COMPLETED).done
+                for f in done:
+                    batch_done(f)
+        if text_batch and not cancel_token.cancelled:
+            submit_batch()
+        for f in as_completed(list(futures)):  # as each remaining batch completes
+            batch_done(f)
+    duration = perf_counter() - start
+    evict_ocr_cache()
+    logger.info(f"{prefix} done! Frames: {counts['frames']:,}, Frames without text: {counts['empty_frames']:,}, "
+                f"OCR calls: {counts['ocr_calls']:,}, OCR cache hits: {counts['ocr_cache_hits']:,}, "
+                f"Throughput: {counts['frames'] / duration:,.1f} frames/s")
+    return counts
+
+
+def find_text_change(ocr_engine, frames: list[tuple[float, np.ndarray | None]], start_text: str, end_text: str,
+                     line_sep: str) -> tuple[int, list]:
+    """
+    Binary search for the frames where the text changes in the frames between two frames with different texts.
+    The text can change more than once between the two frames, e.g. a subtitle, a gap and the next subtitle, so the
+    frames after each change are searched again until the text of the frame after the frames is reached.
+    The searched frames with text have a record.
+    :param ocr_engine: OCR Engine.
+    :param frames: frame positions and images of the frames between the two frames in order.
+    :param start_text: the text of the frame before the frames.
+    :param end_text: the text of the frame after the frames.
+    :param line_sep: line seperator for the text.
+    :return: The number of images the texts were extracted from and the records of the searched frames with text.
+    """
+    ocr_calls, records = 0, []
+    texts = {-1: start_text, len(frames): end_text}  # The text of each searched frame by its index.
+
+    def frame_text(index: int) -> str:
+        nonlocal ocr_calls
+        if index not in texts:
+            frame_position, image = frames[index]
+            lines = ocr_images(ocr_engine, [image])[0] if image is not None else []
+            texts[index] = lines_to_text(lines, line_sep)
+            ocr_calls += image is not None
+            if texts[index]:
+                records.append({"ms": frame_position, "text": texts[index], "lines": lines})
+        return texts[index]
+
+    low = -1
+    while texts[low] != end_text:
+        high = len(frames)  # The text of low is the text before the change, the text of high is different.
+        while high - low > 1:
+            middle = (low + high) // 2
+            if frame_text(middle) == texts[low]:
+                low = middle
+            else:
+                high = middle
+        low = high  # The search continues after the change, from the first frame with the next text.
+    return ocr_calls, records
+
+
+def find_text_changes(text_changes: Iterable[tuple[str, str, list[tuple[float, np.ndarray | None]]]],
+                      results_store: ResultsStore, change_total: int, cancel_token: utils.CancelToken = None) -> int:
+    """
+    Find the frames where the texts change using multiprocessing.
+    :param text_changes: the texts before and after each change and the frames that contain the change.
+    :param results_store: store of the extracted texts
+    :param change_total: the number of text changes, used for the progress
+    :param cancel_token: cancellation of the job
+    :return: The number of ocr calls made.
+    """
+    max_processes, prefix = utils.Config.ocr_max_processes, "Text Change Search"
+    cancel_token = cancel_token or utils.CancelToken()
+    if cancel_token.cancelled:  # Cancel if process has been cancelled by gui.
+        logger.warning(f"{prefix} process interrupted!")
+        return 0
+
+    line_sep, trace = "\n" if utils.Config.line_break else " ", timings.tracing()
+    logger.info(f"Starting Multiprocess {prefix}, Text Changes: {change_total:,}.")
+    counts, start = {"changes": 0, "ocr_calls": 0, "ocr_cache_hits": 0}, perf_counter()
+
+    def search_done(future: Future) -> None:
+        counts["changes"] += 1
+        (images, records), cache_hits, task_timings = future.result()  # Exceptions raised will be displayed.
+        timings.merge(task_timings)
+        with timings.stage("results write", len(records)):
+            results_store.append(records)
+        counts["ocr_calls"] += images - cache_hits
+        counts["ocr_cache_hits"] += cache_hits
+        utils.print_progress(counts["changes"], change_total, prefix)
+
+    futures = set()
+    with ocr_pool() as executor:
+        for start_text, end_text, frames in text_changes:
+            if cancel_token.cancelled:
+                logger.warning(f"{prefix} process interrupted!")
+                break
+            futures.add(executor.submit(ocr_worker_task, find_text_change, frames, start_text, end_text, line_sep,
+                                        trace=trace))
+            while len(futures) >= max_processes * 2:  # Limit the frames waiting for the search.
+                with timings.stage("text change search wait"):
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for f in done:
+                    search_done(f)
+        for f in as_completed(futures):  # as each remaining search completes
+            search_done(f)
+    duration = perf_counter() - start
+    evict_ocr_cache()
+    logger.info(f"{prefix} done! OCR calls: {counts['ocr_calls']:,}, OCR cache hits: {counts['ocr_cache_hits']:,}, "
+                f"Throughput: {counts['changes'] / duration:,.1f} text changes/s")
+    return counts['ocr_calls']
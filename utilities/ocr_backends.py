@@ -0,0 +1,218 @@
+import json
+import logging
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+import onnxruntime as ort
+
+import utilities.timings as timings
+import utilities.utils as utils
+
+logger = logging.getLogger(__name__)
+
+
+def sort_boxes(boxes: np.ndarray) -> list:
+    """
+    Sort text boxes in reading order, from top to bottom and left to right.
+    Boxes with a top that is less than 10 pixels apart are on the same line.
+    """
+    boxes = sorted(boxes, key=lambda box: (box[0][1], box[0][0]))
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+
+def crop_text_box(image: np.ndarray, box: np.ndarray) -> np.ndarray:
+    """
+    Crop a text box from an image and straighten it with a perspective transform.
+    """
+    points = box.astype(np.float32)
+    crop_width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    crop_height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    dst_points = np.float32([[0, 0], [crop_width, 0], [crop_width, crop_height], [0, crop_height]])
+    matrix = cv.getPerspectiveTransform(points, dst_points)
+    crop = cv.warpPerspective(image, matrix, (crop_width, crop_height), borderMode=cv.BORDER_REPLICATE,
+                              flags=cv.INTER_CUBIC)
+    if crop.shape[0] / crop.shape[1] >= 1.5:  # Vertical text is rotated to be horizontal.
+        crop = np.rot90(crop)
+    return crop
+
+
+class OCRBackend:
+    """
+    An ocr engine used for text extraction and subtitle detection. Each text extraction process creates its own
+    backend with the config of the process.
+    A backend detects the boxes of the text lines of images and recognises the texts of text line images, both in
+    batches. The text extraction of whole images is built on them.
+    """
+
+    def __init__(self) -> None:
+        self.drop_score = utils.Config.text_drop_score  # Text lines with a lower score are dropped.
+
+    def detect(self, images: list[np.ndarray]) -> list[list[np.ndarray]]:
+        """
+        Detect the text lines of images.
+        :return: The boxes of the text lines of each image. Each box has 4 points from the top left, clockwise.
+        """
+        raise NotImplementedError
+
+    def classify(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        """
+        Turn upside down text line images the right way up. Backends without a text direction classifier return the
+        images unchanged.
+        """
+        return images
+
+    def recognise(self, images: list[np.ndarray]) -> list[tuple[str, float]]:
+        """
+        Recognise text line images.
+        :return: The text and score of each image.
+        """
+        raise NotImplementedError
+
+    def ocr(self, images: list[np.ndarray]) -> list[list]:
+        """
+        Detect and recognise the text lines of many images.
+        The text lines are detected for each image, then the text lines of all the images are classified and
+        recognised together, so the recognition runs in batches.
+        :return: The box and the text and score of the text lines in each image.
+        """
+        with timings.stage("ocr det", len(images)):
+            image_boxes = [sort_boxes(boxes) if len(boxes) else [] for boxes in self.detect(images)]
+        crops = [crop_text_box(image, box) for image, boxes in zip(images, image_boxes) for box in boxes]
+
+        rec_results = []
+        if crops:
+            with timings.stage("ocr cls", len(crops)):
+                crops = self.classify(crops)
+            with timings.stage("ocr rec", len(crops)):
+                rec_results = self.recognise(crops)
+
+        results, rec_results = [], iter(rec_results)
+        for boxes in image_boxes:
+            lines = [(box.tolist(), rec_result) for box, rec_result in zip(boxes, rec_results)]
+            results.append([line for line in lines if line[1][1] >= self.drop_score])
+        return results
+
+
+class PaddleBackend(OCRBackend):
+    """
+    PaddleOCR with the onnx models, for every language of the program.
+    """
+
+    def __init__(self) -> None:
+        from paddleocr import PaddleOCR  # Only this backend needs paddleocr, the other backends work without it.
+
+        super().__init__()
+        sess_opt = ort.SessionOptions()
+        sess_opt.intra_op_num_threads = utils.Config.onnx_intra_threads
+        # The text lines of a text extraction batch are recognised together in batches of the same size.
+        batch_size = utils.Config.text_extraction_batch_size
+        ocr_config = {"use_gpu": utils.Config.use_gpu, "drop_score": utils.Config.text_drop_score,
+                      "lang": utils.Config.ocr_rec_language, "onnx_sess_options": sess_opt,
+                      "rec_batch_num": batch_size, "cls_batch_num": batch_size} | utils.Config.ocr_opts
+        self.engine = PaddleOCR(**ocr_config)
+
+    def detect(self, images: list[np.ndarray]) -> list[list[np.ndarray]]:
+        image_boxes = []
+        for image in images:
+            boxes, _ = self.engine.text_detector(image)
+            image_boxes.append(list(boxes) if boxes is not None else [])
+        return image_boxes
+
+    def classify(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        if self.engine.use_angle_cls:
+            images, _, _ = self.engine.text_classifier(images)
+        return images
+
+    def recognise(self, images: list[np.ndarray]) -> list[tuple[str, float]]:
+        return self.engine.text_recognizer(images)[0]
+
+
+class FakeBackend(OCRBackend):
+    """
+    A fast and deterministic stand-in for an ocr engine, for benchmarking and testing everything around the ocr.
+    Bright text lines are found from the pixels above a brightness level, like the white subtitles of the synthetic
+    videos of the benchmarks. A text line is recognised by the size and number of its bright pixels, as the nearest
+    canned text when the ocr options have a canned texts file, otherwise as a text made from its size.
+    """
+    bright_level = 200
+    max_canned_distance = 0.15  # Lines that are further from every canned text are not matched.
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.canned_signatures, self.canned_texts = np.zeros((0, 3)), []  # The line signature and text of each line.
+        if canned_texts_file := utils.Config.ocr_opts.get("canned_texts"):
+            canned_texts = json.loads(Path(canned_texts_file).read_text(encoding="utf-8"))
+            self.canned_signatures = np.array([signature for signature, _ in canned_texts], np.float64).reshape(-1, 3)
+            self.canned_texts = [text for _, text in canned_texts]
+
+    @classmethod
+    def bright_mask(cls, image: np.ndarray) -> np.ndarray:
+        return (image.max(axis=2) if image.ndim == 3 else image) > cls.bright_level
+
+    @classmethod
+    def line_signature(cls, image: np.ndarray) -> tuple[int, int, int] | None:
+        """
+        The width, height and number of the bright pixels of a text line image. None when it has no bright pixels.
+        """
+        mask = cls.bright_mask(image)
+        if not mask.any():
+            return None
+        rows, columns = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        return int(columns[-1] - columns[0] + 1), int(rows[-1] - rows[0] + 1), int(np.count_nonzero(mask))
+
+    def detect(self, images: list[np.ndarray]) -> list[list[np.ndarray]]:
+        image_boxes = []
+        for image in images:
+            mask = self.bright_mask(image)
+            height, width = mask.shape
+            text_rows = np.flatnonzero(np.count_nonzero(mask, axis=1) > max(width * 0.002, 1))
+            boxes = []
+            if text_rows.size:
+                breaks = np.flatnonzero(np.diff(text_rows) > 2)
+                rows = list(zip(text_rows[np.r_[0, breaks + 1]], text_rows[np.r_[breaks, -1]] + 1))
+                max_line_height = max(y2 - y1 for y1, y2 in rows)
+                for y1, y2 in rows:
+                    if y2 - y1 < max_line_height * 0.3:  # Stray bright marks.
+                        continue
+                    columns = np.flatnonzero(mask[y1:y2].any(axis=0))
+                    padding = (y2 - y1) // 4
+                    x1, x2 = max(columns[0] - padding, 0), min(columns[-1] + 1 + padding, width)
+                    y1, y2 = max(y1 - padding, 0), min(y2 + padding, height)
+                    boxes.append(np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], np.float32))
+            image_boxes.append(boxes)
+        return image_boxes
+
+    def recognise(self, images: list[np.ndarray]) -> list[tuple[str, float]]:
+        results = []
+        for image in images:
+            if (signature := self.line_signature(image)) is None:
+                results.append(("", 0.0))
+                continue
+            text = f"text {round(signature[0] / 16)}x{round(signature[1] / 8)}"
+            if self.canned_texts:
+                # The mean relative difference of the width, height and number of bright pixels.
+                distances = (np.abs(self.canned_signatures - signature) / self.canned_signatures).mean(axis=1)
+                if distances.min() <= self.max_canned_distance:
+                    text = self.canned_texts[int(distances.argmin())]
+            results.append((text, 0.99))
+        return results
+
+
+# The ocr backends by the name used in the config.
+ocr_backends = {"paddle": PaddleBackend, "fake": FakeBackend}
+
+
+def create_ocr_backend() -> OCRBackend:
+    """
+    Create the ocr backend of the config.
+    """
+    if utils.Config.ocr_backend not in ocr_backends:
+        raise ValueError(f"Unknown OCR backend: {utils.Config.ocr_backend}, choose from {list(ocr_backends)}")
+    return ocr_backends[utils.Config.ocr_backend]()
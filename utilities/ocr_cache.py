@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from time import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """
+    An on-disk cache of the text lines extracted from images, shared by every run and video.
+    Images are found by a hash of their pixels and of the ocr settings, so changed settings never return old texts.
+    """
+    file_name = "ocr_cache.db"
+    max_query_keys = 500  # Stay below the limit of variables in a sqlite query.
+
+    def __init__(self, cache_dir: Path, settings: dict) -> None:
+        """
+        :param cache_dir: directory of the cache file.
+        :param settings: the ocr settings that change the extracted text lines.
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Every text extraction process has its own connection, they wait for each other to write.
+        self.connection = sqlite3.connect(cache_dir / self.file_name, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS ocr_results "
+                                    "(key TEXT PRIMARY KEY, lines TEXT NOT NULL, last_used REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results (last_used)")
+        self.settings_hash = hashlib.blake2b(json.dumps(settings, sort_keys=True).encode(), digest_size=16).digest()
+        self.hits = self.misses = 0
+
+    def image_key(self, image: np.ndarray) -> str:
+        """
+        The key of an image in the cache.
+        """
+        image_hash = hashlib.blake2b(self.settings_hash, digest_size=16)
+        image_hash.update(str(image.shape).encode())
+        image_hash.update(np.ascontiguousarray(image).data)
+        return image_hash.hexdigest()
+
+    def get(self, keys: list[str]) -> dict[str, list]:
+        """
+        Get the text lines of the keys that are in the cache and mark them as recently used.
+        """
+        found = {}
+        for i in range(0, len(keys), self.max_query_keys):
+            query_keys = keys[i:i + self.max_query_keys]
+            query = f"SELECT key, lines FROM ocr_results WHERE key IN ({', '.join('?' * len(query_keys))})"
+            found |= {key: json.loads(lines) for key, lines in self.connection.execute(query, query_keys)}
+        if found:
+            with self.connection:
+                self.connection.executemany("UPDATE ocr_results SET last_used = ? WHERE key = ?",
+                                            [(time(), key) for key in found])
+        return found
+
+    def put(self, results: dict[str, list]) -> None:
+        """
+        Add the text lines of keys to the cache.
+        """
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO ocr_results VALUES (?, ?, ?)",
+                                        [(key, json.dumps(lines, default=float), time())
+                                         for key, lines in results.items()])
+
+    def evict(self, max_entries: int) -> int:
+        """
+        Delete the least recently used entries, so that the cache has at most the max entries.
+        :return: The number of deleted entries.
+        """
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM ocr_results WHERE key IN (SELECT key FROM ocr_results "
+                                             "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_entries,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,53 @@
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsStore:
+    """
+    Append only store of the text extraction results of a video in a single JSON lines file.
+    Each record has the frame position in milliseconds, the text and the text lines with their box and score.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def append(self, records: list[dict]) -> None:
+        """
+        Write many records to the end of the store at once.
+        """
+        if records:
+            with open(self.path, 'a', encoding="utf-8") as store_file:
+                store_file.write("".join(f"{json.dumps(record, ensure_ascii=False, default=float)}\n"
+                                         for record in records))
+
+    def write(self, records: list[dict]) -> None:
+        """
+        Replace all the records in the store. The old records are kept if writing is stopped part way.
+        """
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temp_path, 'w', encoding="utf-8") as store_file:
+            store_file.write("".join(f"{json.dumps(record, ensure_ascii=False, default=float)}\n"
+                                     for record in records))
+        temp_path.replace(self.path)
+
+    def load(self) -> list[dict]:
+        """
+        Read all the records in the store with one sequential read.
+        A last line without a line end was cut off while being written, and is skipped.
+        :return: The records sorted by frame position. A later record replaces an earlier one of the same position.
+        """
+        if not self.path.exists():
+            return []
+        with open(self.path, encoding="utf-8") as store_file:
+            records = {(record := json.loads(line))["ms"]: record for line in store_file
+                       if line.endswith("\n") and line.strip()}
+        return [records[frame_position] for frame_position in sorted(records)]
+
+    def texts(self) -> dict[float, str]:
+        """
+        The texts of the records by frame position, sorted by frame position.
+        """
+        return {record["ms"]: record["text"] for record in self.load()}
@@ -1,10 +1,36 @@
+import json
 import os
+import shutil
+import subprocess
+import sys
+from contextvars import copy_context
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event, Thread, enumerate as enumerate_threads
+from time import sleep
 from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
 
 os.chdir(Path(__file__).parent.parent)
 
-from main import SubtitleDetector, SubtitleExtractor, setup_ocr
+import utilities.timings as timings
+import utilities.utils as utils
+from benchmarks.frame_change_threshold import read_srt
+from benchmarks.synthetic_video import render_video, video_spec
+from cli import find_videos, move_to_output_dir, parse_sub_area, read_manifest
+from main import BatchExtractor, SubtitleDetector, SubtitleExtractor, SubtitleStream, SubtitleTimeline, setup_ocr
+from server import JobServer
+from shards import claim_shard, create_plan, load_plan, merge_shards, shard_claim_path, split_shards
+from tune import Tuner, trial_key, tuned_keys, tuning_candidates
+from utilities.frames_to_text import create_ocr_cache, find_text_change, lines_to_text, ocr_images, split_text_lines
+from utilities.ocr_backends import FakeBackend, PaddleBackend, create_ocr_backend
+from utilities.ocr_cache import OCRCache
+from utilities.results_store import ResultsStore
+from utilities.video_to_frames import (changed_pixel_ratio, extract_frames, frame_signature, sampled_frame_total,
+                                      text_edge_ratio)
 
 ch_vid = "test files/chinese_vid.mp4"
 ch_vid_srt = Path("test files/chinese_vid.srt")
@@ -25,10 +51,7 @@ class TestSubtitleDetector(TestCase):
 
     def test__get_key_frames(self):
         print("\nRunning test for _get_key_frames method...")
-        self.sd.sub_ex.empty_cache()
-        self.sd.frame_output.mkdir(parents=True)
-        self.sd._get_key_frames()
-        no_of_frames = len(list(self.sd.frame_output.iterdir()))
+        no_of_frames = len(self.sd._get_key_frames())
         self.assertEqual(no_of_frames, 20)
 
     def test__pad_sub_area(self):
@@ -98,23 +121,95 @@ class TestSubtitleExtractor(TestCase):
         self.assertEqual(self.se.similarity("此机会多吸取一点", "大胆人类"), 0.0)
         self.assertEqual(self.se.similarity("颗果实就想打发我们", "颗果实就想打发我们"), 1.0)
 
-    def test_similar_text_name_gen(self):
-        print("\nRunning tests for similar_text_name_gen method...")
-        start_name, end_name = "3466.666666666667--4733.333333333333", "3466.666666666667--4733.333333333333"
-        self.assertEqual(self.se.similar_text_name_gen(start_name, end_name), "3466.666666666667--4733.333333333333")
-        start_name, end_name = "5066.666666666666--6200.0", "6333.333333333333--6666.666666666667"
-        self.assertEqual(self.se.similar_text_name_gen(start_name, end_name), "5066.666666666666--6666.666666666667")
-        start_name, end_name = "9866.666666666668--10466.666666666666", "11200.0--11733.333333333332"
-        self.assertEqual(self.se.similar_text_name_gen(start_name, end_name), "9866.666666666668--11733.333333333332")
-        start_name, end_name = "59733.333333333336--59800.0", "60933.33333333333--60933.33333333333"
-        self.assertEqual(self.se.similar_text_name_gen(start_name, end_name), "59733.333333333336--60933.33333333333")
-
-    def test_name_to_duration(self):
-        print("\nRunning tests for name_to_duration method...")
-        self.assertEqual(self.se.name_to_duration("5066.666666666666--6666.666666666667"), 1600.000000000001)
-        self.assertEqual(self.se.name_to_duration("17800.0--18200.0"), 400.0)
-        self.assertEqual(self.se.name_to_duration("20133.333333333332--21133.333333333332"), 1000.0)
-        self.assertEqual(self.se.name_to_duration("43533.33333333333--44200.0"), 666.6666666666715)
+    def test_subtitle_timeline(self):
+        print("\nRunning tests for SubtitleTimeline class...")
+        timeline = SubtitleTimeline([5066.666666666666, 17800.0, 20133.333333333332, 43533.33333333333],
+                                    [6666.666666666667, 18200.0, 21133.333333333332, 44200.0], ["一", "二", "三", "四"])
+        self.assertEqual(timeline.durations.tolist(), [1600.000000000001, 400.0, 1000.0, 666.6666666666715])
+        timeline = timeline.select(timeline.durations > 500)
+        self.assertEqual(timeline.starts.tolist(), [5066.666666666666, 20133.333333333332, 43533.33333333333])
+        self.assertEqual(timeline.texts, ["一", "三", "四"])
+
+    def test_merge_adjacent_similar_texts(self):
+        print("\nRunning tests for merge_adjacent_similar_texts method...")
+        texts = ["竟然还蕴含着星辰之力", "竟竞然还蕴含着星辰之力", "大胆人类", "此机会多吸取一点"]
+        self.se.subtitle_timeline = SubtitleTimeline([0, 1000, 3000, 5000], [900, 2900, 4900, 5900], texts)
+        self.se.merge_adjacent_similar_texts()
+        self.assertEqual(self.se.subtitle_timeline.starts.tolist(), [0, 3000])
+        self.assertEqual(self.se.subtitle_timeline.ends.tolist(), [2900, 5900])
+        self.assertEqual(self.se.subtitle_timeline.texts, ["竟竞然还蕴含着星辰之力", "大胆人类"])
+
+    def test_subtitle_stream(self):
+        print("\nRunning tests for SubtitleStream class...")
+        texts = ["这漫天的星辰之中", "竟然还蕴含着星辰之力", "竟竞然还蕴含着星辰之力", "大胆人类", "此机会多吸取一点"]
+        records = [{"ms": ms, "text": texts[ms // 2000 % len(texts)] if ms % 7000 > 300 else "", "lines": []}
+                   for ms in range(0, 30000, 100)]
+        self.se.load_extracted_texts({record["ms"]: record["text"] for record in records})
+        self.se.process_extracted_texts()
+        with TemporaryDirectory() as temp_dir:
+            subtitle_stream = SubtitleStream(Path(temp_dir, "stream.srt"))
+            for i in range(0, len(records), 7):
+                subtitle_stream.add_records(records[i:i + 7])
+            save_path = subtitle_stream.finish()
+            self.assertEqual(save_path.read_text(encoding="utf-8"), "".join(self.se.generate_subtitle()))
+            subtitle_stream = SubtitleStream(Path(temp_dir, "stopped.srt"))
+            subtitle_stream.add_records(records)
+            self.assertTrue(subtitle_stream.part_path.exists())
+            subtitle_stream.discard()
+            self.assertEqual([path.name for path in Path(temp_dir).iterdir()], ["stream.srt"])
+
+    def test_stopped_subtitle_stream(self):
+        print("\nRunning tests for stopped subtitle streaming...")
+        settings = {"stream_subtitles": True, "frame_accurate_timing": False, "frame_extraction_batch_size": 25,
+                    "text_extraction_batch_size": 10, "ocr_max_processes": 1, "ocr_cache_max_entries": 0}
+        with TemporaryDirectory() as video_dir:
+            video_path = Path(shutil.copy(ch_vid, video_dir))
+
+            class StreamedCancelToken(utils.CancelToken):
+                @property
+                def cancelled(self) -> bool:  # Cancelled once the texts of the first batch are streamed.
+                    results_path = sub_ex.results_store.path
+                    return results_path.exists() and results_path.stat().st_size > 0 or super().cancelled
+
+            sub_ex = SubtitleExtractor(StreamedCancelToken())
+            self.assertIsNone(sub_ex.run_extraction(str(video_path), (288, 958, 1632, 1044), settings=settings))
+            self.assertFalse(sub_ex.completed)
+            self.assertEqual(list(Path(video_dir).glob("*.srt*")), [])
+            # The next extraction continues from the checkpoint and saves the whole subtitle with the video name.
+            subtitle_path = SubtitleExtractor().run_extraction(str(video_path), (288, 958, 1632, 1044),
+                                                               settings=settings)
+            self.assertEqual(subtitle_path, video_path.with_suffix(".srt"))
+            self.assertEqual(subtitle_path.read_text(encoding="utf-8"), ch_vid_srt.read_text(encoding="utf-8"))
+            self.assertEqual(list(Path(video_dir).glob("*.part")), [])
+
+    def test_resumed_subtitle_stream(self):
+        print("\nRunning tests for resumed subtitle streaming...")
+        # Text batches of 10 frames end inside frame batches of 12 or 13 extracted frames.
+        settings = {"ocr_backend": "fake", "stream_subtitles": True, "frame_accurate_timing": False,
+                    "frame_extraction_batch_size": 25, "text_extraction_batch_size": 10, "ocr_max_processes": 1,
+                    "ocr_cache_max_entries": 0, "keep_ocr_results": False}
+        spec = video_spec("resumed", width=320, height=240, fps=10.0, duration=20.0, min_sub_duration=0.5,
+                          max_sub_duration=1.5, seed=2)
+        with TemporaryDirectory() as video_dir:
+            info = render_video(spec, Path(video_dir))
+            subtitle_path = SubtitleExtractor().run_extraction(info["video"], tuple(info["sub_area"]), settings=settings)
+            subtitle = subtitle_path.read_text(encoding="utf-8")
+            subtitle_path.unlink()
+
+            class StoppedCancelToken(utils.CancelToken):
+                @property
+                def cancelled(self) -> bool:  # Cancelled after a text batch that ends inside a frame batch.
+                    results_path = sub_ex.results_store.path
+                    return results_path.exists() and len(results_path.read_bytes().splitlines()) >= 10
+
+            sub_ex = SubtitleExtractor(StoppedCancelToken())
+            self.assertIsNone(sub_ex.run_extraction(info["video"], tuple(info["sub_area"]), settings=settings))
+            state_file, results_file = sub_ex.checkpoint_files()
+            done_frame = json.loads(state_file.read_text(encoding="utf-8"))["done_frame"]
+            # The checkpoint has the texts of frames after the frame where the extraction continues.
+            self.assertGreater(max(ResultsStore(results_file).texts()) * spec["fps"] / 1000, done_frame)
+            subtitle_path = SubtitleExtractor().run_extraction(info["video"], tuple(info["sub_area"]), settings=settings)
+            self.assertEqual(subtitle_path.read_text(encoding="utf-8"), subtitle)
 
     def test_timecode(self):
         print("\nRunning tests for timecode method...")
@@ -125,6 +220,62 @@ class TestSubtitleExtractor(TestCase):
         self.assertEqual(self.se.timecode(25234.7962452), "00:00:25,234")
         self.assertEqual(self.se.timecode(6365.242454), "00:00:06,365")
 
+    def test_text_change_ranges(self):
+        print("\nRunning tests for text_change_ranges method...")
+        self.se.empty_cache()
+        self.se.vd_output_dir.mkdir(parents=True)
+        every = utils.Config.frame_extraction_frequency
+        records = [{"ms": frame_no / self.fps * 1000, "text": "第一" if frame_no < 12 else "第二", "lines": []}
+                   for frame_no in range(0, 24, every)]
+        self.se.results_store.append(records)
+        change_ranges = self.se.text_change_ranges(self.fps, 0, 40)
+        self.se.empty_cache()
+        self.assertEqual(change_ranges, [(12 - every + 1, 12, "第一", "第二"), (24 - every + 1, 24, "第二", "")])
+
+    def test_regenerate_subtitle(self):
+        print("\nRunning tests for regenerate_subtitle method...")
+        self.se.video_path = Path(ch_vid)
+        results_file = self.se.kept_results_file()
+        results_file.parent.mkdir(parents=True, exist_ok=True)
+        ResultsStore(results_file).append([{"ms": float(ms), "text": "第一", "lines": []} for ms in range(0, 2000, 100)])
+        save_paths = self.se.regenerate_subtitle(ch_vid, [{}, {"min_sub_duration_ms": 5000.0}])
+        results_file.unlink()
+        self.assertEqual(len(save_paths), 1)
+        self.assertEqual(save_paths[0].read_text(encoding="utf-8"), "1\n00:00:00,000 --> 00:00:01,900\n第一\n\n")
+        save_paths[0].unlink()
+
+    def test_vd_output_dir(self):
+        print("\nRunning tests for vd_output_dir property...")
+        other_se = SubtitleExtractor()
+        self.assertNotEqual(self.se.vd_output_dir, other_se.vd_output_dir)
+        self.assertEqual(self.se.vd_output_dir.parent, other_se.vd_output_dir.parent)
+        with utils.Config.snapshot({"scratch_dir": "/tmp/vsx scratch"}):
+            self.assertEqual(other_se.text_output.parent, Path("/tmp/vsx scratch", other_se.job_name))
+
+    def test_checkpoint(self):
+        print("\nRunning tests for checkpoint methods...")
+        self.se.video_path = Path(ch_vid)
+        settings_hash = self.se.extraction_settings_hash((288, 958, 1632, 1044), 0, self.frame_total)
+        self.assertEqual(self.se.resume_checkpoint(settings_hash, 0, self.fps), 0)
+        # The last record is of a frame after the checkpoint, from a text batch that ends after it.
+        self.se.results_store.append([{"ms": 0.0, "text": "第一", "lines": []},
+                                      {"ms": 500 / self.fps * 1000, "text": "第二", "lines": []}])
+        self.se.save_checkpoint(500)
+        self.assertEqual(self.se.resume_checkpoint(settings_hash, 0, self.fps), 500)
+        self.assertEqual(self.se.results_store.texts(), {0.0: "第一"})
+        # An extraction with other settings has its own checkpoint, the checkpoint of the settings is not changed.
+        checkpoint_files = self.se.checkpoint_files()
+        other_hash = self.se.extraction_settings_hash((288, 958, 1632, 1044), 0, 900)
+        self.assertEqual(self.se.resume_checkpoint(other_hash, 0, self.fps), 0)
+        self.assertEqual(self.se.results_store.texts(), {})
+        self.assertNotEqual(self.se.checkpoint_files(), checkpoint_files)
+        self.se.remove_checkpoint()
+        self.assertEqual(self.se.resume_checkpoint(settings_hash, 0, self.fps), 500)
+        self.assertEqual(self.se.results_store.texts(), {0.0: "第一"})
+        self.se.remove_checkpoint()
+        self.se.results_store = ResultsStore(self.se.text_output)
+        self.assertFalse(any(checkpoint_file.exists() for checkpoint_file in checkpoint_files))
+
     def test_run_extraction(self):
         print("\nRunning test for run_extraction method...")
         sub_area = (288, 958, 1632, 1044)
@@ -132,3 +283,481 @@ class TestSubtitleExtractor(TestCase):
         test_sub_txt = test_sub_path.read_text(encoding="utf-8")
         test_sub_path.unlink()
         self.assertEqual(test_sub_txt, ch_vid_srt.read_text(encoding="utf-8"))
+        report_path = test_sub_path.with_name(f"{test_sub_path.stem} timings.json")
+        report = json.loads(report_path.read_text(encoding="utf-8"))
+        report_path.unlink()
+        self.assertLessEqual({"video open", "decode", "crop", "results load", "srt write"}, set(report["stages"]))
+        self.assertEqual(report["stages"]["decode"]["items"], report["frames"])
+
+
+class TestBatchExtractor(TestCase):
+    def test_run(self):
+        print("\nRunning tests for BatchExtractor class...")
+        missing_vid, done_videos = "test files/missing_vid.mp4", []
+        videos = {ch_vid: ((288, 958, 1632, 1044), None, None), missing_vid: (None, None, None)}
+        subtitle_paths = BatchExtractor().run(videos, lambda video, subtitle_path: done_videos.append(video))
+        self.assertCountEqual(done_videos, videos)
+        self.assertIsNone(subtitle_paths[missing_vid])
+        test_sub_txt = subtitle_paths[ch_vid].read_text(encoding="utf-8")
+        subtitle_paths[ch_vid].unlink()
+        subtitle_paths[ch_vid].with_name(f"{subtitle_paths[ch_vid].stem} timings.json").unlink()
+        self.assertEqual(test_sub_txt, ch_vid_srt.read_text(encoding="utf-8"))
+        cancel_token = utils.CancelToken()
+        cancel_token.cancel()
+        self.assertEqual(BatchExtractor(cancel_token).run(videos), dict.fromkeys(videos))
+
+
+class TestCLI(TestCase):
+    def test_find_videos(self):
+        print("\nRunning tests for find_videos function...")
+        with TemporaryDirectory() as video_dir:
+            for name in ("a.mp4", "b.txt", "sub/c.MKV"):
+                Path(video_dir, name).parent.mkdir(exist_ok=True)
+                Path(video_dir, name).touch()
+            names = [Path(video["video"]).name for video in find_videos([video_dir])]
+            self.assertEqual(names, ["a.mp4"])
+            names = [Path(video["video"]).name for video in find_videos([video_dir, f"{video_dir}/*/*"], True)]
+            self.assertEqual(names, ["a.mp4", "c.MKV"])
+            self.assertEqual(find_videos([f"{video_dir}/b.txt"])[0]["video"], f"{video_dir}/b.txt")
+
+    def test_move_to_output_dir(self):
+        print("\nRunning tests for move_to_output_dir function...")
+        with TemporaryDirectory() as temp_dir:
+            output_dir, subtitle_paths = Path(temp_dir, "subtitles"), []
+            output_dir.mkdir()
+            for video_dir in ("season 1", "season 2"):  # Videos with the same name in different directories.
+                subtitle_path = Path(temp_dir, video_dir, "episode.srt")
+                subtitle_path.parent.mkdir()
+                subtitle_path.write_text(video_dir, encoding="utf-8")
+                subtitle_path.with_name("episode timings.json").write_text("{}", encoding="utf-8")
+                subtitle_paths.append(move_to_output_dir(subtitle_path, output_dir))
+                self.assertEqual(list(subtitle_path.parent.iterdir()), [])
+            self.assertEqual(subtitle_paths, [output_dir / "episode.srt", output_dir / "episode (1).srt"])
+            self.assertEqual([path.read_text(encoding="utf-8") for path in subtitle_paths], ["season 1", "season 2"])
+            self.assertTrue(Path(output_dir, "episode (1) timings.json").exists())
+            self.assertEqual(move_to_output_dir(subtitle_paths[1], output_dir), subtitle_paths[1])
+
+    def test_read_manifest(self):
+        print("\nRunning tests for read_manifest function...")
+        self.assertEqual(parse_sub_area("288, 958, 1632, 1044"), (288, 958, 1632, 1044))
+        self.assertRaises(ValueError, parse_sub_area, "288 958")
+        with TemporaryDirectory() as manifest_dir:
+            csv_manifest, json_manifest = Path(manifest_dir, "videos.csv"), Path(manifest_dir, "videos.json")
+            csv_manifest.write_text('video,sub_area,start_frame,stop_frame,language\n'
+                                    'a.mp4,"288,958,1632,1044",10,,en\nb.mp4,,,,\n', encoding="utf-8")
+            json_manifest.write_text('[{"video": "a.mp4", "sub_area": [288, 958, 1632, 1044], "start_frame": 10, '
+                                     '"language": "en"}, "b.mp4"]', encoding="utf-8")
+            expected = [{"video": str(Path(manifest_dir, "a.mp4")), "sub_area": (288, 958, 1632, 1044),
+                         "start_frame": 10, "stop_frame": None, "language": "en"},
+                        {"video": str(Path(manifest_dir, "b.mp4")), "sub_area": None, "start_frame": None,
+                         "stop_frame": None, "language": None}]
+            self.assertEqual(read_manifest(csv_manifest), expected)
+            self.assertEqual(read_manifest(json_manifest), expected)
+
+
+class TestJobServer(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.job_server = JobServer(port=0, workers=1)
+        cls.job_server.start()
+        cls.url = f"http://{cls.job_server.address[0]}:{cls.job_server.address[1]}"
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.job_server.stop()
+
+    def request(self, method: str, path: str, body: dict = None) -> tuple[int, dict | list]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        try:
+            with urlopen(Request(self.url + path, data, method=method), timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    def wait_for_job(self, job_id: str) -> dict:
+        for _ in range(600):
+            _, job = self.request("GET", f"/jobs/{job_id}")
+            if job["status"] not in ("queued", "running"):
+                return job
+            sleep(0.5)
+        self.fail(f"Job {job_id} did not finish!")
+
+    def test_requests(self):
+        print("\nRunning tests for job server requests...")
+        self.assertEqual(self.request("GET", "/health"), (200, {"status": "ok", "queued": 0, "running": 0}))
+        self.assertEqual(self.request("POST", "/jobs", {"video": "test files/missing_vid.mp4"})[0], 400)
+        self.assertEqual(self.request("POST", "/jobs", {"video": ch_vid, "sub_area": "1 2"})[0], 400)
+        self.assertEqual(self.request("GET", "/jobs/missing")[0], 404)
+        self.assertEqual(self.request("DELETE", "/jobs/missing")[0], 404)
+
+    def test_jobs(self):
+        print("\nRunning tests for job server jobs...")
+        status, job = self.request("POST", "/jobs", {"video": ch_vid, "sub_area": [288, 958, 1632, 1044]})
+        self.assertEqual(status, 201)
+        _, cancelled_job = self.request("POST", "/jobs", {"video": ch_vid})
+        self.assertEqual(self.request("DELETE", f"/jobs/{cancelled_job['id']}")[1]["status"], "cancelled")
+        job = self.wait_for_job(job["id"])
+        self.assertEqual((job["status"], job["progress"]), ("done", 1.0))
+        test_sub_path = Path(job["subtitle"])
+        test_sub_txt = test_sub_path.read_text(encoding="utf-8")
+        test_sub_path.unlink()
+        test_sub_path.with_name(f"{test_sub_path.stem} timings.json").unlink()
+        self.assertEqual(test_sub_txt, ch_vid_srt.read_text(encoding="utf-8"))
+        self.assertEqual(self.wait_for_job(cancelled_job["id"])["status"], "cancelled")
+        job_ids = {listed_job["id"] for listed_job in self.request("GET", "/jobs")[1]}
+        self.assertLessEqual({job["id"], cancelled_job["id"]}, job_ids)
+
+
+class TestShards(TestCase):
+    def test_split_shards(self):
+        print("\nRunning tests for split_shards function...")
+        shards = [(shard["start_frame"], shard["stop_frame"]) for shard in split_shards(0, 1000, 3, 100)]
+        self.assertEqual(shards, [(0, 300), (300, 600), (600, 1000)])
+        shards = [(shard["start_frame"], shard["stop_frame"]) for shard in split_shards(50, 200, 4, 100)]
+        self.assertEqual(shards, [(50, 150), (150, 200)])
+
+    def test_claim_shard(self):
+        print("\nRunning tests for claim_shard function...")
+        with TemporaryDirectory() as shard_dir:
+            plan_file = create_plan(ch_vid, 2, Path(shard_dir), start_frame=0,
+                                    stop_frame=utils.Config.frame_extraction_batch_size * 2)
+            plan = load_plan(plan_file)
+            self.assertEqual([claim_shard(plan_file, plan) for _ in range(3)], [0, 1, None])
+            # The computer running shard 1 crashed, its claim was last touched longer ago than the timeout.
+            stale_time = shard_claim_path(plan_file, 1).stat().st_mtime - 60
+            os.utime(shard_claim_path(plan_file, 1), (stale_time, stale_time))
+            self.assertEqual(claim_shard(plan_file, plan, 30), 1)
+            self.assertIsNone(claim_shard(plan_file, plan, 30))
+
+    def test_shards(self):
+        print("\nRunning tests for shard plan, run and merge...")
+        with TemporaryDirectory() as shard_dir:
+            plan_file = create_plan(ch_vid, 3, Path(shard_dir), (288, 958, 1632, 1044))
+            self.assertRaises(FileExistsError, create_plan, ch_vid, 3, Path(shard_dir))
+            self.assertIsNone(merge_shards(plan_file))
+            # The shards are run by two processes, like two computers with shared storage.
+            processes = [subprocess.Popen([sys.executable, "shards.py", "run", str(plan_file)]) for _ in range(2)]
+            self.assertEqual([process.wait() for process in processes], [0, 0])
+            self.assertIsNone(claim_shard(plan_file, load_plan(plan_file)))
+            test_sub_path = merge_shards(plan_file)
+            test_sub_txt = test_sub_path.read_text(encoding="utf-8")
+            test_sub_path.unlink()
+        self.assertEqual(test_sub_txt, ch_vid_srt.read_text(encoding="utf-8"))
+
+
+class TestVideoToFrames(TestCase):
+    def test_sampled_frame_total(self):
+        print("\nRunning tests for sampled_frame_total function...")
+        self.assertEqual(sampled_frame_total(0, 1830, 2), 915)
+        self.assertEqual(sampled_frame_total(7, 133, 3), 42)
+        self.assertEqual(sampled_frame_total(250, 300, 10), 5)
+        self.assertEqual(sampled_frame_total(0, 1830, 1), 1830)
+
+    def test_changed_pixel_ratio(self):
+        print("\nRunning tests for changed_pixel_ratio function...")
+        image = np.zeros((80, 400, 3), np.uint8)
+        changed_image = image.copy()
+        changed_image[20:60, 100:140] = 255
+        noisy_image = image + 10
+        self.assertEqual(changed_pixel_ratio(frame_signature(image), frame_signature(image)), 0.0)
+        self.assertEqual(changed_pixel_ratio(frame_signature(image), frame_signature(noisy_image)), 0.0)
+        self.assertEqual(changed_pixel_ratio(frame_signature(image), frame_signature(changed_image)), 0.05)
+
+    def test_text_edge_ratio(self):
+        print("\nRunning tests for text_edge_ratio function...")
+        image = np.full((80, 400, 3), 60, np.uint8)
+        self.assertEqual(text_edge_ratio(image), 0.0)
+        image[20:60, 100:140] = 255
+        self.assertEqual(text_edge_ratio(image), 0.01)
+
+
+class TestFramesToText(TestCase):
+    def test_split_text_lines(self):
+        print("\nRunning tests for split_text_lines function...")
+        image = np.full((100, 400, 3), 60, np.uint8)
+        self.assertEqual(split_text_lines(image), [])
+        image[10:40, 50:150] = 255
+        image[60:90, 100:300] = 255
+        self.assertEqual(split_text_lines(image), [(41, 1, 159, 49), (91, 51, 309, 99)])
+
+
+    def test_find_text_change(self):
+        print("\nRunning tests for find_text_change function...")
+        first_image, no_text_image, second_image = (np.full((100, 400, 3), 60, np.uint8) for _ in range(3))
+        first_image[30:60, 50:150] = 255
+        second_image[30:60, 50:350] = 255
+        # The first text, a gap without text and the second text between two extracted frames.
+        images = [first_image] * 4 + [no_text_image] * 3 + [second_image] * 5
+        frames = [(i * 40.0, image) for i, image in enumerate(images)]
+        with utils.Config.snapshot({"ocr_backend": "fake"}):
+            ocr_engine = create_ocr_backend()
+        first_lines, second_lines = ocr_images(ocr_engine, [first_image, second_image])
+        first_text, second_text = lines_to_text(first_lines, " "), lines_to_text(second_lines, " ")
+        ocr_calls, records = find_text_change(ocr_engine, frames, first_text, second_text, " ")
+        texts = {record["ms"]: record["text"] for record in records}
+        self.assertEqual(max(ms for ms, text in texts.items() if text == first_text), 3 * 40.0)
+        self.assertEqual(min(ms for ms, text in texts.items() if text == second_text), 7 * 40.0)
+        self.assertLess(ocr_calls, len(frames))
+
+
+class TestOCRBackends(TestCase):
+    def test_fake_backend(self):
+        print("\nRunning tests for FakeBackend class...")
+        image = np.full((100, 400, 3), 60, np.uint8)
+        image[10:40, 50:150] = 255
+        image[60:90, 100:300] = 255
+        image[95:97, 10:20] = 255  # A stray bright mark.
+        with TemporaryDirectory() as texts_dir:
+            texts_file = Path(texts_dir, "ocr texts.json")
+            texts_file.write_text(json.dumps([[[100, 30, 3000], "第一"]]), encoding="utf-8")
+            with utils.Config.snapshot({"ocr_backend": "fake", "ocr_opts": {"canned_texts": str(texts_file)}}):
+                fake_backend = create_ocr_backend()
+        self.assertIsInstance(fake_backend, FakeBackend)
+        boxes = fake_backend.detect([image, np.zeros((50, 50), np.uint8)])
+        self.assertEqual([box.tolist() for box in boxes[0]], [[[43, 3], [157, 3], [157, 47], [43, 47]],
+                                                              [[93, 53], [307, 53], [307, 97], [93, 97]]])
+        self.assertEqual(boxes[1], [])
+        self.assertEqual(fake_backend.recognise([image[60:90, 90:310], image[:5]]), [("text 12x4", 0.99), ("", 0.0)])
+        lines = fake_backend.ocr([image])[0]
+        self.assertEqual([line[1] for line in lines], [("第一", 0.99), ("text 12x4", 0.99)])
+        self.assertEqual(lines[0][0], [[43, 3], [157, 3], [157, 47], [43, 47]])
+        with utils.Config.snapshot({"ocr_backend": "unknown"}):
+            self.assertRaises(ValueError, create_ocr_backend)
+
+    def test_paddle_backend(self):
+        print("\nRunning tests for PaddleBackend class...")
+        # The batched detection, classification and recognition give the same text lines as PaddleOCR.ocr().
+        paddle_backend = PaddleBackend()
+        images = [image for _, image in extract_frames(ch_vid, None, (288, 958, 1632, 1044), 0, 600, 60)]
+        images.append(np.zeros((86, 1344, 3), np.uint8))  # An image without text.
+        for image, lines in zip(images, paddle_backend.ocr(images)):
+            paddle_lines = paddle_backend.engine.ocr(image, cls=paddle_backend.engine.use_angle_cls)[0] or []
+            self.assertEqual([line[1][0] for line in lines], [line[1][0] for line in paddle_lines])
+            for (box, (_, score)), (paddle_box, (_, paddle_score)) in zip(lines, paddle_lines):
+                np.testing.assert_allclose(box, paddle_box, atol=1)
+                self.assertAlmostEqual(score, paddle_score, places=3)
+
+    def test_fake_backend_without_paddleocr(self):
+        print("\nRunning tests for FakeBackend class without paddleocr...")
+        code = ("import sys; sys.modules['paddleocr'] = None\n"  # paddleocr can not be imported.
+                "import numpy as np, cli, tune, utilities.utils as utils\n"
+                "from main import setup_ocr\n"
+                "from utilities.ocr_backends import create_ocr_backend\n"
+                "with utils.Config.snapshot({'ocr_backend': 'fake'}):\n"
+                "    setup_ocr()\n"
+                "    image = np.zeros((100, 400, 3), np.uint8)\n"
+                "    image[10:40, 50:150] = 255\n"
+                "    print(create_ocr_backend().ocr([image])[0][0][1][0])")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "text 6x4")
+
+
+class TestUtils(TestCase):
+    def test_prefetch(self):
+        print("\nRunning tests for prefetch function...")
+        batches = [[i] * 3 for i in range(10)]
+        self.assertEqual(list(utils.prefetch(iter(batches), 2, "Producer", "Consumer")), batches)
+
+        def failing_batches():
+            yield [1]
+            raise ValueError("Producer failed")
+
+        with self.assertRaises(ValueError):
+            list(utils.prefetch(failing_batches(), 2, "Producer", "Consumer"))
+
+        closed = Event()
+
+        def stopped_batches():
+            try:
+                yield from batches
+            finally:
+                closed.set()
+
+        stopped_items = stopped_batches()  # Kept, so the generator is not closed by the garbage collector.
+        for batch in utils.prefetch(stopped_items, 1, "Stopped producer", "Consumer"):
+            break  # The consumer stops while the producer still has batches.
+        self.assertTrue(closed.wait(2))
+        producer = next((thread for thread in enumerate_threads() if thread.name == "Stopped producer"), None)
+        if producer:
+            producer.join(2)
+            self.assertFalse(producer.is_alive())
+
+    def test_config_snapshot(self):
+        print("\nRunning tests for Config snapshot method...")
+        min_sub_duration, other_thread_values = utils.Config.min_sub_duration_ms, []
+        with utils.Config.snapshot({"min_sub_duration_ms": 5000.0}):
+            utils.Config.set_values({"text_similarity_threshold": 0.5})
+            self.assertEqual(utils.Config.get_values()["min_sub_duration_ms"], 5000.0)
+            self.assertEqual(list(utils.prefetch([[utils.Config.min_sub_duration_ms]], 1, "Producer", "Consumer")),
+                             [[5000.0]])
+            thread = Thread(target=lambda: other_thread_values.append(utils.Config.min_sub_duration_ms))
+            thread.start()
+            thread.join()
+            self.assertEqual(utils.Config.text_similarity_threshold, 0.5)
+        self.assertEqual(other_thread_values, [min_sub_duration])
+        self.assertEqual(utils.Config.min_sub_duration_ms, min_sub_duration)
+        self.assertNotEqual(utils.Config.text_similarity_threshold, 0.5)
+
+    def test_cancel_token(self):
+        print("\nRunning tests for CancelToken class...")
+        cancel_token1, cancel_token2 = utils.CancelToken(), utils.CancelToken()
+        cancel_token1.cancel()
+        self.assertTrue(cancel_token1.cancelled)
+        self.assertFalse(cancel_token2.cancelled)
+        utils.Process.stop_process()
+        self.assertTrue(cancel_token2.cancelled)
+        utils.Process.start_process()
+
+
+class TestTimings(TestCase):
+    def test_stage_timer(self):
+        print("\nRunning tests for StageTimer class...")
+        timings.record("decode", 1.0)  # Stages are not recorded without a timer.
+        with timings.use_timer(timings.StageTimer()) as timer:
+            for duration in (0.001, 0.002, 0.003, 0.004):
+                timings.record("decode", duration)
+            with timings.stage("ocr rec", 8):
+                pass
+            result, task_timings = timings.timed_task(timings.record, "decode", 0.01, 2)
+            timings.merge(task_timings)
+            self.assertFalse(timings.tracing())
+        self.assertIsNone(timings.current_timer())
+        self.assertEqual(task_timings["stages"]["decode"], [[0.01], 2])
+        report = timer.report()
+        self.assertEqual(list(report), ["decode", "ocr rec", "record"])
+        self.assertEqual((report["decode"]["calls"], report["decode"]["items"]), (5, 6))
+        self.assertEqual((report["decode"]["total_s"], report["decode"]["p50_ms"]), (0.02, 3.0))
+        self.assertEqual(report["decode"]["items_per_s"], 300.0)
+        self.assertEqual(report["ocr rec"]["items"], 8)
+        self.assertIsNone(timer.spans)
+
+    def test_trace(self):
+        print("\nRunning tests for StageTimer trace method...")
+        with timings.use_timer(timings.StageTimer(trace=True)) as timer:
+            self.assertTrue(timings.tracing())
+            with timings.stage("frame batch wait"):
+                timings.merge(timings.timed_task(timings.record, "decode", 0.001, trace=True)[1])
+            thread = Thread(target=copy_context().run, args=(timings.record, "ocr det", 0.002), name="OCR Thread")
+            thread.start()
+            thread.join()
+        trace = timer.trace()
+        spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        self.assertEqual([span["name"] for span in spans], ["decode", "record", "frame batch wait", "ocr det"])
+        self.assertEqual(min(span["ts"] for span in spans), 0.0)
+        self.assertEqual(spans[0]["dur"], 1000.0)
+        self.assertEqual(spans[2]["cat"], "wait")
+        thread_names = {event["args"]["name"] for event in trace["traceEvents"] if event["name"] == "thread_name"}
+        self.assertLessEqual({"MainThread", "OCR Thread"}, thread_names)
+
+
+class TestOCRCache(TestCase):
+    def test_ocr_cache(self):
+        print("\nRunning tests for OCRCache class...")
+        image, other_image = np.zeros((80, 400, 3), np.uint8), np.full((80, 400, 3), 255, np.uint8)
+        lines = [[[[0, 0], [10, 0], [10, 10], [0, 10]], ["text", 0.9]]]
+        with TemporaryDirectory() as cache_dir:
+            ocr_cache = OCRCache(Path(cache_dir), {"lang": "ch"})
+            key, other_key = ocr_cache.image_key(image), ocr_cache.image_key(other_image)
+            other_ocr_cache = OCRCache(Path(cache_dir), {"lang": "en"})
+            self.assertNotEqual(key, other_ocr_cache.image_key(image))
+            other_ocr_cache.close()
+            self.assertEqual(ocr_cache.get([key]), {})
+            ocr_cache.put({key: lines})
+            ocr_cache.put({other_key: []})
+            self.assertEqual(ocr_cache.get([key, other_key]), {key: lines, other_key: []})
+            sleep(0.1)  # The last used time of the key is after the other key.
+            ocr_cache.get([key])
+            self.assertEqual(ocr_cache.evict(1), 1)
+            self.assertEqual(ocr_cache.get([key, other_key]), {key: lines})
+            ocr_cache.close()
+
+    def test_create_ocr_cache(self):
+        print("\nRunning tests for create_ocr_cache function...")
+        program_dir, cache_dir = Path.cwd(), "test ocr cache"
+        with TemporaryDirectory() as other_dir, utils.Config.snapshot({"ocr_cache_dir": cache_dir,
+                                                                       "ocr_cache_max_entries": 10}):
+            os.chdir(other_dir)  # A relative cache directory does not depend on where the program is started.
+            try:
+                create_ocr_cache().close()
+                self.assertTrue(Path(program_dir, cache_dir, OCRCache.file_name).exists())
+                self.assertFalse(Path(other_dir, cache_dir).exists())
+            finally:
+                os.chdir(program_dir)
+                shutil.rmtree(Path(program_dir, cache_dir), ignore_errors=True)
+
+
+class TestResultsStore(TestCase):
+    def test_results_store(self):
+        print("\nRunning tests for ResultsStore class...")
+        with TemporaryDirectory() as store_dir:
+            results_store = ResultsStore(Path(store_dir, "extracted texts.jsonl"))
+            self.assertEqual(results_store.load(), [])
+            lines = [[[[0, 0], [1, 0], [1, 1], [0, 1]], ["第二", 0.9]]]
+            results_store.append([{"ms": 200.0, "text": "第二", "lines": lines}])
+            results_store.append([{"ms": 33.333333333333336, "text": "第一", "lines": []}])
+            self.assertEqual(results_store.texts(), {33.333333333333336: "第一", 200.0: "第二"})
+            self.assertEqual(results_store.load()[1]["lines"][0][1], ["第二", 0.9])
+            with open(results_store.path, 'a', encoding="utf-8") as store_file:
+                store_file.write('{"ms": 300.0, "te')  # A record cut off while being written.
+            results_store.write(results_store.load())
+            self.assertEqual(results_store.texts(), {33.333333333333336: "第一", 200.0: "第二"})
+
+
+class TestSyntheticVideo(TestCase):
+    def test_render_video(self):
+        print("\nRunning tests for render_video function...")
+        spec = video_spec("synthetic", width=320, height=240, fps=10.0, duration=8.0, motion="pan", seed=3)
+        with TemporaryDirectory() as video_dir:
+            info = render_video(spec, Path(video_dir))
+            self.assertEqual(SubtitleExtractor.video_details(info["video"])[1:], (80, 320, 240))
+            lines = read_srt(Path(info["srt"]))
+            self.assertEqual(len(lines), info["subtitles"])
+            canned_texts = json.loads(Path(info["ocr_texts"]).read_text(encoding="utf-8"))
+            drawn_lines = [line for *_, text in lines for line in text.split("\n")]
+            self.assertEqual([text for _, text in canned_texts], drawn_lines)
+            self.assertTrue(all(start < end <= 8000 for start, end, _ in lines))
+            self.assertTrue(all(end1 < start2 for (_, end1, _), (start2, _, _) in zip(lines, lines[1:])))
+            sub_area, text_area = info["sub_area"], info["text_area"]
+            self.assertTrue(sub_area[1] < text_area[1] < text_area[3] < sub_area[3] <= 240)
+            self.assertGreaterEqual(text_area[1], 240 * utils.Config.subarea_height_scaler)
+            self.assertEqual(render_video(spec, Path(video_dir)), info)  # The rendered video is reused.
+
+
+class TestTuner(TestCase):
+    def test_tuning_candidates(self):
+        print("\nRunning tests for tuning_candidates function...")
+        values = {"ocr_max_processes": 5, "onnx_intra_threads": 8, "text_extraction_batch_size": 100,
+                  "frame_extraction_batch_size": 250}
+        candidates = tuning_candidates(values, 6, 200)
+        self.assertEqual(candidates["ocr_max_processes"], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(candidates["onnx_intra_threads"], [1, 2, 3, 4, 6, 8])
+        self.assertEqual(candidates["frame_extraction_batch_size"], [25, 50, 100, 250])
+        self.assertIn(100, candidates["text_extraction_batch_size"])
+        self.assertEqual(trial_key(values), (5, 1, 100, 250))
+        self.assertEqual(trial_key(values | {"onnx_intra_threads": 5}), trial_key(values))
+
+    def test_tune(self):
+        print("\nRunning tests for Tuner class...")
+        candidates = {"ocr_max_processes": [1, 2, 4, 8], "onnx_intra_threads": [1, 2, 4, 8, 16],
+                      "text_extraction_batch_size": [10, 25, 50, 100, 200],
+                      "frame_extraction_batch_size": [25, 50, 100]}
+        best = {"ocr_max_processes": 4, "onnx_intra_threads": 8, "text_extraction_batch_size": 50,
+                "frame_extraction_batch_size": 100}
+
+        def measure(values: dict) -> dict:  # The frames per second fall the further each value is from the best.
+            distance = sum(abs(candidates[key].index(values[key]) - candidates[key].index(best[key]))
+                           for key in tuned_keys)
+            return {"frames_per_s": 100.0 / (1 + distance)}
+
+        start = {"ocr_max_processes": 1, "onnx_intra_threads": 1, "text_extraction_batch_size": 200,
+                 "frame_extraction_batch_size": 25}
+        tuner = Tuner(measure, candidates, 50)
+        self.assertEqual(tuner.tune(start), (best, 100.0))
+        self.assertLess(len(tuner.trials), np.prod([len(values) for values in candidates.values()]) / 10)
+        self.assertEqual(tuner.trials[trial_key(start)]["frames_per_s"], 100.0 / 10)
+
+        tuner = Tuner(measure, candidates, 3)
+        best_values, best_frames_per_s = tuner.tune(start)
+        self.assertEqual(len(tuner.trials), 3)
+        self.assertEqual(best_frames_per_s, max(trial["frames_per_s"] for trial in tuner.trials.values()))
@@ -0,0 +1,192 @@
+import logging
+import os
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from multiprocessing import current_process
+from threading import Lock, current_thread
+from time import perf_counter
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The stage timer of the running extraction. Threads started with a copy of the context use the same timer.
+_current_timer: ContextVar["StageTimer | None"] = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    The durations of the stages of an extraction, for finding where the time of the extraction went.
+    Stages that run in worker processes are timed by a timer of the task and merged into the timer of the extraction
+    with the result of the task.
+    A traced timer also keeps the span of every timed stage with its process and thread, for a timeline of the
+    extraction. The clock of perf_counter is shared by the processes of the computer, so the spans of all the processes
+    are on the same timeline.
+    """
+
+    def __init__(self, trace: bool = False) -> None:
+        """
+        :param trace: keep the span of every timed stage.
+        """
+        self.stages: dict[str, list] = {}  # The durations in seconds and the number of items of each stage.
+        # The stage, start, duration, items, process id and thread id of each span. None when not traced.
+        self.spans: list[tuple] | None = [] if trace else None
+        self.names: dict[str, str] = {}  # The names of the traced processes and threads.
+        self.lock = Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return self.spans is not None
+
+    def add(self, stage: str, duration: float, items: int = 1) -> None:
+        """
+        Add a duration of a stage that has just ended.
+        :param items: the number of items, e.g. frames, handled in the duration.
+        """
+        end = perf_counter()
+        with self.lock:
+            durations = self.stages.setdefault(stage, [[], 0])
+            durations[0].append(duration)
+            durations[1] += items
+            if self.spans is not None:
+                pid, thread = os.getpid(), current_thread()
+                self.spans.append((stage, end - duration, duration, items, pid, thread.native_id))
+                self.names.setdefault(f"{pid}", current_process().name)
+                self.names.setdefault(f"{pid} {thread.native_id}", thread.name)
+
+    def export(self) -> dict:
+        """
+        The stages, spans and names of the timer, to be merged into another timer.
+        """
+        return {"stages": self.stages, "spans": self.spans, "names": self.names}
+
+    def merge(self, timings: dict) -> None:
+        """
+        Add the stages of another timer, and its spans if this timer is traced.
+        """
+        with self.lock:
+            for stage, (durations, items) in timings["stages"].items():
+                merged = self.stages.setdefault(stage, [[], 0])
+                merged[0].extend(durations)
+                merged[1] += items
+            if self.spans is not None and timings["spans"]:
+                self.spans.extend(timings["spans"])
+                for key, name in timings["names"].items():
+                    self.names.setdefault(key, name)
+
+    def report(self) -> dict:
+        """
+        The number of calls and items, total time, percentile latencies and throughput of each stage.
+        Stages that run in several processes at the same time add up the time of every process, so their throughput
+        is the throughput of one process.
+        """
+        with self.lock:
+            stages = {stage: (np.array(durations), items) for stage, (durations, items) in self.stages.items()}
+        report = {}
+        for stage, (durations, items) in stages.items():
+            total = float(durations.sum())
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1000
+            report[stage] = {"calls": len(durations), "items": items, "total_s": round(total, 6),
+                             "mean_ms": round(total * 1000 / len(durations), 3), "p50_ms": round(p50, 3),
+                             "p95_ms": round(p95, 3), "p99_ms": round(p99, 3),
+                             "max_ms": round(float(durations.max()) * 1000, 3),
+                             "items_per_s": round(items / total, 1) if total else None}
+        return report
+
+    def summary(self) -> str:
+        """
+        A line with the totals and latencies of each stage, for the log.
+        """
+        lines = []
+        for stage, values in self.report().items():
+            items_per_s = f"{values['items_per_s']:,.1f}" if values["items_per_s"] else "-"
+            lines.append(f"{stage:<38} Calls: {values['calls']:>8,}, Items: {values['items']:>8,}, "
+                         f"Total: {values['total_s']:>9.3f}s, p50: {values['p50_ms']:>9.3f}ms, "
+                         f"p95: {values['p95_ms']:>9.3f}ms, p99: {values['p99_ms']:>9.3f}ms, Items/s: {items_per_s}")
+        return "\n".join(lines)
+
+    def trace(self) -> dict:
+        """
+        The spans as a Chrome trace, which can be opened in Perfetto or chrome://tracing.
+        Each process and thread has its own track, the waits are in the wait category.
+        """
+        with self.lock:
+            spans, names = list(self.spans or []), dict(self.names)
+        origin = min((span[1] for span in spans), default=0.0)
+        events = []
+        for key, name in names.items():
+            ids = [int(i) for i in key.split()]
+            if len(ids) == 1:
+                events.append({"name": "process_name", "ph": "M", "pid": ids[0], "args": {"name": name}})
+            else:
+                events.append({"name": "thread_name", "ph": "M", "pid": ids[0], "tid": ids[1], "args": {"name": name}})
+        for stage, start, duration, items, pid, tid in spans:
+            events.append({"name": stage, "cat": "wait" if "wait" in stage else "stage", "ph": "X",
+                           "ts": round((start - origin) * 1e6, 1), "dur": round(duration * 1e6, 1), "pid": pid,
+                           "tid": tid, "args": {"items": items}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def current_timer() -> StageTimer | None:
+    return _current_timer.get()
+
+
+def tracing() -> bool:
+    """
+    Whether the stages of the context are traced.
+    """
+    return bool((timer := _current_timer.get()) and timer.tracing)
+
+
+@contextmanager
+def use_timer(timer: StageTimer) -> Iterator[StageTimer]:
+    """
+    Record the stages timed in the context with the timer.
+    """
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def record(stage: str, duration: float, items: int = 1) -> None:
+    """
+    Add a duration of a stage that has just ended to the timer of the context, if there is one.
+    """
+    if timer := _current_timer.get():
+        timer.add(stage, duration, items)
+
+
+@contextmanager
+def stage(name: str, items: int = 1) -> Iterator[None]:
+    """
+    Time the code in the context as a stage.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(name, perf_counter() - start, items)
+
+
+def merge(timings: dict) -> None:
+    """
+    Add the timings of a task to the timer of the context, if there is one.
+    """
+    if timer := _current_timer.get():
+        timer.merge(timings)
+
+
+def timed_task(function: Callable, *args, trace: bool = False) -> tuple[Any, dict]:
+    """
+    Call a function with a new timer, e.g. in a worker process. The whole call is timed as a stage named after the
+    function.
+    :param trace: keep the spans of the stages.
+    :return: The result of the function and the timings recorded while it ran.
+    """
+    with use_timer(StageTimer(trace)) as timer, stage(function.__name__.replace("_", " ")):
+        result = function(*args)
+    return result, timer.export()
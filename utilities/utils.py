@@ -1,6 +1,14 @@
 import logging
+from collections.abc import Callable, Generator, Iterable, Iterator
 from configparser import ConfigParser
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+
+import utilities.timings as timings
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +33,35 @@ class Process:
         logger.debug(f"interrupt_process set to: {cls.interrupt_process}")
 
 
-class Config:
+class CancelToken:
+    """
+    Cancels a single job, other jobs keep running. Every job is cancelled when the process is stopped.
+    """
+
+    def __init__(self) -> None:
+        self._cancelled = Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or Process.interrupt_process
+
+
+# The config values of the job running in the current context, they are used instead of the config values in memory.
+_config_snapshot: ContextVar[dict | None] = ContextVar("config_snapshot", default=None)
+
+
+class ConfigType(type):
+    def __getattribute__(cls, name: str):
+        snapshot = _config_snapshot.get()
+        if snapshot is not None and name in snapshot:
+            return snapshot[name]
+        return super().__getattribute__(name)
+
+
+class Config(metaclass=ConfigType):
     # Config file location will always be the same regardless of which module starts the program.
     config_file = Path(__file__).parent.parent / "config.ini"
     config = ConfigParser()
@@ -36,7 +72,10 @@ class Config:
             "onnx_intra_threads", "ocr_rec_language", "text_similarity_threshold", "min_consecutive_sub_dur_ms",
             "max_consecutive_short_durs", "min_sub_duration_ms", "split_start", "split_stop", "no_of_frames",
             "sub_area_x_rel_padding", "sub_area_y_abs_padding", "use_search_area", "win_notify_sound",
-            "win_notify_loop_sound", "ocr_max_processes", "text_drop_score", "use_gpu", "line_break"]
+            "win_notify_loop_sound", "ocr_max_processes", "text_drop_score", "use_gpu", "line_break", "save_frames",
+            "frame_change_threshold", "text_edge_threshold", "frame_accurate_timing", "recognition_only",
+            "recognition_only_min_score", "ocr_cache_dir", "ocr_cache_max_entries", "keep_ocr_results",
+            "stream_subtitles", "scratch_dir", "concurrent_videos", "trace_extraction", "ocr_backend"]
 
     # Permanent values
     subarea_height_scaler = 0.75
@@ -48,6 +87,13 @@ class Config:
     # Default values
     default_frame_extraction_frequency = 2
     default_frame_extraction_batch_size = 250
+    default_save_frames = False
+    default_frame_change_threshold = 0.0
+    default_text_edge_threshold = 0.0
+    default_frame_accurate_timing = False
+    default_scratch_dir = "output"
+    default_concurrent_videos = 1
+    default_trace_extraction = False
 
     default_text_extraction_batch_size = 100
     default_onnx_intra_threads = 8
@@ -55,12 +101,19 @@ class Config:
     default_ocr_rec_language = "ch"
     default_text_drop_score = 0.7
     default_line_break = False
+    default_recognition_only = False
+    default_recognition_only_min_score = 0.9
+    default_ocr_cache_dir = "ocr_cache"
+    default_ocr_cache_max_entries = 100000
+    default_ocr_backend = "paddle"
 
     default_text_similarity_threshold = 0.85
     default_min_consecutive_sub_dur_ms = 500.0
     default_max_consecutive_short_durs = 4
     default_min_sub_duration_ms = 120.0
     default_use_gpu = True
+    default_keep_ocr_results = False
+    default_stream_subtitles = True
 
     default_split_start = 0.25
     default_split_stop = 0.5
@@ -73,11 +126,13 @@ class Config:
     default_win_notify_loop_sound = True
 
     # Initial values
-    frame_extraction_frequency = frame_extraction_batch_size = None
+    frame_extraction_frequency = frame_extraction_batch_size = save_frames = frame_change_threshold = None
+    text_edge_threshold = frame_accurate_timing = scratch_dir = concurrent_videos = trace_extraction = None
     text_extraction_batch_size = onnx_intra_threads = ocr_max_processes = ocr_rec_language = text_drop_score = None
     text_similarity_threshold = min_consecutive_sub_dur_ms = max_consecutive_short_durs = min_sub_duration_ms = use_gpu = None
     split_start = split_stop = no_of_frames = sub_area_x_rel_padding = sub_area_y_abs_padding = use_search_area = None
-    win_notify_sound = win_notify_loop_sound = line_break = None
+    win_notify_sound = win_notify_loop_sound = line_break = recognition_only = recognition_only_min_score = None
+    ocr_cache_dir = ocr_cache_max_entries = keep_ocr_results = stream_subtitles = ocr_backend = None
 
     def __init__(self) -> None:
         if not self.config_file.exists():
@@ -89,18 +144,32 @@ class Config:
         Creates a new config file with the default values.
         """
         self.config[self.sections[0]] = {self.keys[0]: str(self.default_frame_extraction_frequency),
-                                         self.keys[1]: self.default_frame_extraction_batch_size}
+                                         self.keys[1]: self.default_frame_extraction_batch_size,
+                                         self.keys[21]: self.default_save_frames,
+                                         self.keys[22]: self.default_frame_change_threshold,
+                                         self.keys[23]: self.default_text_edge_threshold,
+                                         self.keys[24]: self.default_frame_accurate_timing,
+                                         self.keys[31]: self.default_scratch_dir,
+                                         self.keys[32]: self.default_concurrent_videos,
+                                         self.keys[33]: self.default_trace_extraction}
         self.config[self.sections[1]] = {self.keys[2]: self.default_text_extraction_batch_size,
                                          self.keys[3]: self.default_onnx_intra_threads,
                                          self.keys[17]: self.default_ocr_max_processes,
                                          self.keys[4]: self.default_ocr_rec_language,
                                          self.keys[18]: self.default_text_drop_score,
-                                         self.keys[20]: self.default_line_break}
+                                         self.keys[20]: self.default_line_break,
+                                         self.keys[25]: self.default_recognition_only,
+                                         self.keys[26]: self.default_recognition_only_min_score,
+                                         self.keys[27]: self.default_ocr_cache_dir,
+                                         self.keys[28]: self.default_ocr_cache_max_entries,
+                                         self.keys[34]: self.default_ocr_backend}
         self.config[self.sections[2]] = {self.keys[5]: str(self.default_text_similarity_threshold),
                                          self.keys[6]: self.default_min_consecutive_sub_dur_ms,
                                          self.keys[7]: self.default_max_consecutive_short_durs,
                                          self.keys[8]: self.default_min_sub_duration_ms,
-                                         self.keys[19]: self.default_use_gpu}
+                                         self.keys[19]: self.default_use_gpu,
+                                         self.keys[29]: self.default_keep_ocr_results,
+                                         self.keys[30]: self.default_stream_subtitles}
         self.config[self.sections[3]] = {self.keys[9]: str(self.default_split_start),
                                          self.keys[10]: self.default_split_stop,
                                          self.keys[11]: self.default_no_of_frames,
@@ -119,6 +188,15 @@ class Config:
         """
         cls.frame_extraction_frequency = cls.config[cls.sections[0]].getint(cls.keys[0])
         cls.frame_extraction_batch_size = cls.config[cls.sections[0]].getint(cls.keys[1])
+        cls.save_frames = cls.config[cls.sections[0]].getboolean(cls.keys[21], cls.default_save_frames)
+        cls.frame_change_threshold = cls.config[cls.sections[0]].getfloat(cls.keys[22],
+                                                                          cls.default_frame_change_threshold)
+        cls.text_edge_threshold = cls.config[cls.sections[0]].getfloat(cls.keys[23], cls.default_text_edge_threshold)
+        cls.frame_accurate_timing = cls.config[cls.sections[0]].getboolean(cls.keys[24],
+                                                                           cls.default_frame_accurate_timing)
+        cls.scratch_dir = cls.config[cls.sections[0]].get(cls.keys[31], cls.default_scratch_dir)
+        cls.concurrent_videos = cls.config[cls.sections[0]].getint(cls.keys[32], cls.default_concurrent_videos)
+        cls.trace_extraction = cls.config[cls.sections[0]].getboolean(cls.keys[33], cls.default_trace_extraction)
 
         cls.text_extraction_batch_size = cls.config[cls.sections[1]].getint(cls.keys[2])
         cls.onnx_intra_threads = cls.config[cls.sections[1]].getint(cls.keys[3])
@@ -126,12 +204,21 @@ class Config:
         cls.ocr_rec_language = cls.config[cls.sections[1]][cls.keys[4]]
         cls.text_drop_score = cls.config[cls.sections[1]].getfloat(cls.keys[18])
         cls.line_break = cls.config[cls.sections[1]].getboolean(cls.keys[20])
+        cls.recognition_only = cls.config[cls.sections[1]].getboolean(cls.keys[25], cls.default_recognition_only)
+        cls.recognition_only_min_score = cls.config[cls.sections[1]].getfloat(cls.keys[26],
+                                                                              cls.default_recognition_only_min_score)
+        cls.ocr_cache_dir = cls.config[cls.sections[1]].get(cls.keys[27], cls.default_ocr_cache_dir)
+        cls.ocr_cache_max_entries = cls.config[cls.sections[1]].getint(cls.keys[28],
+                                                                       cls.default_ocr_cache_max_entries)
+        cls.ocr_backend = cls.config[cls.sections[1]].get(cls.keys[34], cls.default_ocr_backend)
 
         cls.text_similarity_threshold = cls.config[cls.sections[2]].getfloat(cls.keys[5])
         cls.min_consecutive_sub_dur_ms = cls.config[cls.sections[2]].getfloat(cls.keys[6])
         cls.max_consecutive_short_durs = cls.config[cls.sections[2]].getint(cls.keys[7])
         cls.min_sub_duration_ms = cls.config[cls.sections[2]].getfloat(cls.keys[8])
         cls.use_gpu = cls.config[cls.sections[2]].getboolean(cls.keys[19])
+        cls.keep_ocr_results = cls.config[cls.sections[2]].getboolean(cls.keys[29], cls.default_keep_ocr_results)
+        cls.stream_subtitles = cls.config[cls.sections[2]].getboolean(cls.keys[30], cls.default_stream_subtitles)
 
         cls.split_start = cls.config[cls.sections[3]].getfloat(cls.keys[9])
         cls.split_stop = cls.config[cls.sections[3]].getfloat(cls.keys[10])
@@ -143,6 +230,39 @@ class Config:
         cls.win_notify_sound = cls.config[cls.sections[4]][cls.keys[15]]
         cls.win_notify_loop_sound = cls.config[cls.sections[4]].getboolean(cls.keys[16])
 
+    @classmethod
+    def get_values(cls) -> dict:
+        """
+        Get the config values in memory, including the ocr options.
+        """
+        return {key: getattr(cls, key) for key in cls.keys} | {"ocr_opts": dict(cls.ocr_opts)}
+
+    @classmethod
+    def set_values(cls, values: dict) -> None:
+        """
+        Write config values into memory only. Used to give other processes the config values in memory.
+        Inside a snapshot only the values of the snapshot are changed.
+        """
+        if (snapshot := _config_snapshot.get()) is not None:
+            snapshot.update(values)
+            return
+        for key, value in values.items():
+            setattr(cls, key, value)
+
+    @classmethod
+    @contextmanager
+    def snapshot(cls, values: dict = None) -> Iterator[None]:
+        """
+        Use a copy of the config values in the current thread until the end of the with block, so a job is not
+        changed by the config changes of the gui or other jobs. Threads started by prefetch use the same copy.
+        :param values: config values that are changed in the copy.
+        """
+        token = _config_snapshot.set(cls.get_values() | (values or {}))
+        try:
+            yield
+        finally:
+            _config_snapshot.reset(token)
+
     @classmethod
     def set_config(cls, **kwargs: int | float | str | bool) -> None:
         """
@@ -155,6 +275,20 @@ class Config:
         cls.config[cls.sections[0]][cls.keys[0]] = str(cls.frame_extraction_frequency)
         cls.frame_extraction_batch_size = kwargs.get(cls.keys[1], cls.frame_extraction_batch_size)
         cls.config[cls.sections[0]][cls.keys[1]] = str(cls.frame_extraction_batch_size)
+        cls.save_frames = kwargs.get(cls.keys[21], cls.save_frames)
+        cls.config[cls.sections[0]][cls.keys[21]] = str(cls.save_frames)
+        cls.frame_change_threshold = kwargs.get(cls.keys[22], cls.frame_change_threshold)
+        cls.config[cls.sections[0]][cls.keys[22]] = str(cls.frame_change_threshold)
+        cls.text_edge_threshold = kwargs.get(cls.keys[23], cls.text_edge_threshold)
+        cls.config[cls.sections[0]][cls.keys[23]] = str(cls.text_edge_threshold)
+        cls.frame_accurate_timing = kwargs.get(cls.keys[24], cls.frame_accurate_timing)
+        cls.config[cls.sections[0]][cls.keys[24]] = str(cls.frame_accurate_timing)
+        cls.scratch_dir = kwargs.get(cls.keys[31], cls.scratch_dir)
+        cls.config[cls.sections[0]][cls.keys[31]] = cls.scratch_dir
+        cls.concurrent_videos = kwargs.get(cls.keys[32], cls.concurrent_videos)
+        cls.config[cls.sections[0]][cls.keys[32]] = str(cls.concurrent_videos)
+        cls.trace_extraction = kwargs.get(cls.keys[33], cls.trace_extraction)
+        cls.config[cls.sections[0]][cls.keys[33]] = str(cls.trace_extraction)
 
         cls.text_extraction_batch_size = kwargs.get(cls.keys[2], cls.text_extraction_batch_size)
         cls.config[cls.sections[1]][cls.keys[2]] = str(cls.text_extraction_batch_size)
@@ -168,6 +302,16 @@ class Config:
         cls.config[cls.sections[1]][cls.keys[18]] = str(cls.text_drop_score)
         cls.line_break = kwargs.get(cls.keys[20], cls.line_break)
         cls.config[cls.sections[1]][cls.keys[20]] = str(cls.line_break)
+        cls.recognition_only = kwargs.get(cls.keys[25], cls.recognition_only)
+        cls.config[cls.sections[1]][cls.keys[25]] = str(cls.recognition_only)
+        cls.recognition_only_min_score = kwargs.get(cls.keys[26], cls.recognition_only_min_score)
+        cls.config[cls.sections[1]][cls.keys[26]] = str(cls.recognition_only_min_score)
+        cls.ocr_cache_dir = kwargs.get(cls.keys[27], cls.ocr_cache_dir)
+        cls.config[cls.sections[1]][cls.keys[27]] = cls.ocr_cache_dir
+        cls.ocr_cache_max_entries = kwargs.get(cls.keys[28], cls.ocr_cache_max_entries)
+        cls.config[cls.sections[1]][cls.keys[28]] = str(cls.ocr_cache_max_entries)
+        cls.ocr_backend = kwargs.get(cls.keys[34], cls.ocr_backend)
+        cls.config[cls.sections[1]][cls.keys[34]] = cls.ocr_backend
 
         cls.text_similarity_threshold = kwargs.get(cls.keys[5], cls.text_similarity_threshold)
         cls.config[cls.sections[2]][cls.keys[5]] = str(cls.text_similarity_threshold)
@@ -179,6 +323,10 @@ class Config:
         cls.config[cls.sections[2]][cls.keys[8]] = str(cls.min_sub_duration_ms)
         cls.use_gpu = kwargs.get(cls.keys[19], cls.use_gpu)
         cls.config[cls.sections[2]][cls.keys[19]] = str(cls.use_gpu)
+        cls.keep_ocr_results = kwargs.get(cls.keys[29], cls.keep_ocr_results)
+        cls.config[cls.sections[2]][cls.keys[29]] = str(cls.keep_ocr_results)
+        cls.stream_subtitles = kwargs.get(cls.keys[30], cls.stream_subtitles)
+        cls.config[cls.sections[2]][cls.keys[30]] = str(cls.stream_subtitles)
 
         cls.split_start = kwargs.get(cls.keys[9], cls.split_start)
         cls.config[cls.sections[3]][cls.keys[9]] = str(cls.split_start)
@@ -227,6 +375,81 @@ def print_progress(iteration: int, total: int, prefix: str = '', suffix: str = '
         print()
 
 
+def prefetch(items: Iterable, max_items: int, producer: str, consumer: str, size: Callable = len) -> Iterator:
+    """
+    Produce the items of an iterable in a separate thread, while the items already produced are being consumed.
+    A bounded queue holds at most max items between the producer and the consumer. When the consumer stops early,
+    the producer stops too and a generator of the items is closed, so it releases what it holds.
+    The throughput of the producer and the time each side waited for the other is logged when done,
+    the side that waited less is the bottleneck.
+    :param items: the items from the producer.
+    :param max_items: the maximum number of items waiting for the consumer.
+    :param producer: name of the producer stage.
+    :param consumer: name of the consumer stage.
+    :param size: function giving the number of frames in an item, for the throughput.
+    """
+    queue, stop, done = Queue(max_items), Event(), object()
+    stats = {"frames": 0, "producer_wait": 0.0, "consumer_wait": 0.0}
+
+    def put(item) -> bool:
+        """
+        Put an item in the queue, unless the consumer stopped while the queue was full.
+        :return: True if the item was put in the queue.
+        """
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                wait_start = perf_counter()
+                item_put = put(item)
+                stats["producer_wait"] += (wait_time := perf_counter() - wait_start)
+                timings.record(f"{producer} queue wait", wait_time)
+                if not item_put:
+                    return
+            put(done)
+        except BaseException as error:  # The error is raised by the consumer.
+            put(error)
+        finally:
+            if isinstance(items, Generator):  # Run the clean up of a generator that was stopped, in its own thread.
+                items.close()
+
+    start = perf_counter()
+    # Use the config snapshot and the stage timer of the job.
+    Thread(target=copy_context().run, args=(produce,), name=producer, daemon=True).start()
+    try:
+        while True:
+            wait_start = perf_counter()
+            item = queue.get()
+            stats["consumer_wait"] += (wait_time := perf_counter() - wait_start)
+            timings.record(f"{consumer} queue wait", wait_time)
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            stats["frames"] += size(item)
+            yield item
+    finally:
+        stop.set()
+        while True:  # Unblock the producer.
+            try:
+                queue.get_nowait()
+            except Empty:
+                break
+
+    total_time = perf_counter() - start
+    busy_time = max(total_time - stats["producer_wait"], 1e-9)
+    logger.info(f"{producer} throughput: {stats['frames'] / busy_time:,.1f} frames/s, Total time: {total_time:.1f}s, "
+                f"{producer} waited for {consumer}: {stats['producer_wait']:.1f}s, "
+                f"{consumer} waited for {producer}: {stats['consumer_wait']:.1f}s")
+
+
 if __name__ == '__main__':
     pass
 else:
@@ -1,74 +1,226 @@
 import logging
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
+from threading import Lock
+from time import perf_counter
 
 import cv2 as cv
+import numpy as np
 
+import utilities.timings as timings
 import utilities.utils as utils
 
 logger = logging.getLogger(__name__)
 
+# The frame extraction pool is shared by every job, the batches of several videos are extracted by the same processes.
+_frame_pool: ProcessPoolExecutor | None = None
+_frame_pool_lock = Lock()
 
-def extract_frames(video_path: str, frames_dir: Path, key_area: tuple | None, start: int, end: int, every: int) -> None:
+
+def frame_signature(image: np.ndarray) -> np.ndarray:
+    """
+    Create a small grayscale version of an image that is used to compare frames.
+    """
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return cv.resize(gray, None, fx=0.5, fy=0.5, interpolation=cv.INTER_AREA)
+
+
+def changed_pixel_ratio(signature1: np.ndarray, signature2: np.ndarray) -> float:
+    """
+    The ratio of pixels that are visibly different between two frame signatures.
+    Small differences from video compression are ignored, so only changes like new text are counted.
+    """
+    return np.count_nonzero(cv.absdiff(signature1, signature2) > 32) / signature1.size
+
+
+def text_edge_ratio(image: np.ndarray) -> float:
+    """
+    The ratio of pixels on strong edges in an image.
+    Subtitles are drawn with sharp high contrast edges, an image with very few strong edges can not contain subtitles.
+    """
+    gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    gradient = cv.morphologyEx(gray, cv.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    return np.count_nonzero(gradient > 100) / gradient.size
+
+
+def extract_frames(video_path: str, frames_dir: Path | None, key_area: tuple | None, start: int, end: int,
+                   every: int, change_threshold: float = 0.0,
+                   text_edge_threshold: float = 0.0) -> list[tuple[float, np.ndarray | None]]:
     """
     Extract frames from a video using OpenCVs VideoCapture.
+    Frames that are unchanged from the previous kept frame share the image of the kept frame,
+    this lets the text of the kept frame be reused without running ocr again.
+    Frames that can not contain text have no image, so no ocr is run for them.
     :param video_path: Path of the video.
-    :param frames_dir: The directory to save the frames.
+    :param frames_dir: The directory to save the frames. Frames are only written to disk when a directory is given.
     :param key_area: Coordinates of the frame containing subtitle.
     :param start: Start frame.
     :param end: End frame.
     :param every: Frame spacing.
+    :param change_threshold: Frames with a changed pixel ratio at or below this value are unchanged. 0 disables it.
+    :param text_edge_threshold: Frames with a text edge ratio below this value have no text. 0 disables it.
+    :return: The position of each extracted frame in milliseconds and its image.
     """
+    # The stages are timed by the timer of the task, a throwaway timer is used when no timer is in the context.
+    timer = timings.current_timer() or timings.StageTimer()
+    stage_start = perf_counter()
     capture = cv.VideoCapture(video_path)  # open the video using OpenCV
+    timer.add("video open", perf_counter() - stage_start)
 
     if start < 0:  # if start isn't specified lets assume 0
         start = 0
     if end < 0:  # if end isn't specified assume the end of the video
         end = int(capture.get(cv.CAP_PROP_FRAME_COUNT))
 
+    stage_start = perf_counter()
     capture.set(1, start)  # set the starting frame of the capture
+    timer.add("seek", perf_counter() - stage_start)
     frame = start  # keep track of which frame we are up to, starting from start
     while_safety = 0  # a safety counter to ensure we don't enter an infinite while loop (hopefully we won't need it)
+    frames, kept_image, kept_signature = [], None, None
+    decode_time = 0.0  # The time spent decoding the frames since the last extracted frame.
 
     while frame < end:  # let's loop through the frames until the end
-        _, image = capture.read()  # read an image from the capture
-
         if while_safety > 500:  # break the while if our safety max's out at 500
             break
 
-        # sometimes OpenCV reads Nones during a video, in which case we want to just skip
-        if image is None:  # if we get a bad return flag or the image we read is None, lets not save
+        # advance to the next frame, the frame is only converted to an image when it will be kept
+        stage_start = perf_counter()
+        grabbed = capture.grab()
+        decode_time += perf_counter() - stage_start
+        if not grabbed:  # if we get a bad return flag, lets skip
             while_safety += 1  # add 1 to our while safety, since we skip before incrementing our frame variable
             continue  # skip
 
-        if frame % every == 0:  # if this is a frame we want to write out based on the 'every' argument
+        if frame % every == 0:  # if this is a frame we want to keep based on the 'every' argument
+            stage_start = perf_counter()
+            _, image = capture.retrieve()  # retrieve the image of the grabbed frame
+            decode_time += perf_counter() - stage_start
+
+            # sometimes OpenCV reads Nones during a video, in which case we want to just skip
+            if image is None:
+                while_safety += 1
+                continue
+
             while_safety = 0  # reset the safety count
-            # crop and save key area
+            timer.add("decode", decode_time)
+            decode_time = 0.0
+            # crop key area, the crop is copied so the full image is not held in memory
             if key_area:
+                stage_start = perf_counter()
                 x1, y1, x2, y2 = key_area
-                image = image[y1:y2, x1:x2]
+                image = image[y1:y2, x1:x2].copy()
+                timer.add("crop", perf_counter() - stage_start)
             frame_position = capture.get(cv.CAP_PROP_POS_MSEC)
-            save_name = f"{frames_dir}/{frame_position}.jpg"  # create the save path
-            cv.imwrite(save_name, image)  # save the extracted image
+            if frames_dir:  # only save the extracted image when a directory is given
+                stage_start = perf_counter()
+                cv.imwrite(f"{frames_dir}/{frame_position}.jpg", image)
+                timer.add("frame encode/write", perf_counter() - stage_start)
+            stage_start = perf_counter()
+            changed = True
+            if change_threshold:  # compare the frame with the previous kept frame
+                signature = frame_signature(image)
+                changed = kept_signature is None or changed_pixel_ratio(kept_signature, signature) > change_threshold
+                if changed:
+                    kept_signature = signature
+            if changed:  # only keep the image if the frame could contain text
+                has_text = not text_edge_threshold or text_edge_ratio(image) >= text_edge_threshold
+                kept_image = image if has_text else None
+            timer.add("frame change/text check", perf_counter() - stage_start)
+            frames.append((frame_position, kept_image))
 
         frame += 1  # increment our frame count
     capture.release()  # after the while has finished close the capture
+    return frames
 
 
-def video_to_frames(video_path: str, frames_dir: Path, key_area: tuple | None, start_frame: int = None,
-                    stop_frame: int = None) -> None:
+def frame_pool() -> ProcessPoolExecutor:
+    """
+    The process pool for frame extraction, with a process for each cpu core. It is started once and reused for every
+    video, jobs running at the same time submit their batches to the same pool.
+    """
+    global _frame_pool
+    with _frame_pool_lock:
+        if _frame_pool is None:
+            _frame_pool = ProcessPoolExecutor(os.cpu_count() or 1)
+        return _frame_pool
+
+
+def warm_frame_pool() -> None:
+    """
+    Start the processes of the frame extraction pool, so the next video does not wait for them to start.
+    """
+    executor = frame_pool()
+    futures = [executor.submit(os.getpid) for _ in range(os.cpu_count() or 1)]
+    logger.info(f"Frame extraction processes started: {len({future.result() for future in futures})}")
+
+
+def shutdown_frame_pool() -> None:
+    """
+    Stop the processes of the frame extraction pool.
+    """
+    global _frame_pool
+    with _frame_pool_lock:
+        if _frame_pool is not None:
+            _frame_pool.shutdown()
+            _frame_pool = None
+
+
+def sampled_frame_total(start: int, end: int, every: int) -> int:
+    """
+    The number of frames that will be extracted between the start and end frame with the given frame spacing.
+    """
+    return len(range(start + -start % every, end, every))
+
+
+def split_frames(start_frame: int, stop_frame: int, frame_count: int) -> list[list[int]]:
+    """
+    Split the frames between the start and stop frame into the batches that are extracted by each process.
+    :param frame_count: the total frame count of the video.
+    :return: The start and end frame of each batch.
+    """
+    batch_size = utils.Config.frame_extraction_batch_size
+    # ignore batch size if it's greater than frame count
+    batch_size = batch_size if frame_count > batch_size else frame_count - 1
+    frame_batches = [[i, i + batch_size] for i in range(start_frame, stop_frame, batch_size)]
+    if frame_batches:
+        frame_batches[-1][-1] = stop_frame  # make sure last batch has correct end frame
+    return frame_batches
+
+
+def batch_frames(future: Future) -> list:
+    """
+    Wait for the result of a timed frame extraction task, its timings are added to the timer of the context.
+    """
+    with timings.stage("frame batch wait"):
+        result, task_timings = future.result()
+    timings.merge(task_timings)
+    return result
+
+
+def video_to_frames(video_path: str, frames_dir: Path | None, key_area: tuple | None, start_frame: int = None,
+                    stop_frame: int = None,
+                    cancel_token: utils.CancelToken = None) -> Iterator[list[tuple[float, np.ndarray | None]]]:
     """
     Extracts the frames from a video using multiprocessing.
+    The frames of each batch are yielded in order, as soon as the batch and the batches before it are done.
+    The number of batches being worked on is limited so that the frames held in memory do not grow with the length
+    of the video.
     :param video_path: path like string to the video
-    :param frames_dir: directory to save the frames
+    :param frames_dir: directory to save the frames, frames are only saved if it is given
     :param key_area: coordinates of the frame containing subtitle
     :param start_frame: The frame where image extractions from video starts.
     :param stop_frame: The frame where image extractions from video stops.
+    :param cancel_token: cancellation of the job, no more batches are started when the job is cancelled.
     """
     every = utils.Config.frame_extraction_frequency  # extract every this many frames.
-    batch_size = utils.Config.frame_extraction_batch_size
+    change_threshold, text_edge_threshold = utils.Config.frame_change_threshold, utils.Config.text_edge_threshold
     prefix = "Frame Extraction"
-    if utils.Process.interrupt_process:  # cancel if process has been cancelled by gui.
+    cancel_token = cancel_token or utils.CancelToken()
+    if cancel_token.cancelled:  # cancel if process has been cancelled by gui.
         logger.warning(f"{prefix} process interrupted!")
         return
 
@@ -76,24 +228,77 @@ def video_to_frames(video_path: str, frames_dir: Path, key_area: tuple | None, s
     frame_count = int(capture.get(cv.CAP_PROP_FRAME_COUNT))  # get its total frame count
     capture.release()  # release the capture straight away
 
-    # ignore batch size if it's greater than frame count
-    batch_size = batch_size if frame_count > batch_size else frame_count - 1
-
     if frame_count < 1:  # if video has no frames, might be and opencv error
         logger.error("Video has no frames. Check your OpenCV installation")
         return  # end function call
 
     start_frame, stop_frame = start_frame or 0, stop_frame or frame_count
-    # split the frames into batches
-    frame_batches = [[i, i + batch_size] for i in range(start_frame, stop_frame, batch_size)]
-    frame_batches[-1][-1] = stop_frame  # make sure last batch has correct end frame
-    no_batches = len(frame_batches)
-    # create a process pool to execute across multiple cpu cores to speed up processing
+    frame_batches = split_frames(start_frame, stop_frame, frame_count)
+    max_workers = os.cpu_count() or 1
+    # use the shared process pool to execute across multiple cpu cores to speed up processing
     logger.info(f"Starting Multiprocess {prefix} from video...")
-    with ProcessPoolExecutor() as executor:
-        futures = [executor.submit(extract_frames, video_path, frames_dir, key_area, f[0], f[1], every)
-                   for f in frame_batches]  # submit the processes: extract_frames(...)
-        for i, f in enumerate(as_completed(futures)):  # as each process completes
-            f.result()  # Prevents silent bugs. Exceptions raised will now be displayed.
-            utils.print_progress(i, no_batches - 1, prefix)
+    executor, futures, trace = frame_pool(), deque(), timings.tracing()
+    try:
+        for f in frame_batches:
+            if cancel_token.cancelled:
+                logger.warning(f"{prefix} process interrupted!")
+                break
+            futures.append(executor.submit(timings.timed_task, extract_frames, video_path, frames_dir, key_area, f[0],
+                                           f[1], every, change_threshold, text_edge_threshold, trace=trace))
+            if len(futures) >= max_workers:  # wait for the oldest batch to finish before submitting more
+                yield batch_frames(futures.popleft())  # Prevents silent bugs. Exceptions raised will now be displayed.
+        while futures:  # the remaining batches in order
+            yield batch_frames(futures.popleft())
+    finally:
+        for future in futures:  # the batches of a stopped job are not left in the shared pool
+            future.cancel()
     logger.info(f"{prefix} done!")
+
+
+def extract_frame_ranges(video_path: str, key_area: tuple | None, frame_ranges: list,
+                         text_edge_threshold: float) -> list[list[tuple[float, np.ndarray | None]]]:
+    """
+    Extract every frame in each of the frame ranges.
+    :param video_path: Path of the video.
+    :param key_area: Coordinates of the frame containing subtitle.
+    :param frame_ranges: The start and end frame of each range.
+    :param text_edge_threshold: Frames with a text edge ratio below this value have no text. 0 disables it.
+    :return: The frames of each range.
+    """
+    return [extract_frames(video_path, None, key_area, start, end, 1, text_edge_threshold=text_edge_threshold)
+            for start, end in frame_ranges]
+
+
+def frame_ranges_to_frames(video_path: str, key_area: tuple | None, frame_ranges: list,
+                           cancel_token: utils.CancelToken = None
+                           ) -> Iterator[tuple[tuple, list[tuple[float, np.ndarray | None]]]]:
+    """
+    Extracts every frame in the frame ranges using multiprocessing.
+    Each range and its frames are yielded as soon as the batch with the range is done.
+    :param video_path: path like string to the video
+    :param key_area: coordinates of the frame containing subtitle
+    :param frame_ranges: the start and end frame of each range
+    :param cancel_token: cancellation of the job, no more batches are started when the job is cancelled.
+    """
+    cancel_token = cancel_token or utils.CancelToken()
+    # The ranges are batched so that each batch has about as many frames as the frame extraction batch size.
+    batch_size = max(1, utils.Config.frame_extraction_batch_size // utils.Config.frame_extraction_frequency)
+    text_edge_threshold = utils.Config.text_edge_threshold
+    range_batches = [frame_ranges[i:i + batch_size] for i in range(0, len(frame_ranges), batch_size)]
+    max_workers = os.cpu_count() or 1
+    executor, futures, trace = frame_pool(), {}, timings.tracing()
+    try:
+        for range_batch in range_batches:
+            if cancel_token.cancelled:
+                break
+            future = executor.submit(timings.timed_task, extract_frame_ranges, video_path, key_area, range_batch,
+                                     text_edge_threshold, trace=trace)
+            futures[future] = range_batch
+            if len(futures) >= max_workers:  # wait for a batch to finish before submitting more
+                for future in wait(futures, return_when=FIRST_COMPLETED).done:
+                    yield from zip(futures.pop(future), batch_frames(future))
+        for future in as_completed(list(futures)):  # as each remaining process completes
+            yield from zip(futures.pop(future), batch_frames(future))
+    finally:
+        for future in futures:  # the batches of a stopped job are not left in the shared pool
+            future.cancel()